@@ -0,0 +1,164 @@
+"""Admission control of submissions based on the depth of the broker's queues."""
+
+import asyncio
+import logging
+import math
+from threading import Lock
+from time import monotonic, time
+from typing import Optional
+
+from bigchem.app import bigchem as bigchem_app
+from fastapi import HTTPException
+from fastapi import status as status_codes
+from fastapi.concurrency import run_in_threadpool
+
+from chemcloud_server.models import QueueStats
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for workers to report the queues they consume
+INSPECT_TIMEOUT = 1.0
+
+
+def get_queue_depths(queues: list[str]) -> dict[str, int]:
+    """Number of messages waiting in each queue; 0 for queues not declared yet."""
+    depths = {}
+    with bigchem_app.connection_for_read() as conn:
+        for queue in queues:
+            channel = conn.channel()
+            try:
+                depths[queue] = channel.queue_declare(
+                    queue=queue, passive=True
+                ).message_count
+            except conn.channel_errors:  # Queue does not exist
+                depths[queue] = 0
+            finally:
+                channel.close()
+    return depths
+
+
+def get_queue_consumers() -> dict[str, int]:
+    """Number of workers consuming from each queue that has any"""
+    active_queues = (
+        bigchem_app.control.inspect(timeout=INSPECT_TIMEOUT).active_queues() or {}
+    )
+    consumers: dict[str, int] = {}
+    for worker_queues in active_queues.values():
+        for queue in worker_queues:
+            consumers[queue["name"]] = consumers.get(queue["name"], 0) + 1
+    return consumers
+
+
+class QueueMonitor:
+    """Cached view of queue depths and consumers that admits or rejects submissions.
+
+    Requests only read the cached QueueStats; refresh() (run periodically by
+    run_queue_monitor) queries the broker and workers. Besides the default queue,
+    queues are watched once a submission to them was accepted (see watch()), so the
+    first submission to a queue is always admitted and names clients merely ask for
+    cost nothing. Queues without accepted submissions for watch_seconds are no longer
+    watched, and at most max_watched are, dropping the least recently used.
+
+    Args:
+        max_depth: Depth above which submissions to a queue are rejected. 0 admits
+            everything.
+        task_seconds: Typical seconds a worker spends per task, for Retry-After.
+        default_queue: Queue of submissions that do not name one.
+        max_watched: Most queues watched besides the default queue.
+        watch_seconds: Seconds a queue stays watched after its last accepted
+            submission.
+    """
+
+    def __init__(
+        self,
+        max_depth: int,
+        task_seconds: float,
+        default_queue: str,
+        max_watched: int = 100,
+        watch_seconds: float = 3600.0,
+    ):
+        self.max_depth = max_depth
+        self.task_seconds = task_seconds
+        self.default_queue = default_queue
+        self.max_watched = max_watched
+        self.watch_seconds = watch_seconds
+        self.stats: dict[str, QueueStats] = {}
+        # Watched queues besides the default one, by time of their last accepted
+        # submission, least recent first
+        self._watched: dict[str, float] = {}
+        self._lock = Lock()
+
+    def watch(self, queue: Optional[str] = None) -> None:
+        """Watch queue after a submission to it was accepted."""
+        if not self.max_depth or queue is None or queue == self.default_queue:
+            return
+        with self._lock:
+            self._watched.pop(queue, None)  # Move to the end
+            self._watched[queue] = monotonic()
+            while len(self._watched) > self.max_watched:
+                del self._watched[next(iter(self._watched))]
+
+    def refresh(self) -> None:
+        """Query the depth and consumers of all watched queues."""
+        with self._lock:
+            oldest = monotonic() - self.watch_seconds
+            for queue in [q for q, last in self._watched.items() if last < oldest]:
+                del self._watched[queue]
+            queues = [self.default_queue, *sorted(self._watched)]
+        depths = get_queue_depths(queues)
+        consumers = get_queue_consumers()
+        updated_at = time()
+        self.stats = {
+            queue: QueueStats(
+                depth=depths[queue],
+                n_consumers=consumers.get(queue, 0),
+                updated_at=updated_at,
+            )
+            for queue in queues
+        }
+
+    def admit(self, queue: Optional[str] = None) -> None:
+        """Admit a submission to queue or reject it.
+
+        Raises:
+            HTTPException(429) if the queue is deeper than max_depth, with Retry-After
+                set to the estimated time for its workers to drain the excess.
+            HTTPException(503) if the queue is deeper than max_depth and no worker
+                consumes it.
+        """
+        if not self.max_depth:
+            return
+        queue = queue or self.default_queue
+        stats = self.stats.get(queue)
+        if stats is None or stats.depth <= self.max_depth:
+            return
+
+        if not stats.n_consumers:
+            raise HTTPException(
+                status_code=status_codes.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=(
+                    f"Queue '{queue}' has {stats.depth} waiting tasks and no workers. "
+                    "Try again later."
+                ),
+                headers={"Retry-After": str(math.ceil(self.task_seconds))},
+            )
+        excess = stats.depth - self.max_depth
+        retry_after = math.ceil(excess * self.task_seconds / stats.n_consumers)
+        raise HTTPException(
+            status_code=status_codes.HTTP_429_TOO_MANY_REQUESTS,
+            detail=(
+                f"Queue '{queue}' has {stats.depth} waiting tasks. Try again in "
+                f"{retry_after} seconds."
+            ),
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+async def run_queue_monitor(monitor: QueueMonitor, interval: float) -> None:
+    """Refresh monitor every interval seconds."""
+    while True:
+        try:
+            await run_in_threadpool(monitor.refresh)
+        except Exception:  # Keep the last stats while the broker is unavailable
+            logger.exception("Refreshing queue stats failed")
+        await asyncio.sleep(interval)
@@ -0,0 +1,197 @@
+"""Parallel algorithms built from BigChem tasks and the tasks in chemcloud_server.tasks.
+
+Mirrors bigchem.algos, adding algorithms BigChem does not provide and passing
+qcop.compute keyword arguments through to every calculation.
+"""
+
+from typing import Any, Optional
+
+import numpy as np
+from bigchem.canvas import Signature, group
+from bigchem.config import settings as bigchem_settings
+from bigchem.tasks import assemble_hessian, compute, frequency_analysis
+from bigchem.utils import _gradient_inputs
+from qcio import CalcType, ProgramInput
+from qcop.adapters import registry
+
+from chemcloud_server.tasks import assemble_gradient, seed_displacements
+
+# qcop.compute kwargs for displacement calculations when only the reduced result is
+# collected
+REDUCED_ONLY_KWARGS = {
+    "collect_stdout": False,
+    "collect_files": False,
+    "collect_wfn": False,
+}
+
+
+def _energy_inputs(prog_input: ProgramInput, dh: float) -> list[ProgramInput]:
+    """Create ProgramInput energy calculations for a numerical gradient
+
+    Returns:
+        Flat list of energy calculations displaced by dh along each coordinate,
+            alternating "forward" and "backward" steps like
+            bigchem.utils._gradient_inputs.
+    """
+    as_dict = prog_input.model_dump()
+    as_dict["calctype"] = CalcType.energy
+    energy_input = ProgramInput(**as_dict)
+
+    energies = []
+    for index in np.ndindex(energy_input.structure.geometry.shape):
+        forward = energy_input.model_copy(deep=True)
+        backward = energy_input.model_copy(deep=True)
+        forward.structure.geometry[index] += dh
+        backward.structure.geometry[index] -= dh
+        energies.extend((forward, backward))
+    return energies
+
+
+def _finite_difference(
+    program: str,
+    displacements: list[ProgramInput],
+    prog_input: ProgramInput,
+    reduction: Signature,
+    compute_kwargs: Optional[dict[str, Any]] = None,
+    reduced_only: bool = False,
+) -> Signature:
+    """Compute displacements and an energy of the original geometry, then reduce them.
+
+    Params:
+        program: Compute engine to use for all calculations
+        displacements: Displaced calculations, in the order reduction expects them
+        prog_input: ProgramInput of the original geometry
+        reduction: Signature receiving the list of displacement outputs followed by the
+            energy output of the original geometry
+        compute_kwargs: Keyword arguments for qcop.compute. propagate_wfn seeds every
+            displacement with the wavefunction of the original geometry, which is then
+            computed before the displacements instead of alongside them. Ignored for
+            programs whose adapter cannot propagate wavefunctions.
+        reduced_only: Collect stdout, files and wavefunctions only for the energy of
+            the original geometry, which the reduced result is built from.
+    """
+    kwargs = dict(compute_kwargs or {})
+    propagate_wfn = kwargs.pop("propagate_wfn", False)
+    displacement_kwargs = {**kwargs, **REDUCED_ONLY_KWARGS} if reduced_only else kwargs
+
+    as_dict = prog_input.model_dump()
+    as_dict["calctype"] = CalcType.energy
+    energy_input = ProgramInput(**as_dict)
+
+    if propagate_wfn and hasattr(registry.get(program), "propagate_wfn"):
+        # | is chain operator in celery
+        return compute.s(
+            program, energy_input, **{**kwargs, "collect_wfn": True}
+        ) | seed_displacements.s(
+            program,
+            displacements,
+            reduction,
+            displacement_kwargs,
+            keep_wfn=kwargs.get("collect_wfn", False),
+        )
+    return (
+        group(
+            [
+                *(
+                    compute.s(program, inp, **displacement_kwargs)
+                    for inp in displacements
+                ),
+                compute.s(program, energy_input, **kwargs),
+            ]
+        )
+        | reduction
+    )
+
+
+def parallel_gradient(
+    program: str,
+    prog_input: ProgramInput,
+    dh: float = bigchem_settings.bigchem_default_hessian_dh,
+    compute_kwargs: Optional[dict[str, Any]] = None,
+    reduced_only: bool = False,
+) -> Signature:
+    """Create parallel numerical gradient signature
+
+    Params:
+        program: Compute engine to use for energy calculations
+        prog_input: ProgramInput with calctype=gradient
+        dh: Displacement for central finite difference computation
+        compute_kwargs: Keyword arguments for qcop.compute; see _finite_difference
+        reduced_only: Collect stdout and files only for the reduced result
+
+    Note: Creates a Celery Chord where the 6N displaced energies are computed in
+        parallel, then the list of energies is passed to the assemble_gradient task on
+        a worker. The last computation in the group is an energy calculation of the
+        original geometry used to create the final ProgramOutput for the gradient.
+    """
+    assert prog_input.calctype == CalcType.gradient, (
+        f"calctype should be '{CalcType.gradient}', got '{prog_input.calctype}'"
+    )
+
+    return _finite_difference(
+        program,
+        _energy_inputs(prog_input, dh),
+        prog_input,
+        assemble_gradient.s(dh),
+        compute_kwargs,
+        reduced_only,
+    )
+
+
+def parallel_hessian(
+    program: str,
+    prog_input: ProgramInput,
+    dh: float = bigchem_settings.bigchem_default_hessian_dh,
+    compute_kwargs: Optional[dict[str, Any]] = None,
+    reduced_only: bool = False,
+) -> Signature:
+    """bigchem.algos.parallel_hessian passing compute_kwargs to every calculation
+
+    Params:
+        program: Compute engine to use for gradient calculations
+        prog_input: ProgramInput with calctype=hessian
+        dh: Displacement for finite difference computation
+        compute_kwargs: Keyword arguments for qcop.compute; see _finite_difference
+        reduced_only: Collect stdout and files only for the reduced result
+    """
+    assert prog_input.calctype == CalcType.hessian, (
+        f"calctype should be '{CalcType.hessian}', got '{prog_input.calctype}'"
+    )
+
+    return _finite_difference(
+        program,
+        _gradient_inputs(prog_input, dh),
+        prog_input,
+        assemble_hessian.s(dh),
+        compute_kwargs,
+        reduced_only,
+    )
+
+
+def parallel_frequency_analysis(
+    program: str,
+    prog_input: ProgramInput,
+    dh: float = bigchem_settings.bigchem_default_hessian_dh,
+    compute_kwargs: Optional[dict[str, Any]] = None,
+    reduced_only: bool = False,
+    **kwargs,
+) -> Signature:
+    """bigchem.algos.parallel_frequency_analysis passing compute_kwargs to every
+    calculation
+
+    Params:
+        program: Program to use for gradient calculations to generate hessian
+        prog_input: ProgramInput object.
+        dh: Displacement for finite difference computation of hessian
+        compute_kwargs: Keyword arguments for qcop.compute; see _finite_difference
+        reduced_only: Collect stdout and files only for the reduced result
+        kwargs: Keywords passed to geomeTRIC's frequency_analysis function
+    """
+    hessian_inp = prog_input.model_dump()
+    # So parallel_hessian doesn't raise error
+    hessian_inp["calctype"] = CalcType.hessian
+    hessian_sig = parallel_hessian(
+        program, ProgramInput(**hessian_inp), dh, compute_kwargs, reduced_only
+    )
+    # | is celery chain operator
+    return hessian_sig | frequency_analysis.s(**kwargs)
@@ -1,5 +1,6 @@
 from typing import Any
 
+import logfire
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.security.oauth2 import SecurityScopes
@@ -7,7 +8,7 @@ from jose import jwt
 
 from chemcloud_server import config
 
-from .config import get_settings
+from .config import get_jwks, get_settings
 
 oauth2_password_scheme = OAuth2PasswordBearer(
     tokenUrl="/api/v2/oauth/token",
@@ -17,6 +18,7 @@ oauth2_password_scheme = OAuth2PasswordBearer(
             "Perform computations and retrieve results computed on private ChemCloud "
             "Connect instances."
         ),
+        "usage:read": "Read the usage of all users and programs.",
     },
 )
 
@@ -69,6 +71,7 @@ async def bearer_auth(
     security_scopes: SecurityScopes,
     token: str = Depends(oauth2_password_scheme),
     settings: config.Settings = Depends(get_settings),
+    jwks: list[dict[str, str]] = Depends(get_jwks),
 ) -> dict[str, Any]:
     """Validates access token"""
     # Determine WWW-Authenticate header value
@@ -84,9 +87,23 @@ async def bearer_auth(
         headers={"WWW-Authenticate": authenticate_value},
     )
 
+    with logfire.span("validate token"):
+        return _validate_token(
+            token, jwks, settings, security_scopes, credentials_exception
+        )
+
+
+def _validate_token(
+    token: str,
+    jwks: list[dict[str, str]],
+    settings: config.Settings,
+    security_scopes: SecurityScopes,
+    credentials_exception: HTTPException,
+) -> dict[str, Any]:
+    """Verify the signature and claims of token; return its payload"""
     # Find correct key to verify signature
     try:
-        rsa_key = _get_matching_rsa_key(token, settings.jwks)
+        rsa_key = _get_matching_rsa_key(token, jwks)
 
     except jwt.JWTError:
         credentials_exception.detail = "Invalid token"
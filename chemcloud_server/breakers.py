@@ -0,0 +1,172 @@
+"""Circuit breakers that fail requests fast while the broker or backend is down."""
+
+import math
+from contextlib import contextmanager
+from threading import Lock
+from time import monotonic
+from typing import AsyncIterator, Iterator
+
+from bigchem.app import bigchem as bigchem_app
+from fastapi import HTTPException
+from fastapi import status as status_codes
+from kombu.exceptions import OperationalError
+
+from chemcloud_server.config import get_settings, keep_results_for_result_ttl
+
+settings = get_settings()
+
+
+class CircuitBreaker:
+    """Stop calling a dependency after repeated connection failures.
+
+    The breaker opens after failure_threshold consecutive calls fail with one of
+    errors. While open, guarded calls fail immediately with 503. After reset_timeout
+    one trial call is let through; the breaker closes if it succeeds and opens again
+    if it fails. Exceptions other than errors mean the dependency responded and count
+    as successes.
+
+    Args:
+        name: Name of the dependency, for error messages.
+        errors: Exceptions that indicate the dependency is unavailable.
+        failure_threshold: Consecutive failures that open the breaker.
+        reset_timeout: Seconds the breaker stays open before a trial call.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        errors: tuple[type[BaseException], ...],
+        failure_threshold: int,
+        reset_timeout: float,
+    ):
+        self.name = name
+        self.errors = errors
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.n_failures = 0
+        self.opened_at: float | None = None
+        self._trial_running = False
+        self._lock = Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def _unavailable(self, retry_after: float) -> HTTPException:
+        return HTTPException(
+            status_code=status_codes.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"The {self.name} is unavailable. Try again later.",
+            headers={"Retry-After": str(max(math.ceil(retry_after), 1))},
+        )
+
+    def before_call(self) -> None:
+        """Raise HTTPException(503) unless a call may be made now."""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + self.reset_timeout - monotonic()
+            if remaining > 0 or self._trial_running:
+                raise self._unavailable(remaining)
+            self._trial_running = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.n_failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def reset(self) -> None:
+        """Close the breaker and forget past failures."""
+        self.record_success()
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.n_failures += 1
+            if self._trial_running or self.n_failures >= self.failure_threshold:
+                self.opened_at = monotonic()
+            self._trial_running = False
+
+    @contextmanager
+    def guard(self) -> Iterator[None]:
+        """Fail fast while open; record the outcome of the guarded block.
+
+        Raises:
+            HTTPException(503) while the breaker is open or if the block fails with
+                one of errors.
+        """
+        self.before_call()
+        try:
+            yield
+        except self.errors:
+            self.record_failure()
+            raise self._unavailable(self.reset_timeout)
+        except BaseException:
+            self.record_success()
+            raise
+        self.record_success()
+
+
+def configure_deadlines(timeout: float) -> None:
+    """Bound broker and backend operations of the BigChem app to about timeout seconds.
+
+    Library defaults retry connections for tens of seconds, blocking the server's
+    event loop meanwhile.
+    """
+    conf = bigchem_app.conf
+    if conf.broker_url.startswith("redis"):
+        broker_timeouts = {"socket_timeout": timeout, "socket_connect_timeout": timeout}
+    else:  # pyamqp
+        broker_timeouts = {"read_timeout": timeout, "write_timeout": timeout}
+    conf.update(
+        broker_connection_timeout=timeout,
+        broker_transport_options={**conf.broker_transport_options, **broker_timeouts},
+        task_publish_retry_policy={"max_retries": 1, "interval_start": 0},
+        redis_socket_timeout=timeout,
+        redis_socket_connect_timeout=timeout,
+        result_backend_transport_options={
+            **conf.result_backend_transport_options,
+            "retry_policy": {"max_retries": 1},
+        },
+    )
+
+
+# Before the backend is created below; it reads its timeouts and expiry when created
+configure_deadlines(settings.dependency_timeout)
+if settings.chemcloud_worker_tasks:
+    # Results the server writes, e.g., REVOKED states, live as long as the workers'
+    keep_results_for_result_ttl(bigchem_app.conf)
+
+with bigchem_app.connection_for_write() as conn:
+    broker_errors = (OperationalError, *conn.connection_errors)
+
+broker_breaker = CircuitBreaker(
+    "broker",
+    broker_errors,
+    settings.breaker_failure_threshold,
+    settings.breaker_reset_timeout,
+)
+backend_breaker = CircuitBreaker(
+    "result backend",
+    bigchem_app.backend.connection_errors,
+    settings.breaker_failure_threshold,
+    settings.breaker_reset_timeout,
+)
+
+
+@contextmanager
+def uses_dependencies() -> Iterator[None]:
+    """Guard a block that publishes to the broker and writes the result backend"""
+    with broker_breaker.guard(), backend_breaker.guard():
+        yield
+
+
+async def uses_broker() -> AsyncIterator[None]:
+    """Dependency of routes that publish to or control workers through the broker"""
+    with broker_breaker.guard():
+        yield
+
+
+async def uses_backend() -> AsyncIterator[None]:
+    """Dependency of routes that read or write the result backend"""
+    with backend_breaker.guard():
+        yield
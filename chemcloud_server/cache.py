@@ -0,0 +1,129 @@
+"""In-process caches for data that is expensive to rebuild on every request."""
+
+import asyncio
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Generic, Hashable, Optional, TypeVar
+
+from fastapi.concurrency import run_in_threadpool
+
+T = TypeVar("T")
+
+
+class ResponseCache:
+    """Size-bounded LRU cache of encoded response bodies keyed by task id.
+
+    Only responses for tasks in a terminal state should be stored since their content
+    never changes. Entries are evicted least recently used first once the total size
+    of the stored bodies exceeds max_bytes.
+
+    Args:
+        max_bytes: Maximum total size of all cached bodies. 0 disables the cache.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the cached body for key (marking it recently used) or None."""
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def set(self, key: str, body: bytes) -> None:
+        """Cache body for key. Bodies larger than the cache itself are not stored."""
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def pop(self, key: str) -> Optional[bytes]:
+        """Remove key from the cache, returning its body if present."""
+        with self._lock:
+            body = self._entries.pop(key, None)
+            if body is not None:
+                self.size -= len(body)
+            return body
+
+    def clear(self) -> None:
+        """Remove all entries from the cache."""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class SingleFlight(Generic[T]):
+    """Share one call among concurrent callers asking for the same key.
+
+    The first caller of do() for a key runs the function in a thread; callers arriving
+    while it runs await the same call instead of starting their own. Results that
+    reuse() accepts keep being returned for max_age seconds after the call finished,
+    e.g., the status of an unfinished task polled by many clients. Callers that are
+    cancelled (e.g., a client disconnects) do not cancel the call for the others.
+
+    Calls are shared within one event loop, i.e., one server process.
+
+    Args:
+        max_age: Seconds results accepted by reuse() are returned after their call
+            finished. 0 only shares calls in flight.
+        reuse: Whether a result may be returned to callers arriving after its call
+            finished. Exceptions are never reused.
+    """
+
+    def __init__(self, max_age: float, reuse: Callable[[T], bool]):
+        self.max_age = max_age
+        self.reuse = reuse
+        self._calls: dict[Hashable, asyncio.Future[T]] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, func: Callable[..., T], *args: Any) -> T:
+        """Return func(*args), or the result of a shared call of it for key."""
+        future = self._calls.get(key)
+        if future is None or future.get_loop() is not asyncio.get_running_loop():
+            future = asyncio.ensure_future(run_in_threadpool(func, *args))
+            self._calls[key] = future
+            future.add_done_callback(lambda f: self._finished(key, f))
+        return await asyncio.shield(future)
+
+    def _finished(self, key: Hashable, future: asyncio.Future[T]) -> None:
+        if self._calls.get(key) is not future:  # Forgotten while running
+            return
+        # Also marks exceptions as retrieved in case every caller was cancelled
+        if future.cancelled() or future.exception() is not None:
+            del self._calls[key]
+        elif self.max_age > 0 and self.reuse(future.result()):
+            future.get_loop().call_later(self.max_age, self.forget, key, future)
+        else:
+            del self._calls[key]
+
+    def forget(self, key: Hashable, future: Optional[asyncio.Future[T]] = None) -> None:
+        """Make later callers for key start a new call.
+
+        Callers already waiting for a running call still get its result. If future is
+        given, key is only forgotten if its call is still future.
+        """
+        if future is None or self._calls.get(key) is future:
+            self._calls.pop(key, None)
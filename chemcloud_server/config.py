@@ -2,9 +2,10 @@
 
 from functools import lru_cache
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional
 
 import httpx
+import logfire
 from fastapi import HTTPException
 from pydantic import AnyHttpUrl
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -24,12 +25,106 @@ class Settings(BaseSettings):
     api_compute_prefix: str = "/compute"
     api_oauth_prefix: str = "/oauth"
     users_prefix: str = "/users"
+    health_prefix: str = "/health"
+    api_usage_prefix: str = "/usage"
     # NOTE: AnyHttpUrl usage seems correct; not sure why mypy doesn't like it
     # https://pydantic-docs.helpmanual.io/usage/settings/
     base_url: AnyHttpUrl = "http://localhost:8000"  # type: ignore
     id_token_cookie_key: str = "id_token"
     refresh_token_cookie_key: str = "refresh_token"
     max_batch_inputs: int = 100
+    max_bulk_delete_ids: int = 10000
+    # Most jobs returned by one request for a user's jobs
+    max_jobs_page: int = 1000
+    # Seconds results are kept after they were submitted or last retrieved. 0 keeps
+    # results until the client deletes them. Unless chemcloud_worker_tasks, workers
+    # keep task results for bigchem_result_expires, which then also caps this.
+    result_ttl: int = 7 * 24 * 3600
+    # Retrieving a result restarts the expiration clock of its keys at most once per
+    # this many seconds, so frequent polls cost one backend command. Keep it well
+    # below result_ttl. 0 restarts the clock on every retrieval.
+    result_refresh_interval: int = 600
+    # Seconds results are kept after submission however often they are retrieved, by
+    # token scope, e.g., {"compute:public": 604800}. Longest applies for many scopes.
+    result_max_age_by_scope: dict[str, int] = {}
+    # Seconds between sweeps of the backend for orphaned results. 0 disables sweeping.
+    result_sweep_interval: int = 3600
+    # Largest /compute request body accepted; checked before the body is parsed
+    max_compute_body_bytes: int = 512 * 1024**2
+    # Most inputs of one newline-delimited (NDJSON) /compute upload; each line may be
+    # up to max_compute_body_bytes. None for max_batch_inputs; set it higher to allow
+    # larger uploads than list submissions.
+    max_stream_inputs: Optional[int] = None
+    # Total size of encoded SUCCESS/FAILURE responses kept in memory per server
+    # process so repeat downloads skip the backend fetch and serialization. 0 disables.
+    result_cache_max_bytes: int = 128 * 1024**2
+    # Seconds a server process keeps answering polls of an unfinished task with the
+    # status it last read, rather than reading the backend again. Concurrent polls of
+    # the same task always share one read. 0 disables.
+    result_fresh_seconds: float = 1.0
+    # Messages waiting in a queue above which /compute rejects submissions to it with
+    # 429 (or 503 if no worker consumes it). 0 disables admission control.
+    max_queue_depth: int = 0
+    # Typical seconds a worker spends per task; estimates Retry-After of rejections
+    queue_task_seconds: float = 10.0
+    # Seconds between refreshes of the queue depths and consumers admission control uses
+    queue_stats_interval: float = 5.0
+    # Most queues besides the default one whose stats each server process refreshes,
+    # and seconds after their last accepted submission until it stops
+    max_watched_queues: int = 100
+    queue_watch_seconds: float = 3600.0
+    # Seconds broker and result backend operations may take before they fail
+    dependency_timeout: float = 5.0
+    # Consecutive broker (or backend) failures after which requests needing it fail
+    # immediately with 503, and seconds until the next attempt to reach it
+    breaker_failure_threshold: int = 5
+    breaker_reset_timeout: float = 30.0
+    # Seconds between background probes of the broker, backend and JWKS reported by
+    # /health/ready
+    health_probe_interval: float = 10.0
+    # Key signing the notifications POSTed to /compute callback URLs (HMAC-SHA256).
+    # Webhooks are disabled without it.
+    webhook_secret: str = ""
+    # URL prefixes each user (token subject) may use as callback URL, e.g.,
+    # {"auth0|5fb8828f1bda000075e14b0a": ["https://example.com/hooks/"]}
+    webhook_allowed_urls: dict[str, list[str]] = {}
+    # Finished computations waiting for delivery of their notification per server
+    # process; more stay registered until a later check finds room
+    webhook_queue_size: int = 1000
+    # Bytes of those notifications (which may include outputs) above which no more
+    # are claimed
+    webhook_queue_max_bytes: int = 256 * 2**20
+    # Notifications delivered concurrently per server process
+    webhook_concurrency: int = 8
+    # Attempts to deliver a notification, waiting webhook_retry_backoff seconds before
+    # the first retry and doubling the wait for each later one
+    webhook_max_attempts: int = 5
+    webhook_retry_backoff: float = 1.0
+    # Seconds to wait for a callback URL to respond
+    webhook_timeout: float = 10.0
+    # Seconds between checks of all registered webhooks, which deliver those missed
+    # while the server process that registered them was down
+    webhook_recheck_interval: float = 60.0
+    # Seconds of submissions and finished tasks aggregated in one usage record, and
+    # seconds usage records are kept. usage_retention 0 disables usage accounting.
+    usage_bucket_seconds: int = 3600
+    usage_retention: int = 90 * 24 * 3600
+    # Most recent usage events kept in a backend stream for inspection. 0 keeps none.
+    usage_events_max: int = 100_000
+    # Workers import chemcloud_server.tasks (celery worker -I chemcloud_server.tasks).
+    # Enables BigChem algorithms reduced by those tasks, e.g., parallel gradients.
+    chemcloud_worker_tasks: bool = False
+    # Run geomeTRIC optimizations with chemcloud_server.tasks.compute_optimization so
+    # each step can be streamed. Requires workers that import chemcloud_server.tasks.
+    stream_trajectories: bool = False
+    # Programs cheap enough that broker and backend overhead dominates their runtime,
+    # e.g., ["rdkit", "xtb"]. Batches of their inputs run back to back in one
+    # chemcloud_server.tasks.compute_batch task. Requires chemcloud_worker_tasks.
+    micro_batch_programs: list[str] = []
+    # Maximum number of inputs run by one compute_batch task
+    micro_batch_size: int = 32
+    # Seconds between checks for new steps while streaming a trajectory
+    trajectory_poll_interval: float = 1.0
 
     # NOTE: Adding "" values as defaults so tests can run on CircleCi without having
     # to set these auth0 values
@@ -42,6 +137,17 @@ class Settings(BaseSettings):
     jwks: list[dict[str, Any]] = [{}]
     jwt_issuer: str = ""
     logfire_write_token: str = ""
+    # Share of requests traced (head sampling); the others record no spans at all
+    trace_sample_rate: float = 1.0
+    # Traces of requests that take trace_slow_seconds or more or log a warning or
+    # error are always kept; others are kept with probability trace_background_rate.
+    # Below 1.0, spans are buffered until their request ends to decide (tail sampling).
+    trace_slow_seconds: float = 1.0
+    trace_background_rate: float = 1.0
+    # Record request and response headers in request spans
+    trace_capture_headers: bool = True
+    # Regular expressions of URLs never traced, e.g., frequently polled health probes
+    trace_excluded_urls: list[str] = ["/health/"]
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -52,10 +158,10 @@ class Settings(BaseSettings):
     )
 
 
-def _get_jwks(domain: str) -> list[dict[str, str]]:
-    """Get JSON Web Keys used to validate tokens"""
+def fetch_jwks(domain: str, timeout: float = 5.0) -> list[dict[str, str]]:
+    """Get JSON Web Keys used to validate tokens from domain, without caching"""
     url = f"https://{domain}/.well-known/jwks.json"
-    response = httpx.get(url)
+    response = httpx.get(url, timeout=timeout)
     try:
         response.raise_for_status()
     except httpx.HTTPStatusError:
@@ -67,11 +173,52 @@ def _get_jwks(domain: str) -> list[dict[str, str]]:
 def get_settings():
     """Settings object to use throughout the app as a dependency
     https://fastapi.tiangolo.com/advanced/settings/#creating-the-settings-only-once-with-lru_cache
+
+    Performs no network requests so modules may call it at import; JSON Web Keys are
+    fetched by get_jwks.
     """
-    # Add JWKs using auth0 settings
     initial_settings = Settings()
     as_dict = initial_settings.model_dump()
     if initial_settings.auth0_domain:
-        as_dict["jwks"] = _get_jwks(initial_settings.auth0_domain)
         as_dict["jwt_issuer"] = f"https://{initial_settings.auth0_domain}/"
     return Settings(**as_dict)
+
+
+def keep_results_for_result_ttl(conf: Any) -> None:
+    """Have a BigChem app keep task results as long as the DAGs that refer to them.
+
+    Backends read result_expires when they are created, once per thread, so call this
+    before the app creates any (see helpers._result_ttl).
+    """
+    conf.result_expires = get_settings().result_ttl or None
+
+
+def trace_sampling(settings: Settings) -> logfire.SamplingOptions:
+    """Sampling of request traces configured by the trace_* settings.
+
+    Raises:
+        ValueError if trace_background_rate exceeds trace_sample_rate.
+    """
+    if settings.trace_background_rate >= 1:  # No need to buffer spans
+        return logfire.SamplingOptions(head=settings.trace_sample_rate)
+    return logfire.SamplingOptions.level_or_duration(
+        head=settings.trace_sample_rate,
+        level_threshold="warn",
+        duration_threshold=settings.trace_slow_seconds,
+        background_rate=settings.trace_background_rate,
+    )
+
+
+@lru_cache()
+def get_jwks() -> list[dict[str, Any]]:
+    """JSON Web Keys used to validate tokens, fetched from Auth0 on first use.
+
+    Fetched in the background when the app starts, by the first health probe (see
+    health.probe_jwks and main.lifespan), rather than at import so workers serve
+    requests that need no authentication right away. Failed fetches are not cached and
+    are retried by the next call or probe.
+    """
+    settings = get_settings()
+    if settings.auth0_domain:
+        return fetch_jwks(settings.auth0_domain, settings.dependency_timeout)
+    return settings.jwks
@@ -0,0 +1,102 @@
+"""Background probes of the server's dependencies for readiness checks."""
+
+import asyncio
+import logging
+from time import perf_counter, time
+from typing import Any, Callable
+
+from bigchem.app import bigchem as bigchem_app
+from fastapi.concurrency import run_in_threadpool
+
+from chemcloud_server.admission import get_queue_depths
+from chemcloud_server.config import fetch_jwks, get_jwks, get_settings
+from chemcloud_server.models import DependencyStatus, Readiness
+
+logger = logging.getLogger(__name__)
+
+
+def probe_broker() -> None:
+    """Declare the default queue passively; a round trip to the broker"""
+    get_queue_depths([bigchem_app.conf.task_default_queue])
+
+
+def probe_backend() -> None:
+    bigchem_app.backend.client.ping()
+
+
+def probe_jwks() -> None:
+    """Fetch the JSON Web Keys from Auth0.
+
+    Until a fetch succeeds this fills get_jwks' cache, so requests find the keys
+    there. Later probes bypass the cache, which would never contact Auth0 again.
+    """
+    settings = get_settings()
+    if not get_jwks.cache_info().currsize:
+        get_jwks()
+    elif settings.auth0_domain:
+        fetch_jwks(settings.auth0_domain, settings.dependency_timeout)
+
+
+class HealthMonitor:
+    """Cached results of probing each dependency.
+
+    Requests only read the cached statuses; run_probes() (run periodically by
+    run_health_probes) calls the probes.
+
+    Args:
+        probes: Callable per dependency name that raises if the dependency is
+            unavailable.
+        max_age: Seconds after which a status is too old to count as healthy, e.g.,
+            because probes are stuck.
+    """
+
+    def __init__(self, probes: dict[str, Callable[[], Any]], max_age: float):
+        self.probes = probes
+        self.max_age = max_age
+        self.statuses: dict[str, DependencyStatus] = {}
+
+    def run_probes(self) -> None:
+        """Probe every dependency and record its status and latency."""
+        for name, probe in self.probes.items():
+            start = perf_counter()
+            try:
+                probe()
+                error = None
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            self.statuses[name] = DependencyStatus(
+                healthy=error is None,
+                latency=perf_counter() - start,
+                checked_at=time(),
+                error=error,
+            )
+
+    def readiness(self) -> Readiness:
+        """Ready once every dependency has a recent, healthy status."""
+        statuses = dict(self.statuses)
+        oldest = time() - self.max_age
+        return Readiness(
+            ready=all(
+                name in statuses
+                and statuses[name].healthy
+                and statuses[name].checked_at >= oldest
+                for name in self.probes
+            ),
+            dependencies=statuses,
+        )
+
+
+async def run_health_probes(monitor: HealthMonitor, interval: float) -> None:
+    """Probe dependencies every interval seconds."""
+    while True:
+        try:
+            await run_in_threadpool(monitor.run_probes)
+        except Exception:
+            logger.exception("Probing dependencies failed")
+        await asyncio.sleep(interval)
+
+
+health_monitor = HealthMonitor(
+    {"broker": probe_broker, "backend": probe_backend, "jwks": probe_jwks},
+    max_age=3 * get_settings().health_probe_interval,
+)
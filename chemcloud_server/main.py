@@ -1,5 +1,7 @@
 """Main module for the FastAPI app. Also contains convenience paths that route"""
 
+import asyncio
+from contextlib import asynccontextmanager
 from typing import Optional
 
 import logfire
@@ -7,12 +9,18 @@ from fastapi import FastAPI, Security
 from fastapi.openapi.utils import get_openapi
 from fastapi.responses import RedirectResponse
 from fastapi.staticfiles import StaticFiles
+from pydantic import TypeAdapter
 
 from chemcloud_server import __version__
 
+from .admission import run_queue_monitor
 from .auth import bearer_auth
-from .config import get_settings
-from .routes import compute, oauth, users
+from .config import get_settings, trace_sampling
+from .health import health_monitor, run_health_probes
+from .models import CompactBatch, ProgramInputsOrList
+from .routes import compute, health, oauth, usage, users
+from .sweeper import run_sweeper
+from .webhooks import run_webhook_dispatcher, webhook_dispatcher
 
 settings = get_settings()
 
@@ -25,6 +33,14 @@ tags_metadata = [
         "name": "compute",
         "description": "Submit computations and obtain results.",
     },
+    {
+        "name": "health",
+        "description": "Liveness and readiness probes for orchestrators.",
+    },
+    {
+        "name": "usage",
+        "description": "Computations submitted and finished by users and programs.",
+    },
     {
         "name": "hello world",
         "description": "Try out the interactive docs using this endpoint!",
@@ -32,6 +48,41 @@ tags_metadata = [
 ]
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run background tasks for the lifetime of the app"""
+    # The first probe also fetches the JSON Web Keys, without delaying startup
+    probes = asyncio.create_task(
+        run_health_probes(health_monitor, settings.health_probe_interval)
+    )
+    sweeper = None
+    if settings.result_sweep_interval:
+        sweeper = asyncio.create_task(run_sweeper(settings.result_sweep_interval))
+    monitor = None
+    if settings.max_queue_depth:
+        monitor = asyncio.create_task(
+            run_queue_monitor(compute.queue_monitor, settings.queue_stats_interval)
+        )
+    dispatcher = None
+    if settings.webhook_secret:
+        dispatcher = asyncio.create_task(
+            run_webhook_dispatcher(
+                webhook_dispatcher,
+                settings.webhook_concurrency,
+                settings.webhook_timeout,
+                settings.webhook_recheck_interval,
+            )
+        )
+    yield
+    probes.cancel()
+    if sweeper:
+        sweeper.cancel()
+    if monitor:
+        monitor.cancel()
+    if dispatcher:
+        dispatcher.cancel()
+
+
 app = FastAPI(
     title="ChemCloud",
     description=(
@@ -45,11 +96,16 @@ app = FastAPI(
     ),
     version=__version__,
     openapi_tags=tags_metadata,
+    lifespan=lifespan,
 )
 
 # Configure logfire
-logfire.configure(token=get_settings().logfire_write_token)
-logfire.instrument_fastapi(app, capture_headers=True)
+logfire.configure(token=settings.logfire_write_token, sampling=trace_sampling(settings))
+logfire.instrument_fastapi(
+    app,
+    capture_headers=settings.trace_capture_headers,
+    excluded_urls=settings.trace_excluded_urls,
+)
 
 # Add routes
 app.include_router(
@@ -63,7 +119,13 @@ app.include_router(
     dependencies=[Security(bearer_auth, scopes=["compute:public"])],
     tags=["compute"],
 )
+app.include_router(
+    usage.router,
+    prefix=f"{settings.api_v2_str}{settings.api_usage_prefix}",
+    tags=["usage"],
+)
 app.include_router(users.router, prefix=f"{settings.users_prefix}")
+app.include_router(health.router, prefix=settings.health_prefix, tags=["health"])
 
 
 @app.get("/", include_in_schema=False)
@@ -100,6 +162,29 @@ def custom_openapi():
     )
     openapi_schema["tags"] = tags_metadata
     openapi_schema["info"]["x-max_batch_inputs"] = settings.max_batch_inputs
+
+    # /compute reads its body directly (see routes.compute.compute) so FastAPI cannot
+    # document it; add the body schema here.
+    inputs_schema = TypeAdapter(ProgramInputsOrList | CompactBatch).json_schema(
+        ref_template="#/components/schemas/{model}-Input"
+    )
+    schemas = openapi_schema["components"]["schemas"]
+    for name, definition in inputs_schema.pop("$defs").items():
+        schemas.setdefault(f"{name}-Input", definition)
+    compute_path = f"{settings.api_v2_str}{settings.api_compute_prefix}"
+    openapi_schema["paths"][compute_path]["post"]["requestBody"] = {
+        "required": True,
+        "content": {
+            "application/json": {"schema": inputs_schema},
+            compute.NDJSON_MEDIA_TYPE: {
+                "schema": {
+                    "type": "string",
+                    "description": "One ProgramInput, DualProgramInput or FileInput "
+                    "per line, each submitted as its line arrives.",
+                }
+            },
+        },
+    }
     app.openapi_schema = openapi_schema
     return app.openapi_schema
 
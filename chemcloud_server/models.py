@@ -1,7 +1,7 @@
 from enum import Enum
-from typing import Optional, TypeAlias
+from typing import Annotated, Any, Optional, TypeAlias
 
-from pydantic import AnyHttpUrl, BaseModel, Field
+from pydantic import AnyHttpUrl, BaseModel, Discriminator, Field, Tag, TypeAdapter
 from qcio import (
     DualProgramInput,
     FileInput,
@@ -12,7 +12,59 @@ from qcio import (
 # Convenience types
 ProgramInputs: TypeAlias = FileInput | ProgramInput | DualProgramInput
 ProgramInputsOrList: TypeAlias = ProgramInputs | list[ProgramInputs]
-ProgramOutputOrList: TypeAlias = ProgramOutput | list[ProgramOutput]
+# Cancelled (REVOKED) tasks in a group have no ProgramOutput
+ProgramOutputOrList: TypeAlias = ProgramOutput | list[Optional[ProgramOutput]]
+
+
+def _program_inputs_tag(value: Any) -> Optional[str]:
+    """Select the ProgramInputs member to validate value against.
+
+    qcio inputs forbid extra fields, so "subprogram" is only valid on a
+    DualProgramInput and "structure" (or the deprecated "molecule") only on a
+    ProgramInput. This accepts exactly what the plain union does without pydantic
+    trying every member for every input.
+    """
+    if isinstance(value, dict):
+        fields = value
+    elif isinstance(value, BaseModel):
+        fields = type(value).model_fields
+    else:
+        return None
+    if "subprogram" in fields:
+        return "dual"
+    if "structure" in fields or "molecule" in fields:
+        return "program"
+    return "file"
+
+
+TaggedProgramInputs: TypeAlias = Annotated[
+    Annotated[FileInput, Tag("file")]
+    | Annotated[ProgramInput, Tag("program")]
+    | Annotated[DualProgramInput, Tag("dual")],
+    Discriminator(_program_inputs_tag),
+]
+
+# Built once; validators for /compute request bodies
+program_inputs_adapter = TypeAdapter(TaggedProgramInputs)
+program_inputs_list_adapter = TypeAdapter(list[TaggedProgramInputs])
+
+
+class CompactBatch(BaseModel):
+    """Batch of inputs sharing structures, models, files, etc., accepted by /compute.
+
+    Each input is defaults updated with the input's own fields. Any field of an input
+    or of defaults may be {"$ref": index} to use shared[index], so values common to
+    many inputs, e.g., the structure of a parameter scan, are sent and validated once.
+
+    Args:
+        shared: Values referenced by the inputs and defaults.
+        defaults: Fields common to all inputs.
+        inputs: Fields of each input, overriding defaults.
+    """
+
+    shared: list[Any] = []
+    defaults: dict[str, Any] = {}
+    inputs: list[dict[str, Any]]
 
 
 class SupportedPrograms(str, Enum):
@@ -58,20 +110,284 @@ class TaskStatus(str, Enum):
     IGNORED = "IGNORED"
 
 
+class DeleteStatus(str, Enum):
+    """Outcome of deleting a task's result from the server"""
+
+    DELETED = "DELETED"
+    #: Result was already deleted
+    GONE = "GONE"
+
+
+class CancelReport(BaseModel):
+    """Outcome of cancelling a task or group.
+
+    Args:
+        n_cancelled: Number of tasks revoked before they started.
+        n_running: Number of tasks already running; these run to completion.
+        n_finished: Number of tasks that had already finished.
+    """
+
+    n_cancelled: int
+    n_running: int
+    n_finished: int
+
+
+class Progress(BaseModel):
+    """Progress of a group of compute tasks.
+
+    Args:
+        n_completed: Number of tasks in the group that have finished (successfully or
+            not).
+        n_total: Number of tasks in the group.
+    """
+
+    n_completed: int
+    n_total: int
+
+
+class JobSummary(BaseModel):
+    """A computation submitted by a user.
+
+    Args:
+        task_id: The id of the task or group.
+        submitted_at: Unix time of the submission.
+        status: The status of the task or group.
+        progress: Progress of a group; None for single tasks.
+    """
+
+    task_id: str
+    submitted_at: float
+    status: TaskStatus
+    progress: Optional[Progress] = None
+
+
+class JobPage(BaseModel):
+    """A page of a user's computations, most recent first.
+
+    Args:
+        jobs: The computations on this page. May hold fewer than requested, even none,
+            when results were deleted or expired.
+        next_cursor: Cursor of the next page; None on the last page.
+    """
+
+    jobs: list[JobSummary]
+    next_cursor: Optional[str] = None
+
+
 class ProgramOutputWrapper(BaseModel):
     """
     Status and ProgramOutput(s) of a compute task. Main object returned by
     /compute/output/{task_id} in response to a query for a task's status and output.
 
     Args:
-        status: The status of the task as reported by celery.
+        status: The status of the task as reported by celery. For a group, the most
+            advanced state of its tasks until all of them have finished. REVOKED if
+            any task was cancelled.
         program_output: The ProgramOutput object for the task. If the task is a group,
             this will be a list of ProgramOutputs. If the task is a single task, this
-            will be a single ProgramOutput.
+            will be a single ProgramOutput. None for cancelled tasks.
+        progress: How many tasks of a group have finished. None for single tasks.
     """
 
     status: TaskStatus
     program_output: Optional[ProgramOutputOrList] = None
+    progress: Optional[Progress] = None
+
+
+class WebhookPayload(ProgramOutputWrapper):
+    """Body of the notification POSTed to a callback URL when a computation finishes.
+
+    Args:
+        task_id: The task id returned by /compute.
+        status: The final status of the task or group.
+        program_output: As returned by /compute/output/{task_id} if the outputs were
+            requested with callback_output; otherwise None.
+        progress: How many tasks of a group have finished. None for single tasks.
+    """
+
+    task_id: str
+
+
+class Webhook(BaseModel):
+    """Callback registered for a submitted computation.
+
+    Args:
+        url: URL the notification is POSTed to.
+        include_output: Whether the notification includes the outputs.
+    """
+
+    url: str
+    include_output: bool = False
+
+
+class ArrayQuantity(str, Enum):
+    """Numeric results that can be extracted from a task's outputs as arrays"""
+
+    ENERGY = "energy"
+    GRADIENT = "gradient"
+    HESSIAN = "hessian"
+    DIPOLE = "scf_dipole_moment"
+    NUCLEAR_REPULSION_ENERGY = "nuclear_repulsion_energy"
+    FREQUENCIES = "freqs_wavenumber"
+    GIBBS_FREE_ENERGY = "gibbs_free_energy"
+
+
+class ArrayFormat(str, Enum):
+    """Encoding of arrays returned by /compute/output/{task_id}/arrays"""
+
+    JSON = "json"
+    #: numpy .npz archive with one array per quantity
+    NPZ = "npz"
+
+
+class OutputEncoding(str, Enum):
+    """Encoding of the outputs returned by /compute/output/{task_id}"""
+
+    FULL = "full"
+    #: Fields of input_data repeated across a group's outputs (structure, model,
+    #: files, etc.) are sent once in "shared" and referenced as {"$ref": index}
+    COMPACT = "compact"
+
+
+class ArraysWrapper(BaseModel):
+    """Status of a compute task and, once finished, the chosen quantities of its
+    outputs.
+
+    Args:
+        status: The status of the task, as in ProgramOutputWrapper.
+        arrays: Once the task has finished, a list per quantity with one value per
+            output in submission order (one output for single tasks), plus "success"
+            with whether each computation succeeded. Values are None where an output
+            is missing (cancelled) or lacks the quantity.
+        progress: How many tasks of a group have finished. None for single tasks.
+    """
+
+    status: TaskStatus
+    arrays: Optional[dict[str, list[Any]]] = None
+    progress: Optional[Progress] = None
+
+
+class TrajectoryStep(BaseModel):
+    """One step of an optimization, published by the worker as soon as it completes.
+
+    Args:
+        step: Index of the step in the trajectory.
+        success: Whether the energy and gradient calculation of the step succeeded.
+        geometry: Geometry of the step in Bohr.
+        energy: Energy of the step in Hartree.
+        gradient: Gradient of the step in Hartree/Bohr.
+    """
+
+    step: int
+    success: bool
+    geometry: list[list[float]]
+    energy: Optional[float] = None
+    gradient: Optional[list[list[float]]] = None
+
+
+class UsageMetric(str, Enum):
+    """Quantities recorded by usage accounting"""
+
+    #: Inputs submitted to /compute
+    SUBMITTED = "submitted"
+    #: Bytes of the submitted request bodies
+    INPUT_BYTES = "input_bytes"
+    #: Calculations finished by workers, successfully or not
+    COMPLETED = "completed"
+    #: Calculations that failed
+    FAILED = "failed"
+    #: Seconds workers spent running the tasks of the calculations
+    WALL_TIME = "wall_time"
+    #: Bytes of the stored outputs
+    OUTPUT_BYTES = "output_bytes"
+
+
+class UsageBucket(BaseModel):
+    """Usage in one time bucket.
+
+    Args:
+        start: Unix time at which the bucket starts.
+        usage: Metrics by group, e.g., by program for a user's usage, or "all",
+            "queue:{name}" and "worker:{hostname}" for a program's usage.
+    """
+
+    start: int
+    usage: dict[str, dict[UsageMetric, float]]
+
+
+class UsageReport(BaseModel):
+    """Usage of a user or program over a time range, by bucket.
+
+    Args:
+        bucket_seconds: Duration of each bucket.
+        buckets: Buckets with any usage, oldest first.
+    """
+
+    bucket_seconds: int
+    buckets: list[UsageBucket]
+
+
+class QueueStats(BaseModel):
+    """Snapshot of a broker queue used for admission control.
+
+    Args:
+        depth: Number of messages waiting in the queue.
+        n_consumers: Number of workers consuming from the queue.
+        updated_at: Unix time of the snapshot.
+    """
+
+    depth: int
+    n_consumers: int
+    updated_at: float
+
+
+class DependencyStatus(BaseModel):
+    """Result of the latest background probe of a dependency.
+
+    Args:
+        healthy: Whether the probe succeeded.
+        latency: Seconds the probe took.
+        checked_at: Unix time of the probe.
+        error: Why the probe failed, if it did.
+    """
+
+    healthy: bool
+    latency: float
+    checked_at: float
+    error: Optional[str] = None
+
+
+class Readiness(BaseModel):
+    """Whether the server is ready to serve requests, and the status of each dependency.
+
+    Args:
+        ready: Whether every dependency was probed recently and is healthy.
+        dependencies: Latest probe of each dependency; missing until first probed.
+    """
+
+    ready: bool
+    dependencies: dict[str, DependencyStatus]
+
+
+class SweepReport(BaseModel):
+    """Summary of a sweep of the backend for orphaned results.
+
+    Args:
+        n_dags: Number of DAGs scanned.
+        n_results: Number of results scanned.
+        n_deleted: Number of orphaned results deleted.
+        bytes_reclaimed: Backend memory used by the deleted results.
+        n_jobs_removed: Number of entries of users' jobs removed because their DAG
+            was gone.
+        duration: Seconds the sweep took.
+    """
+
+    n_dags: int
+    n_results: int
+    n_deleted: int
+    bytes_reclaimed: int
+    n_jobs_removed: int
+    duration: float
 
 
 class OAuth2Base(BaseModel):
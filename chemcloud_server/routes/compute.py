@@ -1,25 +1,119 @@
-from typing import Optional
+import asyncio
+from io import BytesIO
+from typing import Annotated, Any, AsyncIterator, Optional
 
+import logfire
+import numpy as np
+from bigchem.app import bigchem as bigchem_app
 from bigchem.canvas import group
-from fastapi import APIRouter, BackgroundTasks, HTTPException, Path, Query
+from celery.result import AsyncResult, GroupResult
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Body,
+    Depends,
+    HTTPException,
+    Path,
+    Query,
+    Request,
+    Response,
+    Security,
+)
 from fastapi import status as status_codes
-from qcop.exceptions import QCOPBaseError
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import StringConstraints
 
+from chemcloud_server.admission import QueueMonitor
+from chemcloud_server.auth import bearer_auth
+from chemcloud_server.breakers import uses_backend, uses_broker, uses_dependencies
+from chemcloud_server.cache import ResponseCache, SingleFlight
 from chemcloud_server.config import get_settings
 from chemcloud_server.exceptions import ResultNotFoundError
 from chemcloud_server.models import (
-    ProgramInputsOrList,
+    ArrayFormat,
+    ArrayQuantity,
+    ArraysWrapper,
+    CancelReport,
+    DeleteStatus,
+    JobPage,
+    OutputEncoding,
     ProgramOutputWrapper,
     SupportedPrograms,
-    TaskStatus,
+    TrajectoryStep,
+    UsageMetric,
+    Webhook,
 )
+from chemcloud_server.usage import record_usage, usage_headers
+from chemcloud_server.webhooks import check_callback_url, webhook_dispatcher
 
-from .helpers import delete_result, restore_result, save_dag, signature_from_input
+from .helpers import (
+    cancel_result,
+    check_bigchem_inputs,
+    delete_result,
+    delete_results,
+    encode_compact_output_response,
+    encode_output_response,
+    extract_arrays,
+    get_outputs,
+    iter_lines,
+    list_jobs,
+    micro_batchable,
+    parse_program_inputs,
+    read_trajectory,
+    restore_result,
+    result_max_age,
+    save_dag,
+    signature_from_input,
+    stack_arrays,
+    submit_micro_batches,
+    submit_stream,
+    touch_result,
+)
 
 settings = get_settings()
 
 router = APIRouter()
 
+# Content type of /compute bodies with one input per line
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+TASK_ID_PATTERN = (
+    r"[0-9a-f]{8}\-[0-9a-f]{4}\-4[0-9a-f]{3}\-[89ab][0-9a-f]{3}\-[0-9a-f]{12}"
+)
+
+# Encoded responses for tasks in a terminal state; their output never changes
+result_cache = ResponseCache(settings.result_cache_max_bytes)
+
+
+def _cache_key(task_id: str, encoding: OutputEncoding) -> str:
+    """Key of a task's response in result_cache; one entry per encoding"""
+    return task_id if encoding == OutputEncoding.FULL else f"{task_id}:{encoding.value}"
+
+
+# Reads of /compute/output responses in progress, shared by concurrent polls of a task.
+# Responses of unfinished tasks are reused for result_fresh_seconds.
+result_reads: SingleFlight[tuple[bytes, bool]] = SingleFlight(
+    settings.result_fresh_seconds, reuse=lambda read: not read[1]
+)
+
+
+def _uncache(task_id: str) -> None:
+    """Remove every encoding of a task's response from result_cache and result_reads"""
+    for encoding in OutputEncoding:
+        result_cache.pop(_cache_key(task_id, encoding))
+        result_reads.forget(_cache_key(task_id, encoding))
+
+
+# Rejects submissions to queues with too many waiting tasks; refreshed by main.lifespan
+queue_monitor = QueueMonitor(
+    settings.max_queue_depth,
+    settings.queue_task_seconds,
+    bigchem_app.conf.task_default_queue,
+    settings.max_watched_queues,
+    settings.queue_watch_seconds,
+)
+
 
 @router.post(
     "",  # NOTE: "/compute" prefix is prepended in top level main.py file
@@ -27,8 +121,9 @@ router = APIRouter()
     response_description="Task ID for the requested computation.",
 )
 async def compute(
+    request: Request,
     program: SupportedPrograms,
-    inp_obj: ProgramInputsOrList,
+    token: dict[str, Any] = Security(bearer_auth, scopes=["compute:public"]),
     collect_stdout: bool = Query(
         True, description="Collect stdout from the computation."
     ),
@@ -51,10 +146,38 @@ async def compute(
             "ignored if the adapter does not support it."
         ),
     ),
+    reduced_only: bool = Query(
+        False,
+        description=(
+            "For BigChem algorithms, collect stdout, files and wavefunctions only for "
+            "the final result, not for each displaced calculation."
+        ),
+    ),
     queue: Optional[str] = None,
+    callback_url: Optional[str] = Query(
+        None,
+        description=(
+            "URL to POST a signed notification with the task id and final status to "
+            "when the computation finishes, instead of polling for its output. Must "
+            "be in the allow-list of your account."
+        ),
+    ),
+    callback_output: bool = Query(
+        False, description="Include the output(s) in the callback_url notification."
+    ),
 ) -> str:
     """Submit a computation: ProgramInput, DualProgramInput (or list) and computation
-    program."""
+    program.
+
+    With content type application/x-ndjson the body holds one input per line. Each
+    input is submitted as soon as its line arrives and the id of the group of all of
+    them is returned.
+    """
+    if callback_url is not None:
+        check_callback_url(callback_url, token)
+    # Reject work before reading the body when the queue is already backed up
+    queue_monitor.admit(queue)
+
     compute_kwargs = dict(  # kwargs for qcio.compute function
         collect_stdout=collect_stdout,
         collect_files=collect_files,
@@ -62,84 +185,395 @@ async def compute(
         rm_scratch_dir=rm_scratch_dir,
         propagate_wfn=propagate_wfn,
     )
+    # Workers record the usage of tasks tagged with the user
+    headers = usage_headers(token["sub"], program.value)
+
+    if request.headers.get("content-type", "").startswith(NDJSON_MEDIA_TYPE):
+        n_bytes = 0
 
-    if isinstance(inp_obj, list):  # Probably a more FastAPI way to do this exists
-        if len(inp_obj) > settings.max_batch_inputs:  # Check for too many inputs
-            raise HTTPException(
-                status_code=status_codes.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                detail=(
-                    f"Cannot submit more than {settings.max_batch_inputs} inputs "
-                    "at once"
-                ),
+        async def lines() -> AsyncIterator[bytes]:
+            nonlocal n_bytes
+            async for line in iter_lines(
+                request.stream(), settings.max_compute_body_bytes
+            ):
+                n_bytes += len(line)
+                yield line
+
+        # Workers start on the first inputs while the rest are still uploading
+        with uses_dependencies():
+            with logfire.span("stream inputs"):
+                future_res = await submit_stream(
+                    lines(),
+                    program,
+                    compute_kwargs,
+                    reduced_only,
+                    queue,
+                    settings.max_stream_inputs or settings.max_batch_inputs,
+                    headers,
+                )
+            return _save_submission(
+                future_res,
+                token,
+                program,
+                queue,
+                n_bytes,
+                callback_url,
+                callback_output,
             )
-        future_res = group(
-            signature_from_input(program, inp, compute_kwargs) for inp in inp_obj
-        ).apply_async(queue=queue)
 
-    else:
-        future_res = signature_from_input(program, inp_obj, compute_kwargs).apply_async(
-            queue=queue
+    # The body is read here rather than declared as a parameter so oversized
+    # submissions are rejected before any input is validated. Its schema is added to
+    # the OpenAPI docs in main.py.
+    too_large = HTTPException(
+        status_code=status_codes.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Request body cannot exceed {settings.max_compute_body_bytes} bytes",
+    )
+    if int(request.headers.get("content-length", 0)) > settings.max_compute_body_bytes:
+        raise too_large
+    with logfire.span("read body"):
+        body = await request.body()
+    if len(body) > settings.max_compute_body_bytes:
+        raise too_large
+    with logfire.span("validate inputs", body_bytes=len(body)):
+        inp_obj = parse_program_inputs(body, settings.max_batch_inputs)
+        check_bigchem_inputs(program, inp_obj)
+
+    # Guarded here rather than by dependencies so invalid bodies get 413/422 even
+    # while the breakers are open
+    with uses_dependencies():
+        with logfire.span("publish tasks"):
+            if micro_batchable(program, inp_obj):
+                # Tiny inputs run back to back in shared worker tasks
+                future_res = submit_micro_batches(
+                    program, inp_obj, compute_kwargs, queue, headers
+                )
+
+            elif isinstance(inp_obj, list):
+                future_res = group(
+                    signature_from_input(program, inp, compute_kwargs, reduced_only)
+                    for inp in inp_obj
+                ).apply_async(queue=queue, headers=headers)
+
+            else:
+                future_res = signature_from_input(
+                    program, inp_obj, compute_kwargs, reduced_only
+                ).apply_async(queue=queue, headers=headers)
+
+        return _save_submission(
+            future_res, token, program, queue, len(body), callback_url, callback_output
         )
 
+
+def _save_submission(
+    future_res: AsyncResult | GroupResult,
+    token: dict[str, Any],
+    program: SupportedPrograms,
+    queue: Optional[str],
+    n_bytes: int,
+    callback_url: Optional[str],
+    callback_output: bool,
+) -> str:
+    """Save the DAG (and webhook) and record the usage of a submitted computation.
+
+    Returns:
+        The id of the computation.
+    """
     # Save result structure to DB so can be rehydrated using only id
-    save_dag(future_res)
+    max_age = result_max_age(token.get("scope", "").split())
+    with logfire.span("save DAG"):
+        save_dag(future_res, max_age, token["sub"])
+    n_inputs = len(future_res.results) if isinstance(future_res, GroupResult) else 1
+    with logfire.span("record usage"):
+        record_usage(
+            bigchem_app.backend.client,
+            token["sub"],
+            program.value,
+            {UsageMetric.SUBMITTED: n_inputs, UsageMetric.INPUT_BYTES: n_bytes},
+            queue=queue or bigchem_app.conf.task_default_queue,
+        )
+    if callback_url is not None:
+        webhook = Webhook(url=callback_url, include_output=callback_output)
+        webhook_dispatcher.register(future_res, webhook, max_age)
+    queue_monitor.watch(queue)
     return future_res.id
 
 
+@router.get(
+    "/jobs",
+    dependencies=[Depends(uses_backend)],
+    response_description="A page of your computations, most recent first.",
+)
+async def jobs(
+    token: dict[str, Any] = Security(bearer_auth, scopes=["compute:public"]),
+    limit: int = Query(
+        100, ge=1, le=settings.max_jobs_page, description="Most jobs to return."
+    ),
+    cursor: Optional[str] = Query(
+        None,
+        description=(
+            "next_cursor of the previous page to continue from; omit for the most "
+            "recent jobs."
+        ),
+    ),
+) -> JobPage:
+    """List the ids and statuses of the computations you submitted.
+
+    Results that were deleted or expired are not listed, so a page may hold fewer jobs
+    than limit. Keep requesting pages until next_cursor is null.
+    """
+    return list_jobs(token["sub"], limit, cursor)
+
+
 @router.get(
     # NOTE: "/compute" prefix is prepended in top level main.py file
     "/output/{task_id}",
     response_model=ProgramOutputWrapper,  # type: ignore
     response_description="A compute task's status and (if complete) return value.",
+    dependencies=[Depends(uses_backend)],
 )
 async def result(
     task_id: str = Path(
         ...,
         title="The task id to query.",
-        pattern=r"[0-9a-f]{8}\-[0-9a-f]{4}\-4[0-9a-f]{3}\-[89ab][0-9a-f]{3}\-[0-9a-f]{12}",
+        pattern=TASK_ID_PATTERN,
+    ),
+    encoding: OutputEncoding = Query(
+        OutputEncoding.FULL,
+        description=(
+            "full for complete ProgramOutputs; compact to send input_data fields "
+            "repeated across a group's outputs (structure, model, files, etc.) once in "
+            '"shared", referenced as {"$ref": index}.'
+        ),
     ),
-) -> ProgramOutputWrapper:
+) -> Response:
     """Retrieve a task's status and output (if complete)."""
-    # Check for result in backend
+    key = _cache_key(task_id, encoding)
     try:
-        future_res = restore_result(task_id)
+        # Concurrent polls of the task in this process share one backend read
+        body, _ = await result_reads.do(key, _read_result, task_id, encoding)
     except ResultNotFoundError:  # Result already deleted from backend
+        # May have been deleted or expired through another server process
+        _uncache(task_id)
         raise HTTPException(
             status_code=status_codes.HTTP_410_GONE,
             detail="Result has already been deleted from server",
         )
-    if future_res.ready():
-        task_status = (
-            TaskStatus.SUCCESS if future_res.successful() else TaskStatus.FAILURE
+    return Response(content=body, media_type="application/json")
+
+
+def _read_result(task_id: str, encoding: OutputEncoding) -> tuple[bytes, bool]:
+    """Encoded /compute/output response of a task and whether the task has finished.
+
+    Raises:
+        ResultNotFoundError if the result was deleted or has expired.
+    """
+    # Check for result in backend; accessing a result extends its lifetime
+    with logfire.span("check result"):
+        touch_result(task_id)
+
+    # Serve previously encoded terminal responses
+    cached = result_cache.get(_cache_key(task_id, encoding))
+    if cached is not None:
+        return cached, True
+
+    with logfire.span("restore result"):
+        future_res = restore_result(task_id)
+
+    with logfire.span("read outputs"):
+        task_status, progress, prog_output = get_outputs(future_res)
+    if prog_output is None:  # Not finished
+        return encode_output_response(task_status, None, progress), False
+    # If only one result, return it directly instead of a list
+    prog_output = prog_output[0] if len(prog_output) == 1 else prog_output
+
+    # Encode once, without a pydantic round trip, and reuse the bytes for every later
+    # request
+    encode = (
+        encode_compact_output_response
+        if encoding == OutputEncoding.COMPACT
+        else encode_output_response
+    )
+    with logfire.span("encode outputs", encoding=encoding.value):
+        body = encode(task_status, prog_output, progress)
+    result_cache.set(_cache_key(task_id, encoding), body)
+    return body, True
+
+
+@router.get(
+    "/output/{task_id}/arrays",
+    dependencies=[Depends(uses_backend)],
+    response_model=ArraysWrapper,
+    responses={
+        200: {
+            "content": {"application/octet-stream": {}},
+            "description": (
+                "ArraysWrapper, or for format=npz a numpy .npz archive once the task "
+                "has finished."
+            ),
+        }
+    },
+)
+async def arrays(
+    task_id: str = Path(
+        ...,
+        title="The task id to query.",
+        pattern=TASK_ID_PATTERN,
+    ),
+    quantities: list[ArrayQuantity] = Query(
+        [ArrayQuantity.ENERGY], description="The quantities to extract."
+    ),
+    format: ArrayFormat = Query(
+        ArrayFormat.JSON,
+        description=(
+            "json for lists in an ArraysWrapper; npz for a numpy .npz archive of dense "
+            "arrays with NaN for missing values."
+        ),
+    ),
+) -> ArraysWrapper | Response:
+    """Retrieve chosen quantities of a task's (or all of a group's) outputs as arrays.
+
+    Returns only the quantities rather than full ProgramOutputs, e.g., one energy per
+    input of a scan. Until the task finishes its status is returned as JSON in either
+    format.
+    """
+    try:
+        touch_result(task_id)
+        future_res = restore_result(task_id)
+    except ResultNotFoundError:
+        raise HTTPException(
+            status_code=status_codes.HTTP_410_GONE,
+            detail="Result has already been deleted from server",
+        )
+
+    task_status, progress, outputs = get_outputs(future_res)
+    if outputs is None:  # Not finished
+        return ArraysWrapper(status=task_status, progress=progress)
+
+    extracted = extract_arrays(outputs, quantities)
+    if format == ArrayFormat.JSON:
+        return ArraysWrapper(status=task_status, arrays=extracted, progress=progress)
+
+    try:
+        stacked = stack_arrays(extracted)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status_codes.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)
+        )
+    buffer = BytesIO()
+    np.savez(buffer, **stacked)
+    return Response(
+        content=buffer.getvalue(),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="{task_id}.npz"'},
+    )
+
+
+@router.post(
+    "/output/{task_id}/cancel",
+    dependencies=[Depends(uses_broker), Depends(uses_backend)],
+    response_description="How many of the task's computations were cancelled.",
+)
+async def cancel(
+    task_id: str = Path(
+        ...,
+        title="The task id to cancel.",
+        pattern=TASK_ID_PATTERN,
+    ),
+    stop_running: bool = Query(
+        False,
+        description=(
+            "Also stop running optimizations after their current step. Their output "
+            "is a failure containing the trajectory so far. Only applies to "
+            "optimizations whose trajectory can be streamed."
+        ),
+    ),
+) -> CancelReport:
+    """Cancel a task's (or all of a group's) computations that have not started."""
+    try:
+        future_res = restore_result(task_id)
+    except ResultNotFoundError:
+        raise HTTPException(
+            status_code=410, detail="Result has already been deleted from server"
+        )
+    report = cancel_result(future_res, stop_running)
+    if settings.webhook_secret:
+        # Queued tasks marked REVOKED are not published to the webhook dispatcher
+        webhook_dispatcher.request_check(task_id)
+    return report
+
+
+async def _stream_trajectory(task_id: str) -> AsyncIterator[bytes]:
+    """Yield newly published steps of an optimization until its trajectory ends"""
+    start = 0
+    while True:
+        steps, ended = await run_in_threadpool(read_trajectory, task_id, start)
+        if steps:
+            yield b"\n".join(steps) + b"\n"
+            start += len(steps)
+        if ended:
+            return
+        await asyncio.sleep(settings.trajectory_poll_interval)
+
+
+@router.get(
+    "/output/{task_id}/trajectory",
+    dependencies=[Depends(uses_backend)],
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "content": {
+                NDJSON_MEDIA_TYPE: {"schema": TrajectoryStep.model_json_schema()}
+            },
+            "description": "One TrajectoryStep per line, sent as each step completes.",
+        }
+    },
+)
+async def trajectory(
+    task_id: str = Path(
+        ...,
+        title="The task id of the optimization.",
+        pattern=TASK_ID_PATTERN,
+    ),
+    index: int = Query(
+        0, ge=0, description="Index of the optimization in a batch submission."
+    ),
+) -> StreamingResponse:
+    """Stream the steps of a running optimization as they complete.
+
+    Steps are streamed for geomeTRIC optimizations on servers with trajectory streaming
+    enabled. The stream ends when the optimization finishes; it is empty for other
+    computations.
+    """
+    try:
+        future_res = restore_result(task_id)
+    except ResultNotFoundError:
+        raise HTTPException(
+            status_code=410, detail="Result has already been deleted from server"
+        )
+    tasks = getattr(future_res, "results", [future_res])
+    if index >= len(tasks):
+        raise HTTPException(
+            status_code=status_codes.HTTP_400_BAD_REQUEST,
+            detail=f"Index must be less than the number of inputs ({len(tasks)})",
         )
-        prog_output = []
-        # Get list of AsyncResult objects or single AsyncResult object in a list
-        frs = getattr(future_res, "results", [future_res])
-        for fr in frs:
-            try:
-                prog_output.append(fr.get())
-            except QCOPBaseError as e:
-                prog_output.append(e.program_output)
-        # If only one result, return it directly instead of a list
-        prog_output = prog_output[0] if len(prog_output) == 1 else prog_output
-
-    else:
-        task_status = TaskStatus.PENDING
-        prog_output = None
-    return ProgramOutputWrapper(status=task_status, program_output=prog_output)
+    return StreamingResponse(
+        _stream_trajectory(tasks[index].id), media_type=NDJSON_MEDIA_TYPE
+    )
 
 
 @router.delete(
     "/output/{task_id}",
     status_code=status_codes.HTTP_202_ACCEPTED,
+    dependencies=[Depends(uses_backend)],
 )
 async def delete(
     background_tasks: BackgroundTasks,
     task_id: str = Path(
         ...,
         title="The task id to delete.",
-        pattern=r"[0-9a-f]{8}\-[0-9a-f]{4}\-4[0-9a-f]{3}\-[89ab][0-9a-f]{3}\-[0-9a-f]{12}",
+        pattern=TASK_ID_PATTERN,
     ),
+    token: dict[str, Any] = Security(bearer_auth, scopes=["compute:public"]),
 ) -> None:
     """Delete a task's result from the server."""
     try:
@@ -148,5 +582,25 @@ async def delete(
         raise HTTPException(
             status_code=410, detail="Result has already been deleted from server"
         )
+    _uncache(task_id)
     # Asynchronously delete result from backend
-    background_tasks.add_task(delete_result, future_res)
+    background_tasks.add_task(delete_result, future_res, token["sub"])
+
+
+@router.post(
+    "/output/bulk-delete",
+    dependencies=[Depends(uses_backend)],
+    response_description="Whether each task's result was deleted or already gone.",
+)
+async def bulk_delete(
+    task_ids: list[Annotated[str, StringConstraints(pattern=TASK_ID_PATTERN)]] = Body(
+        ...,
+        description="The task ids to delete.",
+        max_length=settings.max_bulk_delete_ids,
+    ),
+    token: dict[str, Any] = Security(bearer_auth, scopes=["compute:public"]),
+) -> dict[str, DeleteStatus]:
+    """Delete many tasks' results from the server."""
+    for task_id in task_ids:
+        _uncache(task_id)
+    return delete_results(task_ids, token["sub"])
@@ -1,5 +1,5 @@
 # Later in your Python code, you can format the string as follows:
-# formatted_dashboard_html = dashboard_html.format(email='your_email_here')
+# formatted_dashboard_html = dashboard_html.format(email='your_email_here', jobs='')
 
 dashboard_html = """
 <html>
@@ -116,6 +116,15 @@ dashboard_html = """
             <li>If you need to change your password, please logout, then click "Dashboard", then click "Forgot Password".</li>
         </ul>
     </div>
+    <div class="container">
+        <h3>Recent Jobs</h3>
+        <ul>
+            {jobs}
+        </ul>
+    </div>
 </body>
 </html>
 """
+
+# One <li> of dashboard_html's jobs per job
+job_html = "<li><code>{task_id}</code> {submitted_at:%Y-%m-%d %H:%M} UTC: {status}</li>"
@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Response
+from fastapi import status as status_codes
+
+from chemcloud_server.health import health_monitor
+from chemcloud_server.models import Readiness
+
+router = APIRouter()
+
+
+@router.get("/live")
+async def live() -> str:
+    """Liveness probe: the server process is responding."""
+    return "ok"
+
+
+@router.get(
+    "/ready",
+    responses={503: {"model": Readiness, "description": "Server is not ready."}},
+)
+async def ready(response: Response) -> Readiness:
+    """Readiness probe: the broker, result backend and JSON Web Keys are reachable.
+
+    Reports the latest background probe of each dependency rather than probing on
+    request, so frequent polling adds no load on them.
+    """
+    readiness = health_monitor.readiness()
+    if not readiness.ready:
+        response.status_code = status_codes.HTTP_503_SERVICE_UNAVAILABLE
+    return readiness
@@ -1,18 +1,47 @@
 import json
-from typing import Any, Optional
+import math
+from collections import Counter
+from time import time
+from typing import Any, AsyncIterator, Iterator, Optional
 
 import httpx
-from bigchem.algos import parallel_frequency_analysis
+import numpy as np
 from bigchem.app import bigchem as bigchem_app
-from bigchem.canvas import Signature
+from bigchem.canvas import Signature, group
+from bigchem.config import settings as bigchem_settings
 from bigchem.tasks import compute
+from celery import states
+from celery.exceptions import TaskRevokedError
 from celery.result import AsyncResult, GroupResult, ResultBase, result_from_tuple
+from celery.utils import uuid
 from fastapi import HTTPException
-from qcio import CalcType, DualProgramInput, ProgramInput
+from fastapi import status as status_codes
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+from pydantic_core import from_json, to_json
+from qcio import CalcType, DualProgramInput, ProgramInput, ProgramOutput
+from qcop.exceptions import QCOPBaseError
 
 from chemcloud_server import config, models
+from chemcloud_server.algos import parallel_frequency_analysis, parallel_gradient
 from chemcloud_server.exceptions import ResultNotFoundError
-from chemcloud_server.models import ProgramInputs
+from chemcloud_server.models import (
+    ArrayQuantity,
+    ProgramInputs,
+    ProgramInputsOrList,
+    ProgramOutputOrList,
+    Progress,
+    TaskStatus,
+    program_inputs_adapter,
+    program_inputs_list_adapter,
+)
+from chemcloud_server.tasks import (
+    compute_batch,
+    compute_optimization,
+    stop_key,
+    task_meta,
+    trajectory_key,
+)
 
 settings = config.get_settings()
 
@@ -69,47 +98,937 @@ async def _auth0_token_request(
     )
 
 
-def save_dag(result: AsyncResult | GroupResult) -> None:
+def result_max_age(scopes: list[str]) -> Optional[int]:
+    """Maximum seconds results submitted with the given token scopes are kept.
+
+    Users holding several scopes in settings.result_max_age_by_scope get the longest
+    max age. None if no scope has a max age.
+    """
+    max_ages = [
+        settings.result_max_age_by_scope[scope]
+        for scope in scopes
+        if scope in settings.result_max_age_by_scope
+    ]
+    return max(max_ages) if max_ages else None
+
+
+def _result_ttl(expires_at: Optional[float]) -> Optional[int]:
+    """Seconds to keep a result from now; None if it should be kept until deleted.
+
+    Results are kept settings.result_ttl seconds after their last access but never
+    beyond expires_at, the end of their max age. Workers that do not import
+    chemcloud_server.tasks store task results for BigChem's result_expires, so
+    without settings.chemcloud_worker_tasks results are kept at most that long; a DAG
+    outliving its tasks' results would report them PENDING forever.
+    """
+    ttls = [settings.result_ttl] if settings.result_ttl else []
+    if not settings.chemcloud_worker_tasks and bigchem_settings.bigchem_result_expires:
+        ttls.append(bigchem_settings.bigchem_result_expires)
+    if expires_at is not None:
+        ttls.append(math.ceil(expires_at - time()))
+    return min(ttls) if ttls else None
+
+
+def save_dag(
+    result: AsyncResult | GroupResult,
+    max_age: Optional[int] = None,
+    owner: Optional[str] = None,
+) -> None:
     """Save DAG of result (including parents) to backend.
 
     This makes it possible to just return the result id from the compute endpoint for
     GroupResult objects and rehydrate the DAG later using just the result id.
+
+    Params:
+        result: The result of a submitted task or group.
+        max_age: Seconds after which the result expires even if it is still accessed.
+        owner: User who submitted result; adds result to the user's jobs (see
+            list_jobs).
     """
-    result.backend.set(result.id, json.dumps(result.as_tuple()))
+    now = time()
+    expires_at = now + max_age if max_age else None
+    # The DAG is written before the index entry; sweep_results relies on the order
+    with bigchem_app.backend.client.pipeline(transaction=False) as pipe:
+        pipe.set(
+            result.id,
+            json.dumps({"dag": result.as_tuple(), "expires_at": expires_at}),
+            ex=_result_ttl(expires_at),
+        )
+        if owner is not None:
+            pipe.zadd(jobs_key(owner), {result.id: now})
+        pipe.execute()
 
 
-def restore_result(result_id: str) -> AsyncResult | GroupResult:
+def restore_result(
+    result_id: str, refresh_ttl: bool = False
+) -> AsyncResult | GroupResult:
     """Restore result (including parents) from backend
 
+    Params:
+        result_id: The id of the result.
+        refresh_ttl: Restart the expiration clock of the DAG and all its results.
+
+    Raises:
+        ResultNotFoundError if DAG not found in backend or the result has exceeded its
+            max age.
+    """
+    dag = bigchem_app.backend.get(result_id)
+    if dag is None:
+        raise ResultNotFoundError(result_id)
+    result, expires_at = _load_dag(dag)
+
+    if refresh_ttl:
+        ttl = _result_ttl(expires_at)
+        if ttl is not None and ttl <= 0:
+            delete_result(result)
+            raise ResultNotFoundError(result_id)
+        if ttl is not None:
+            with bigchem_app.backend.client.pipeline(transaction=False) as pipe:
+                for key in [result_id, *_data_keys(result)]:
+                    pipe.expire(key, ttl)
+                pipe.execute()
+    return result
+
+
+def _refreshed_key(result_id: str) -> str:
+    """Backend key marking that a result's expiration clock was restarted recently"""
+    return f"chemcloud-refreshed-{result_id}"
+
+
+def touch_result(result_id: str) -> None:
+    """Check that a result exists and restart its expiration clock if it is due.
+
+    The clock of the DAG and all its results is restarted (see restore_result) at most
+    once per settings.result_refresh_interval, across server processes; other calls
+    cost one backend round trip whatever the size of the result.
+
+    Raises:
+        ResultNotFoundError if DAG not found in backend or the result has exceeded its
+            max age.
+    """
+    interval = settings.result_refresh_interval
+    if not interval:
+        restore_result(result_id, refresh_ttl=True)
+        return
+    with bigchem_app.backend.client.pipeline(transaction=False) as pipe:
+        pipe.exists(result_id)
+        pipe.set(_refreshed_key(result_id), 1, nx=True, ex=interval)
+        exists, due = pipe.execute()
+    if not exists:
+        raise ResultNotFoundError(result_id)
+    if due:
+        restore_result(result_id, refresh_ttl=True)
+
+
+def _load_dag(dag: str | bytes) -> tuple[AsyncResult | GroupResult, Optional[float]]:
+    """Rehydrate a result from a DAG written by save_dag; return it and its expires_at
+
+    DAGs saved before expiration support was added are the bare result tuple.
+    """
+    record = json.loads(dag)
+    if isinstance(record, list):
+        return result_from_tuple(record, app=bigchem_app), None
+    return result_from_tuple(record["dag"], app=bigchem_app), record["expires_at"]
+
+
+def get_task_metas(results: list[AsyncResult]) -> list[dict[str, Any]]:
+    """Fetch the stored status and return value of many tasks in one backend request.
+
+    Tasks with nothing stored yet are reported as PENDING, as celery does.
+    """
+    backend = bigchem_app.backend
+    values = backend.mget([backend.get_key_for_task(result.id) for result in results])
+    return [
+        backend.decode_result(value)
+        if value is not None
+        else {"status": states.PENDING, "result": None}
+        for value in values
+    ]
+
+
+def _progress_key(result_id: str) -> str:
+    """Backend key of the states of the finished tasks of a group"""
+    return f"chemcloud-progress-{result_id}"
+
+
+def webhook_key(result_id: str) -> str:
+    """Backend key of the webhook registered for a result"""
+    return f"chemcloud-webhook-{result_id}"
+
+
+def jobs_key(user: str) -> str:
+    """Backend key of the sorted set of a user's result ids, scored by submission time"""
+    return f"chemcloud-jobs-{user}"
+
+
+def _group_status(task_states: list[str]) -> TaskStatus:
+    """Status of a group from the states of its tasks.
+
+    SUCCESS, FAILURE or REVOKED (if any task was cancelled) once all tasks have
+    finished; otherwise the most advanced state of any task, counting finished tasks as
+    STARTED.
+    """
+    if all(state in states.READY_STATES for state in task_states):
+        if TaskStatus.REVOKED in task_states:
+            return TaskStatus.REVOKED
+        if all(state == TaskStatus.SUCCESS for state in task_states):
+            return TaskStatus.SUCCESS
+        return TaskStatus.FAILURE
+    for status in (TaskStatus.STARTED, TaskStatus.RETRY, TaskStatus.RECEIVED):
+        if status in task_states:
+            return status
+    if any(state in states.READY_STATES for state in task_states):
+        return TaskStatus.STARTED
+    return TaskStatus.PENDING
+
+
+def get_statuses(
+    results: list[AsyncResult | GroupResult],
+) -> list[tuple[TaskStatus, Optional[Progress]]]:
+    """Status and progress (None for single tasks) of many results.
+
+    Uses three backend requests however many results there are. The states of finished
+    group members never change, so they are recorded in a hash per group in the
+    backend the first time they are seen. Later calls read the hash and fetch only the
+    members still outstanding instead of every member of the group. The hash expires
+    with the group's DAG.
+
+    Progress is derived on read rather than from a counter incremented by workers as
+    tasks finish: stock BigChem workers run no ChemCloud code, workers cannot tell
+    which saved group a task belongs to (micro-batch and NDJSON groups get their ids
+    from the server; members of BigChem groups are chords), and tasks that finish
+    without running (revoked while queued, lost workers) would never be counted. The
+    outstanding members' states are small, since they hold no outputs.
+    """
+    client = bigchem_app.backend.client
+    groups = [r for r in results if isinstance(r, GroupResult)]
+    with client.pipeline(transaction=False) as pipe:
+        for result in groups:
+            pipe.hgetall(_progress_key(result.id))
+            pipe.ttl(result.id)
+        replies = pipe.execute()
+
+    finished: dict[str, dict[int, str]] = {}
+    ttls: dict[str, int] = {}
+    tasks: list[AsyncResult] = []
+    for result, recorded, ttl in zip(groups, replies[::2], replies[1::2]):
+        finished[result.id] = {int(i): state.decode() for i, state in recorded.items()}
+        ttls[result.id] = ttl
+    outstanding: dict[str, list[int]] = {}
+    for result in results:
+        if isinstance(result, GroupResult):
+            done = finished[result.id]
+            outstanding[result.id] = [
+                i for i in range(len(result.results)) if i not in done
+            ]
+            tasks.extend(result.results[i] for i in outstanding[result.id])
+        else:
+            tasks.append(result)
+    # One request for the outstanding tasks of all results
+    task_states = iter([meta["status"] for meta in get_task_metas(tasks)])
+
+    statuses: list[tuple[TaskStatus, Optional[Progress]]] = []
+    with client.pipeline(transaction=False) as pipe:
+        for result in results:
+            if not isinstance(result, GroupResult):
+                status = TaskStatus(next(task_states))
+                if status in states.READY_STATES and status not in (
+                    TaskStatus.SUCCESS,
+                    TaskStatus.REVOKED,
+                ):
+                    status = TaskStatus.FAILURE
+                statuses.append((status, None))
+                continue
+            done = finished[result.id]
+            running = []
+            newly_finished = {}
+            for i in outstanding[result.id]:
+                state = next(task_states)
+                if state in states.READY_STATES:
+                    newly_finished[i] = state
+                else:
+                    running.append(state)
+            if newly_finished:
+                key = _progress_key(result.id)
+                pipe.hset(key, mapping=newly_finished)
+                if ttls[result.id] > 0:  # -1: DAG kept until deleted
+                    pipe.expire(key, ttls[result.id])
+                done.update(newly_finished)
+            statuses.append(
+                (
+                    _group_status([*done.values(), *running]),
+                    Progress(n_completed=len(done), n_total=len(result.results)),
+                )
+            )
+        pipe.execute()
+    return statuses
+
+
+def get_group_progress(result: GroupResult) -> tuple[TaskStatus, Progress]:
+    """Status and progress of a group, checking only tasks not yet known to be done."""
+    status, progress = get_statuses([result])[0]
+    assert progress is not None  # for mypy
+    return status, progress
+
+
+def _parse_jobs_cursor(cursor: str) -> tuple[float, bytes]:
+    """Submission time and task id of the last job of a page from its next_cursor.
+
     Raises:
-        ResultNotFoundError if DAG not found in backend
+        HTTPException(422) if cursor is not a next_cursor.
     """
+    invalid = HTTPException(
+        status_code=status_codes.HTTP_422_UNPROCESSABLE_ENTITY,
+        detail=f"Invalid cursor '{cursor}'",
+    )
+    score, _, task_id = cursor.partition(":")
     try:
-        return result_from_tuple(
-            json.loads(bigchem_app.backend.get(result_id)), app=bigchem_app
+        submitted_at = float(score)
+    except ValueError:
+        raise invalid
+    if not math.isfinite(submitted_at):  # Redis rejects nan and inf bounds
+        raise invalid
+    return submitted_at, task_id.encode()
+
+
+def list_jobs(user: str, limit: int, cursor: Optional[str] = None) -> models.JobPage:
+    """A page of the results user submitted, most recent first.
+
+    Reads limit entries of the user's jobs (see save_dag) listed after cursor, their
+    DAGs and their statuses with a fixed number of backend requests, independent of the
+    number of jobs the user has. Entries whose DAG was deleted or expired are removed
+    from the jobs, so a page may hold fewer than limit jobs.
+
+    Jobs are ordered by submission time, then by task id, as the sorted set orders them.
+    The cursor holds both of the last job of a page, so jobs submitted at the same time
+    are neither skipped nor repeated across pages.
+
+    Params:
+        user: The user whose jobs to list.
+        limit: Most jobs on the page.
+        cursor: next_cursor of the previous page; None for the most recent jobs.
+
+    Raises:
+        HTTPException(422) if cursor is not a next_cursor.
+    """
+    client = bigchem_app.backend.client
+    key = jobs_key(user)
+    if cursor is None:
+        entries = client.zrevrangebyscore(
+            key, "+inf", "-inf", start=0, num=limit + 1, withscores=True
         )
-    except TypeError:
-        raise ResultNotFoundError(result_id)
+    else:
+        score, last_id = _parse_jobs_cursor(cursor)
+        with client.pipeline(transaction=False) as pipe:
+            # Jobs submitted at the same time as the last one; rarely more than one
+            pipe.zrevrangebyscore(key, repr(score), repr(score), withscores=True)
+            pipe.zrevrangebyscore(
+                key, f"({score!r}", "-inf", start=0, num=limit + 1, withscores=True
+            )
+            same_time, earlier = pipe.execute()
+        entries = [e for e in same_time if e[0] < last_id] + earlier
+    next_cursor = None
+    if len(entries) > limit:
+        last_id, score = entries[limit - 1]
+        next_cursor = f"{score!r}:{last_id.decode()}"
+    entries = entries[:limit]
+    dags = client.mget([task_id for task_id, _ in entries]) if entries else []
+
+    gone = [task_id for (task_id, _), dag in zip(entries, dags) if dag is None]
+    if gone:
+        client.zrem(key, *gone)
+    found = [
+        (task_id.decode(), submitted_at, _load_dag(dag)[0])
+        for (task_id, submitted_at), dag in zip(entries, dags)
+        if dag is not None
+    ]
+    statuses = get_statuses([result for _, _, result in found])
+    return models.JobPage(
+        jobs=[
+            models.JobSummary(
+                task_id=task_id,
+                submitted_at=submitted_at,
+                status=status,
+                progress=progress,
+            )
+            for (task_id, submitted_at, _), (status, progress) in zip(found, statuses)
+        ],
+        next_cursor=next_cursor,
+    )
+
+
+def read_trajectory(task_id: str, start: int) -> tuple[list[bytes], bool]:
+    """Steps published by an optimization task from index start on and whether it ended.
+
+    Steps are encoded models.TrajectorySteps. A trajectory ends when the worker marks it
+    complete or, for tasks that publish no steps or whose worker died, when the task
+    has finished.
+    """
+    steps = bigchem_app.backend.client.lrange(trajectory_key(task_id), start, -1)
+    if steps and steps[-1] == b"":  # Marked complete by the worker
+        return steps[:-1], True
+    if not steps:
+        meta = get_task_metas([AsyncResult(task_id, app=bigchem_app)])[0]
+        return [], meta["status"] in states.READY_STATES
+    return steps, False
+
+
+def encode_output_response(
+    status: TaskStatus,
+    program_output: Optional[ProgramOutputOrList],
+    progress: Optional[Progress] = None,
+) -> bytes:
+    """Encode the JSON body of a ProgramOutputWrapper without validating its contents.
+
+    ProgramOutputs returned by the workers are already valid, so each one is serialized
+    directly by pydantic-core and spliced into the wrapper. The result is identical to
+    ProgramOutputWrapper(
+        status=status, program_output=program_output, progress=progress
+    ).model_dump_json()
+    """
+    if isinstance(program_output, list):
+        encoded = b"[" + b",".join(to_json(po) for po in program_output) + b"]"
+    else:
+        encoded = to_json(program_output)
+    return b'{"status":"%s","program_output":%s,"progress":%s}' % (
+        status.value.encode(),
+        encoded,
+        to_json(progress),
+    )
+
+
+# Key of the objects that stand in for shared input_data fields in compact responses
+SHARED_REF = "$ref"
+
+
+def _shareable_fields(inp: Any) -> dict[str, bytes]:
+    """Encoded values of the fields of inp that hold non-empty objects or lists.
+
+    Each field is encoded through inp so its field serializers apply, e.g., qcio's
+    base64 encoding of binary files.
+    """
+    encoded = {}
+    for name in type(inp).model_fields:
+        value = getattr(inp, name)
+        if isinstance(value, BaseModel) or (isinstance(value, (dict, list)) and value):
+            # Strip {"name": ... } from the encoded single-field object
+            encoded[name] = to_json(inp, include={name})[len(name) + 4 : -1]
+    return encoded
+
+
+def encode_compact_output_response(
+    status: TaskStatus,
+    program_output: Optional[ProgramOutputOrList],
+    progress: Optional[Progress] = None,
+) -> bytes:
+    """Encode a ProgramOutputWrapper with input_data fields shared across outputs.
+
+    Fields of the input_data of a group's outputs that are objects or lists
+    (structure, model, keywords, files, etc.) and that are identical in more than one
+    output are encoded once in a top-level "shared" list. Each output refers to them
+    as {"$ref": i}, the index in "shared". Other fields are encoded as by
+    encode_output_response, and expand_shared_refs() restores its response. Single
+    outputs have nothing to share and "shared" is empty.
+    """
+    outputs = program_output if isinstance(program_output, list) else []
+    fields = [
+        _shareable_fields(po.input_data) if po is not None else {} for po in outputs
+    ]
+    counts = Counter(
+        value for output_fields in fields for value in output_fields.values()
+    )
+    shared: dict[bytes, int] = {}  # Encoded value -> index in "shared"
+
+    def encode(po: Any, output_fields: dict[str, bytes]) -> bytes:
+        if po is None:
+            return b"null"
+        members = [
+            b'"%s":{"%s":%d}'
+            % (
+                name.encode(),
+                SHARED_REF.encode(),
+                shared.setdefault(value, len(shared)),
+            )
+            if counts[value] > 1
+            else b'"%s":%s' % (name.encode(), value)
+            for name, value in output_fields.items()
+        ]
+        rest = to_json(po.input_data, exclude=set(output_fields))
+        if rest != b"{}":
+            members.append(rest[1:-1])
+        output = to_json(po, exclude={"input_data"})
+        return b'{"input_data":{%s},%s' % (b",".join(members), output[1:])
+
+    if isinstance(program_output, list):
+        encoded = b"[" + b",".join(map(encode, outputs, fields)) + b"]"
+    else:
+        encoded = to_json(program_output)
+    return b'{"status":"%s","program_output":%s,"progress":%s,"shared":[%s]}' % (
+        status.value.encode(),
+        encoded,
+        to_json(progress),
+        b",".join(shared),
+    )
+
+
+def expand_shared_refs(response: dict[str, Any]) -> dict[str, Any]:
+    """Replace the references of a decoded compact response with the shared values.
+
+    Modifies response in place, removing "shared", so it holds the data of the
+    ProgramOutputWrapper it encodes.
+    """
+    shared = response.pop("shared", [])
+    if isinstance(response.get("program_output"), list):
+        for output in response["program_output"]:
+            if output is None:
+                continue
+            inp = output["input_data"]
+            for name, value in inp.items():
+                if isinstance(value, dict) and value.keys() == {SHARED_REF}:
+                    inp[name] = shared[value[SHARED_REF]]
+    return response
+
+
+def get_outputs(
+    result: AsyncResult | GroupResult,
+) -> tuple[TaskStatus, Optional[Progress], Optional[list[Optional[ProgramOutput]]]]:
+    """Return the status of result and, once it has finished, its outputs.
+
+    Returns:
+        The status of the task or group, its progress (None for single tasks), and
+            the ProgramOutput of each task in submission order if the result is ready
+            or None if it is not. Outputs of cancelled tasks are None.
+    """
+    if isinstance(result, GroupResult):
+        # Only checks children not already known to be finished
+        task_status, progress = get_group_progress(result)
+        if task_status not in states.READY_STATES:
+            return task_status, progress, None
+        # One backend round trip for all children instead of one per child
+        metas = get_task_metas(result.results)
+    else:
+        progress = None
+        metas = get_task_metas([result])
+        task_status = TaskStatus(metas[0]["status"])
+        if task_status not in states.READY_STATES:
+            return task_status, progress, None
+        if task_status not in (TaskStatus.SUCCESS, TaskStatus.REVOKED):
+            task_status = TaskStatus.FAILURE
+
+    outputs = []
+    for meta in metas:
+        value = meta["result"]
+        if isinstance(value, QCOPBaseError):
+            outputs.append(value.program_output)
+        elif isinstance(value, TaskRevokedError):  # Cancelled
+            outputs.append(None)
+        elif isinstance(value, BaseException):
+            raise value
+        else:
+            outputs.append(value)
+    return task_status, progress, outputs
+
+
+def extract_arrays(
+    outputs: list[Optional[ProgramOutput]], quantities: list[ArrayQuantity]
+) -> dict[str, list[Any]]:
+    """Extract quantities from the results of outputs in a single pass.
+
+    Returns:
+        A list per quantity with one value per output, plus "success" with whether
+            each output succeeded. Values are None where an output is missing or lacks
+            the quantity.
+    """
+    arrays: dict[str, list[Any]] = {"success": []}
+    arrays.update((quantity.value, []) for quantity in quantities)
+    for output in outputs:
+        arrays["success"].append(output.success if output is not None else None)
+        results = output.results if output is not None else None
+        for quantity in quantities:
+            value = getattr(results, quantity.value, None)
+            arrays[quantity.value].append(
+                np.asarray(value).tolist() if value is not None else None
+            )
+    return arrays
+
+
+def stack_arrays(arrays: dict[str, list[Any]]) -> dict[str, np.ndarray]:
+    """Stack the lists of extract_arrays into dense arrays, one row per output.
+
+    Missing values become NaN ("success" is False for missing outputs).
+
+    Raises:
+        ValueError if the values of a quantity have different shapes, e.g., gradients
+            of different molecules.
+    """
+    stacked = {"success": np.array([bool(value) for value in arrays["success"]])}
+    for name, values in arrays.items():
+        if name == "success":
+            continue
+        present = {
+            i: np.asarray(value, dtype=float)
+            for i, value in enumerate(values)
+            if value is not None
+        }
+        shapes = {value.shape for value in present.values()}
+        if len(shapes) > 1:
+            raise ValueError(f"Values of '{name}' have different shapes: {shapes}")
+        array = np.full((len(values), *(shapes.pop() if shapes else ())), np.nan)
+        for i, value in present.items():
+            array[i] = value
+        stacked[name] = array
+    return stacked
+
+
+def _decode_json(body: bytes, *loc: int) -> Any:
+    """Decode JSON, raising RequestValidationError located under loc in the body"""
+    try:
+        return from_json(body)
+    except ValueError as e:
+        raise RequestValidationError(
+            [
+                {
+                    "type": "json_invalid",
+                    "loc": ("body", *loc),
+                    "msg": "JSON decode error",
+                    "input": {},
+                    "ctx": {"error": str(e)},
+                }
+            ]
+        )
+
+
+def _validation_errors(e: ValidationError, *loc: str | int) -> RequestValidationError:
+    """RequestValidationError with the errors of e located under loc in the body"""
+    return RequestValidationError(
+        [
+            {**error, "loc": ("body", *loc, *error["loc"])}
+            for error in e.errors(include_url=False)
+        ]
+    )
+
+
+def expand_compact_batch(batch: models.CompactBatch) -> list[ProgramInputs]:
+    """Validate the inputs of a compact batch, resolving references to shared values.
+
+    Each shared value is validated once per field it is used for; later inputs
+    referring to it reuse the validated value, e.g., the same Structure object.
+
+    Raises:
+        RequestValidationError if an input is invalid or refers to a missing value.
+    """
+    validated: dict[tuple[str, int], Any] = {}  # (field, index) -> validated value
+    inputs = []
+    for i, overrides in enumerate(batch.inputs):
+        data = {**batch.defaults, **overrides}
+        refs = {}
+        for name, value in data.items():
+            if not (isinstance(value, dict) and value.keys() == {SHARED_REF}):
+                continue
+            index = value[SHARED_REF]
+            if not isinstance(index, int) or not 0 <= index < len(batch.shared):
+                raise RequestValidationError(
+                    [
+                        {
+                            "type": "value_error",
+                            "loc": ("body", "inputs", i, name),
+                            "msg": f"No shared value at index {index!r}",
+                            "input": value,
+                            "ctx": {"error": "invalid reference"},
+                        }
+                    ]
+                )
+            refs[name] = index
+            data[name] = validated.get((name, index), batch.shared[index])
+        try:
+            inp = program_inputs_adapter.validate_python(data)
+        except ValidationError as e:
+            raise _validation_errors(e, "inputs", i)
+        for name, index in refs.items():
+            validated.setdefault((name, index), getattr(inp, name))
+        inputs.append(inp)
+    return inputs
+
+
+def parse_program_inputs(body: bytes, max_inputs: int) -> ProgramInputsOrList:
+    """Decode and validate a /compute request body.
+
+    The body is an input, a list of inputs or a models.CompactBatch, which is expanded
+    to a list. The number of inputs is checked after decoding but before any input is
+    validated so oversized batches are rejected cheaply.
+
+    Raises:
+        HTTPException(413) if the body contains more than max_inputs inputs.
+        RequestValidationError if the body is not valid JSON or not valid inputs.
+    """
+    data = _decode_json(body)
+
+    too_many = HTTPException(
+        status_code=status_codes.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Cannot submit more than {max_inputs} inputs at once",
+    )
+    try:
+        if isinstance(data, list):
+            if len(data) > max_inputs:  # Check for too many inputs
+                raise too_many
+            return program_inputs_list_adapter.validate_python(data)
+        if isinstance(data, dict) and "inputs" in data:
+            if isinstance(data["inputs"], list) and len(data["inputs"]) > max_inputs:
+                raise too_many
+            return expand_compact_batch(models.CompactBatch.model_validate(data))
+        return program_inputs_adapter.validate_python(data)
+    except ValidationError as e:
+        raise _validation_errors(e)
+
+
+async def iter_lines(
+    chunks: AsyncIterator[bytes], max_line_bytes: int
+) -> AsyncIterator[bytes]:
+    """Yield the non-blank lines of a newline-delimited body as they arrive.
+
+    Raises:
+        HTTPException(413) if a line is longer than max_line_bytes.
+    """
+    too_long = HTTPException(
+        status_code=status_codes.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Lines of the request body cannot exceed {max_line_bytes} bytes",
+    )
+    buffer = bytearray()
+    async for chunk in chunks:
+        if b"\n" not in chunk:  # Don't split a long line again for every chunk
+            buffer += chunk
+            if len(buffer) > max_line_bytes:
+                raise too_long
+            continue
+        *lines, rest = (buffer + chunk).split(b"\n")
+        for line in lines:
+            if len(line) > max_line_bytes:
+                raise too_long
+            if line.strip():
+                yield bytes(line)
+        buffer = rest
+        if len(buffer) > max_line_bytes:
+            raise too_long
+    if buffer.strip():
+        yield bytes(buffer)
+
+
+async def submit_stream(
+    lines: AsyncIterator[bytes],
+    program: models.SupportedPrograms,
+    compute_kwargs: dict[str, Any],
+    reduced_only: bool = False,
+    queue: Optional[str] = None,
+    max_inputs: Optional[int] = None,
+    headers: Optional[dict[str, str]] = None,
+) -> GroupResult:
+    """Validate and submit one input per line as the lines arrive.
+
+    Each input is published as soon as it is validated (or, for micro-batched
+    programs, as soon as a batch is full), so workers start on the first inputs while
+    later ones are still being uploaded. Only the task ids of submitted inputs are
+    kept. If the upload fails, e.g., because a line is invalid or the client
+    disconnects, the inputs already submitted are cancelled.
+
+    Params:
+        max_inputs: Most lines accepted.
+        headers: Headers of the task messages, e.g., usage.usage_headers.
+
+    Returns:
+        A GroupResult with one AsyncResult per input, in order, as if the inputs had
+            been submitted as a list.
+
+    Raises:
+        RequestValidationError if a line is not a valid input or there are no lines.
+        HTTPException(413) if there are more than max_inputs lines.
+        HTTPException(422) if a line is not a valid input for the BigChem program.
+    """
+    results: list[AsyncResult] = []
+    batch: list[ProgramInputs] = []  # Inputs of the micro-batch being filled
+    batched = micro_batchable(program, batch)
+    try:
+        async for line in lines:
+            if max_inputs is not None and len(results) + len(batch) >= max_inputs:
+                raise HTTPException(
+                    status_code=status_codes.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"Cannot submit more than {max_inputs} inputs at once",
+                )
+            index = len(results) + len(batch)
+            try:
+                inp = program_inputs_adapter.validate_python(_decode_json(line, index))
+            except ValidationError as e:
+                raise _validation_errors(e, index)
+            check_bigchem_inputs(program, inp)
+            if not batched:
+                sig = signature_from_input(program, inp, compute_kwargs, reduced_only)
+                results.append(sig.apply_async(queue=queue, headers=headers))
+                continue
+            batch.append(inp)
+            if len(batch) == settings.micro_batch_size:
+                submitted = submit_micro_batches(
+                    program, batch, compute_kwargs, queue, headers
+                )
+                results.extend(submitted.results)
+                batch.clear()
+        if batch:
+            submitted = submit_micro_batches(
+                program, batch, compute_kwargs, queue, headers
+            )
+            results.extend(submitted.results)
+    except BaseException:
+        if results:
+            cancel_result(GroupResult(uuid(), results, app=bigchem_app))
+        raise
+    if not results:
+        raise RequestValidationError(
+            [
+                {
+                    "type": "too_short",
+                    "loc": ("body",),
+                    "msg": "At least one input is required",
+                    "input": "",
+                    "ctx": {"field_type": "Body", "min_length": 1, "actual_length": 0},
+                }
+            ]
+        )
+    return GroupResult(uuid(), results, app=bigchem_app)
 
 
 def signature_from_input(
     program: models.SupportedPrograms,
     inp_obj: ProgramInputs,
     compute_kwargs: dict[str, Any],
+    reduced_only: bool = False,
 ) -> Signature:
-    """Return the celery signature for a compute task"""
+    """Return the celery signature for a compute task
+
+    Params:
+        reduced_only: For BigChem algorithms, collect stdout, files and wavefunctions
+            only for the reduced result.
+    """
     if program == models.SupportedPrograms.BIGCHEM:
-        # Does not support compute_kwargs yet
         assert isinstance(inp_obj, DualProgramInput)  # for mypy
-        return compute_bigchem(inp_obj)
+        return compute_bigchem(inp_obj, compute_kwargs, reduced_only)
+    elif program == models.SupportedPrograms.GEOMETRIC and settings.stream_trajectories:
+        # Publishes each step of the optimization for streaming
+        return compute_optimization.s(program.value, inp_obj, **compute_kwargs)
     else:
         # Must pass program.value to underlying functions so BigChem doesn't try to
         # deserialize ChemCloud.SupportedPrograms enum.
         return compute.s(program.value, inp_obj, **compute_kwargs)
 
 
+def micro_batchable(program: models.SupportedPrograms, inp_obj: Any) -> bool:
+    """Whether inp_obj is a list of inputs to run in batches with compute_batch"""
+    return (
+        settings.chemcloud_worker_tasks
+        and program.value in settings.micro_batch_programs
+        and isinstance(inp_obj, list)
+    )
+
+
+def submit_micro_batches(
+    program: models.SupportedPrograms,
+    inputs: list[ProgramInputs],
+    compute_kwargs: dict[str, Any],
+    queue: Optional[str] = None,
+    headers: Optional[dict[str, str]] = None,
+) -> GroupResult:
+    """Submit inputs in batches of settings.micro_batch_size compute_batch tasks.
+
+    Params:
+        headers: Headers of the task messages, e.g., usage.usage_headers.
+
+    Returns:
+        A GroupResult with one AsyncResult per input, in order, as if each input had
+            been submitted as its own compute task.
+    """
+    task_ids = [uuid() for _ in inputs]
+    size = settings.micro_batch_size
+    group(
+        compute_batch.s(
+            program.value,
+            inputs[i : i + size],
+            task_ids[i : i + size],
+            **compute_kwargs,
+        )
+        for i in range(0, len(inputs), size)
+    ).apply_async(queue=queue, headers=headers)
+    return GroupResult(
+        uuid(),
+        [AsyncResult(task_id, app=bigchem_app) for task_id in task_ids],
+        app=bigchem_app,
+    )
+
+
+def bigchem_calctypes() -> set[CalcType]:
+    """Calctypes the BigChem program supports with the current settings"""
+    # TODO: Maybe add "frequencies" later if I want to disambiguate from hessian
+    calctypes = {CalcType.hessian}
+    if settings.chemcloud_worker_tasks:
+        # Reduced on the workers by tasks in chemcloud_server.tasks
+        calctypes.add(CalcType.gradient)
+    return calctypes
+
+
+def _unsupported_calctype(calctype: CalcType) -> str:
+    """Error message for a calctype the BigChem program does not support"""
+    if calctype == CalcType.gradient:
+        return (
+            "BigChem gradients require the chemcloud_worker_tasks setting, which is "
+            "disabled on this server"
+        )
+    supported = ", ".join(sorted(c.value for c in bigchem_calctypes()))
+    return (
+        f"Calctype '{calctype.value}' not supported by BigChem. Supported calctypes: "
+        f"{supported}"
+    )
+
+
+def _bigchem_input_error(inp: Any) -> Optional[str]:
+    """Why compute_bigchem cannot build the algorithm of inp; None if it can"""
+    if not isinstance(inp, DualProgramInput):
+        return (
+            "BigChem requires a DualProgramInput naming the subprogram that computes "
+            "each displacement"
+        )
+    if inp.calctype not in bigchem_calctypes():
+        return _unsupported_calctype(inp.calctype)
+    # Gradients take only dh; hessian keywords also go to geomeTRIC's
+    # frequency_analysis on the workers
+    if inp.calctype == CalcType.gradient and set(inp.keywords) - {"dh"}:
+        unknown = ", ".join(sorted(set(inp.keywords) - {"dh"}))
+        return f"Keywords not supported for BigChem gradients: {unknown}. Supported: dh"
+    dh = inp.keywords.get("dh")
+    if dh is not None and (
+        isinstance(dh, bool) or not isinstance(dh, (int, float)) or dh <= 0
+    ):
+        return "Keyword 'dh' must be a positive number"
+    return None
+
+
+def check_bigchem_inputs(
+    program: models.SupportedPrograms, inp_obj: ProgramInputsOrList
+) -> None:
+    """Check that every input for the BigChem program can be run by it.
+
+    Raises:
+        HTTPException(422) if an input is not a DualProgramInput or its calctype or
+            keywords are not supported.
+    """
+    if program != models.SupportedPrograms.BIGCHEM:
+        return
+    for inp in inp_obj if isinstance(inp_obj, list) else [inp_obj]:
+        if (error := _bigchem_input_error(inp)) is not None:
+            raise HTTPException(
+                status_code=status_codes.HTTP_422_UNPROCESSABLE_ENTITY, detail=error
+            )
+
+
 def compute_bigchem(
     inp_obj: DualProgramInput,
+    compute_kwargs: Optional[dict[str, Any]] = None,
+    reduced_only: bool = False,
 ) -> Signature:
     """Top level function for parallelized BigChem algorithms
 
@@ -119,16 +1038,23 @@ def compute_bigchem(
     Params:
         inp_obj: DualProgramInput with BigChem as the primary program and a QC program
             for gradients specified as the subprogram.
+        compute_kwargs: kwargs for qcop.compute passed to every subprogram calculation.
+            propagate_wfn seeds every displacement with the wavefunction of the
+            original geometry; this requires settings.chemcloud_worker_tasks and is
+            ignored otherwise.
+        reduced_only: Collect stdout, files and wavefunctions only for the reduced
+            result rather than for every displacement.
 
-        NOTE: Keywords for the parallel_hessian and frequency_analysis functions are
-            passed as DualProgramInput.keywords.
+        NOTE: Keywords for the parallel_hessian and frequency_analysis functions (or
+            parallel_gradient) are passed as DualProgramInput.keywords.
     """
-    # TODO: Maybe add "frequencies" later if I want to disambiguate from hessian
-    SUPPORTED_CALCTYPES = {CalcType.hessian}
-    assert inp_obj.calctype in SUPPORTED_CALCTYPES, (
-        f"Calctype '{inp_obj.calctype}' not supported. Supported calctypes include: "
-        f"{SUPPORTED_CALCTYPES}"
-    )
+    if (error := _bigchem_input_error(inp_obj)) is not None:
+        raise ValueError(error)
+
+    compute_kwargs = dict(compute_kwargs or {})
+    if not settings.chemcloud_worker_tasks:
+        # Seeding displacements runs in chemcloud_server.tasks
+        compute_kwargs.pop("propagate_wfn", None)
 
     # Construct program input
     prog_inp = ProgramInput(
@@ -138,23 +1064,169 @@ def compute_bigchem(
     )
 
     # Construct BigChem algorithm (returns Signature)
-    if inp_obj.calctype == CalcType.hessian:
-        # Running hessian calculation as parallel_frequency_analysis because
-        # I haven't added "frequencies" as a calctype. Maybe unnecessary and
-        # always do hessian as frequencies?
-        return parallel_frequency_analysis(
-            inp_obj.subprogram, prog_inp, **inp_obj.keywords
-        )
-    # NOTE: This case is not currently used
-    else:
-        return parallel_frequency_analysis(
-            inp_obj.subprogram, prog_inp, **inp_obj.keywords
+    if inp_obj.calctype == CalcType.gradient:
+        # Numerical gradient from displaced energies
+        return parallel_gradient(
+            inp_obj.subprogram,
+            prog_inp,
+            compute_kwargs=compute_kwargs,
+            reduced_only=reduced_only,
+            **inp_obj.keywords,
         )
+    # Running hessian calculation as parallel_frequency_analysis because
+    # I haven't added "frequencies" as a calctype. Maybe unnecessary and
+    # always do hessian as frequencies?
+    return parallel_frequency_analysis(
+        inp_obj.subprogram,
+        prog_inp,
+        compute_kwargs=compute_kwargs,
+        reduced_only=reduced_only,
+        **inp_obj.keywords,
+    )
 
 
-def delete_result(result: ResultBase) -> None:
-    """Delete Celery result(s) from backend"""
-    # Remove computation DAG
-    result.backend.delete(result.id)
-    # Remove all results and parents
-    result.forget()
+# States of tasks that have not started running and can still be revoked
+CANCELLABLE_STATES = frozenset({states.PENDING, states.RECEIVED, states.RETRY})
+
+# Max keys removed by a single DEL command when deleting results
+DELETE_BATCH_SIZE = 1000
+
+
+def _iter_results(result: ResultBase) -> Iterator[ResultBase]:
+    """Yield result and every result in its DAG (group members and parents)"""
+    yield result
+    for child in getattr(result, "results", None) or []:
+        yield from _iter_results(child)
+    if result.parent is not None:
+        yield from _iter_results(result.parent)
+
+
+def _result_keys(result: ResultBase) -> list[bytes]:
+    """Backend keys of result and of every result in its DAG"""
+    backend = bigchem_app.backend
+    return [
+        backend.get_key_for_group(r.id)
+        if isinstance(r, GroupResult)
+        else backend.get_key_for_task(r.id)
+        for r in _iter_results(result)
+    ]
+
+
+def _data_keys(result: ResultBase) -> list[str | bytes]:
+    """Backend keys of all data kept for result: results, progress, webhook, etc."""
+    return [
+        _progress_key(result.id),
+        webhook_key(result.id),
+        *_result_keys(result),
+        *(
+            trajectory_key(r.id)
+            for r in _iter_results(result)
+            if not isinstance(r, GroupResult)
+        ),
+    ]
+
+
+def _delete_keys(pipe, keys: list[str | bytes]) -> None:
+    """Queue deletion of keys on pipe in batches of DELETE_BATCH_SIZE"""
+    for i in range(0, len(keys), DELETE_BATCH_SIZE):
+        pipe.delete(*keys[i : i + DELETE_BATCH_SIZE])
+
+
+def delete_result(result: ResultBase, owner: Optional[str] = None) -> None:
+    """Delete DAG and all Celery results (group members and parents) from backend.
+
+    Also removes result from the jobs of owner, if given. Entries left in the jobs of
+    other users are removed when their jobs are next listed or swept.
+    """
+    with bigchem_app.backend.client.pipeline(transaction=False) as pipe:
+        _delete_keys(pipe, [result.id, *_data_keys(result)])
+        if owner is not None:
+            pipe.zrem(jobs_key(owner), result.id)
+        pipe.execute()
+
+
+def delete_results(
+    task_ids: list[str], owner: Optional[str] = None
+) -> dict[str, models.DeleteStatus]:
+    """Delete many results and their DAGs from backend using pipelined requests.
+
+    Also removes the results from the jobs of owner, if given.
+
+    Returns:
+        Dict mapping each task id to DELETED, or GONE if its DAG was not found (i.e.,
+        it was already deleted).
+    """
+    task_ids = list(dict.fromkeys(task_ids))  # Drop duplicates, preserve order
+    if not task_ids:
+        return {}
+    backend = bigchem_app.backend
+    result_keys: list[str | bytes] = []
+    for task_id, dag in zip(task_ids, backend.mget(task_ids)):
+        if dag is not None:
+            result_keys.extend(_data_keys(_load_dag(dag)[0]))
+
+    with backend.client.pipeline(transaction=False) as pipe:
+        # One DEL per DAG so the reply says whether each task still existed
+        for task_id in task_ids:
+            pipe.delete(task_id)
+        _delete_keys(pipe, result_keys)
+        if owner is not None:
+            pipe.zrem(jobs_key(owner), *task_ids)
+        replies = pipe.execute()
+
+    return {
+        task_id: models.DeleteStatus.DELETED if n_deleted else models.DeleteStatus.GONE
+        for task_id, n_deleted in zip(task_ids, replies)
+    }
+
+
+def cancel_result(
+    result: ResultBase, stop_running: bool = False
+) -> models.CancelReport:
+    """Revoke all tasks of result (group members and parents) that have not started.
+
+    Workers discard revoked tasks when they receive them. Tasks still waiting in the
+    queue are also marked REVOKED in the backend right away, without overwriting any
+    state a worker stores in the meantime, so their status is correct before a worker
+    reaches them. Running tasks are not interrupted unless stop_running is set, in which
+    case running optimizations that publish their trajectory stop after their current
+    step.
+    """
+    backend = bigchem_app.backend
+    tasks = [r for r in _iter_results(result) if not isinstance(r, GroupResult)]
+    task_states = [meta["status"] for meta in get_task_metas(tasks)]
+    cancelled = [
+        task.id
+        for task, state in zip(tasks, task_states)
+        if state in CANCELLABLE_STATES
+    ]
+    queued = [
+        task.id for task, state in zip(tasks, task_states) if state == states.PENDING
+    ]
+    n_finished = sum(state in states.READY_STATES for state in task_states)
+
+    if cancelled:
+        bigchem_app.control.revoke(cancelled)
+    if stop_running:
+        with backend.client.pipeline(transaction=False) as pipe:
+            for task, state in zip(tasks, task_states):
+                if state == states.STARTED:
+                    pipe.set(stop_key(task.id), 1, ex=backend.expires or None)
+            pipe.execute()
+    if queued:
+        exc = backend.prepare_exception(TaskRevokedError("Cancelled by user"))
+        with backend.client.pipeline(transaction=False) as pipe:
+            for task_id in queued:
+                pipe.set(
+                    backend.get_key_for_task(task_id),
+                    backend.encode(task_meta(task_id, states.REVOKED, exc)),
+                    ex=backend.expires,
+                    nx=True,  # Keep any state a worker stored since it was fetched
+                )
+            pipe.execute()
+
+    return models.CancelReport(
+        n_cancelled=len(cancelled),
+        n_running=len(tasks) - len(cancelled) - n_finished,
+        n_finished=n_finished,
+    )
@@ -71,6 +71,7 @@ async def token(
 async def auth0_callback(
     code: str,
     settings: config.Settings = Depends(config.get_settings),
+    jwks: list[dict[str, str]] = Depends(config.get_jwks),
 ) -> RedirectResponse:
     """Callback for Auth0 Authorization Code Flow"""
     # Trade username and password for token(s) from Auth0
@@ -84,7 +85,7 @@ async def auth0_callback(
     tokens = await _auth0_token_request(flow_model)
 
     # Validate Tokens
-    id_token_rsa_key = _get_matching_rsa_key(tokens["id_token"], settings.jwks)
+    id_token_rsa_key = _get_matching_rsa_key(tokens["id_token"], jwks)
     _validate_jwt(
         tokens["id_token"],
         id_token_rsa_key,
@@ -0,0 +1,82 @@
+from time import time
+from typing import Any, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Security
+from fastapi import status as status_codes
+
+from chemcloud_server.auth import bearer_auth
+from chemcloud_server.breakers import uses_backend
+from chemcloud_server.config import get_settings
+from chemcloud_server.models import SupportedPrograms, UsageReport
+from chemcloud_server.usage import get_usage
+
+settings = get_settings()
+
+router = APIRouter(dependencies=[Depends(uses_backend)])
+
+# Most buckets one request may read, e.g., a month of hourly buckets
+MAX_BUCKETS = 24 * 31
+
+
+def _time_range(start: Optional[float], end: Optional[float]) -> tuple[float, float]:
+    """Time range of a query; the last day by default.
+
+    Raises:
+        HTTPException(422) if the range is empty or spans more than MAX_BUCKETS.
+    """
+    end = time() if end is None else end
+    start = end - 24 * 3600 if start is None else start
+    if start >= end:
+        raise HTTPException(
+            status_code=status_codes.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="start must be before end",
+        )
+    if (end - start) / settings.usage_bucket_seconds > MAX_BUCKETS:
+        raise HTTPException(
+            status_code=status_codes.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Cannot query more than {MAX_BUCKETS} buckets of "
+            f"{settings.usage_bucket_seconds} seconds at once",
+        )
+    return start, end
+
+
+START = Query(None, description="Unix time to report from. Default: a day before end.")
+END = Query(None, description="Unix time to report until. Default: now.")
+
+
+@router.get("")
+async def my_usage(
+    token: dict[str, Any] = Security(bearer_auth, scopes=["compute:public"]),
+    start: Optional[float] = START,
+    end: Optional[float] = END,
+) -> UsageReport:
+    """Your computations submitted and finished, by program and time bucket."""
+    return get_usage("user", token["sub"], *_time_range(start, end))
+
+
+@router.get(
+    "/users/{user}", dependencies=[Security(bearer_auth, scopes=["usage:read"])]
+)
+async def user_usage(
+    user: str,
+    start: Optional[float] = START,
+    end: Optional[float] = END,
+) -> UsageReport:
+    """A user's computations submitted and finished, by program and time bucket."""
+    return get_usage("user", user, *_time_range(start, end))
+
+
+@router.get(
+    "/programs/{program}", dependencies=[Security(bearer_auth, scopes=["usage:read"])]
+)
+async def program_usage(
+    program: SupportedPrograms,
+    start: Optional[float] = START,
+    end: Optional[float] = END,
+) -> UsageReport:
+    """A program's computations submitted and finished by all users, by time bucket.
+
+    Reported in total ("all") and by queue ("queue:{name}") and worker
+    ("worker:{hostname}"); submissions are not attributed to a worker.
+    """
+    return get_usage("program", program.value, *_time_range(start, end))
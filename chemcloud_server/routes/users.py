@@ -1,4 +1,6 @@
 import logging
+from datetime import datetime, timezone
+from html import escape
 from typing import Optional
 
 from fastapi import APIRouter, Cookie, Depends
@@ -8,22 +10,51 @@ from jose import jwt
 from chemcloud_server import config
 from chemcloud_server.auth import _get_matching_rsa_key, _validate_jwt
 
-from .dashboard import dashboard_html
+from .dashboard import dashboard_html, job_html
+from .helpers import list_jobs
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Most recent jobs shown on the dashboard
+DASHBOARD_JOBS = 20
+
+
+def _jobs_html(user: str) -> str:
+    """List items of the user's most recent jobs for the dashboard"""
+    try:
+        page = list_jobs(user, DASHBOARD_JOBS)
+    except Exception:  # Still show the dashboard if the backend is unavailable
+        logger.exception("Could not list jobs of %s", user)
+        return "<li>Your jobs cannot be listed right now.</li>"
+    if not page.jobs:
+        return "<li>No jobs yet.</li>"
+    return "\n".join(
+        job_html.format(
+            task_id=escape(job.task_id),
+            submitted_at=datetime.fromtimestamp(job.submitted_at, timezone.utc),
+            status=job.status.value
+            + (
+                f" ({job.progress.n_completed}/{job.progress.n_total})"
+                if job.progress
+                else ""
+            ),
+        )
+        for job in page.jobs
+    )
+
 
 @router.get("/dashboard", include_in_schema=False, response_class=HTMLResponse)
 async def dashboard(
     id_token: str = Cookie(None),
     settings: config.Settings = Depends(config.get_settings),
+    jwks: list[dict[str, str]] = Depends(config.get_jwks),
 ):
     """Main User Dashboard"""
     if id_token:
         try:
-            id_token_rsa_key = _get_matching_rsa_key(id_token, settings.jwks)
+            id_token_rsa_key = _get_matching_rsa_key(id_token, jwks)
             id_payload = _validate_jwt(
                 id_token,
                 id_token_rsa_key,
@@ -39,7 +70,9 @@ async def dashboard(
         logger.info("User not logged in. Redirecting to login...")
         return RedirectResponse(f"{settings.users_prefix}/login")
 
-    return dashboard_html.format(email=id_payload["email"])
+    return dashboard_html.format(
+        email=id_payload["email"], jobs=_jobs_html(id_payload["sub"])
+    )
 
 
 @router.get(
@@ -0,0 +1,128 @@
+"""Background removal of results that no DAG refers to anymore."""
+
+import asyncio
+import logging
+from itertools import islice
+from time import time
+from typing import Iterable, Iterator, TypeVar
+
+from bigchem.app import bigchem as bigchem_app
+from fastapi.concurrency import run_in_threadpool
+
+from chemcloud_server.models import SweepReport
+from chemcloud_server.routes.helpers import (
+    DELETE_BATCH_SIZE,
+    _data_keys,
+    _load_dag,
+    jobs_key,
+)
+from chemcloud_server.tasks import trajectory_key
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# DAGs are saved under the bare task id (a UUID4); see helpers.save_dag
+DAG_KEY_PATTERN = "????????-????-4???-????-????????????"
+SWEEP_LOCK_KEY = "chemcloud-sweep-lock"
+TRAJECTORY_PREFIX = trajectory_key("").encode()
+SCAN_BATCH_SIZE = 1000
+
+
+def _batches(iterable: Iterable[T], size: int) -> Iterator[list[T]]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def sweep_results() -> SweepReport:
+    """Delete results (and trajectories) no DAG refers to that would never expire.
+
+    These orphans remain when a DAG expires while its results were stored without an
+    expiration, e.g., by workers with result_expires disabled. Orphaned results that do
+    expire are left for the backend to remove. Entries of users' jobs whose DAG expired
+    are removed too.
+
+    Results and jobs are scanned before DAGs so the DAG of any result or job seen by the
+    sweep, which is saved right after its task is submitted, is also seen.
+    """
+    start = time()
+    backend = bigchem_app.backend
+    client = backend.client
+
+    candidates: set[bytes] = set()
+    n_results = 0
+    prefixes = (backend.task_keyprefix, backend.group_keyprefix, TRAJECTORY_PREFIX)
+    for prefix in prefixes:
+        keys_iter = client.scan_iter(match=prefix + b"*", count=SCAN_BATCH_SIZE)
+        for keys in _batches(keys_iter, SCAN_BATCH_SIZE):
+            n_results += len(keys)
+            with client.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.ttl(key)
+                ttls = pipe.execute()
+            # -1: key exists without an expiration
+            candidates.update(key for key, ttl in zip(keys, ttls) if ttl == -1)
+
+    job_entries: list[tuple[bytes, bytes]] = []  # (jobs key, task id)
+    for key in client.scan_iter(match=jobs_key("*"), count=SCAN_BATCH_SIZE):
+        for task_id, _ in client.zscan_iter(key, count=SCAN_BATCH_SIZE):
+            job_entries.append((key, task_id))
+
+    n_dags = 0
+    dag_ids: set[bytes] = set()
+    dag_keys_iter = client.scan_iter(match=DAG_KEY_PATTERN, count=SCAN_BATCH_SIZE)
+    for keys in _batches(dag_keys_iter, SCAN_BATCH_SIZE):
+        n_dags += len(keys)
+        dag_ids.update(keys)
+        for dag in client.mget(keys):
+            if dag is not None:  # May have expired since the scan
+                candidates.difference_update(
+                    key.encode() if isinstance(key, str) else key
+                    for key in _data_keys(_load_dag(dag)[0])
+                )
+
+    bytes_reclaimed = 0
+    for keys in _batches(candidates, DELETE_BATCH_SIZE):
+        with client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.memory_usage(key)
+            pipe.delete(*keys)
+            *sizes, _ = pipe.execute()
+        bytes_reclaimed += sum(size or 0 for size in sizes)
+
+    gone = [(key, task_id) for key, task_id in job_entries if task_id not in dag_ids]
+    for entries in _batches(gone, DELETE_BATCH_SIZE):
+        with client.pipeline(transaction=False) as pipe:
+            for key, task_id in entries:
+                pipe.zrem(key, task_id)
+            pipe.execute()
+
+    return SweepReport(
+        n_dags=n_dags,
+        n_results=n_results,
+        n_deleted=len(candidates),
+        bytes_reclaimed=bytes_reclaimed,
+        n_jobs_removed=len(gone),
+        duration=time() - start,
+    )
+
+
+async def run_sweeper(interval: int) -> None:
+    """Sweep the backend for orphaned results every interval seconds.
+
+    A lock in the backend ensures only one server process sweeps each interval.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if bigchem_app.backend.client.set(SWEEP_LOCK_KEY, 1, nx=True, ex=interval):
+                report = await run_in_threadpool(sweep_results)
+                logger.info(
+                    "Deleted %d orphaned results, reclaiming %d bytes, in %.1f s",
+                    report.n_deleted,
+                    report.bytes_reclaimed,
+                    report.duration,
+                )
+        except Exception:  # Keep sweeping if the backend is temporarily unavailable
+            logger.exception("Sweeping orphaned results failed")
@@ -0,0 +1,313 @@
+"""Celery tasks run by BigChem workers on behalf of ChemCloud.
+
+Workers only run these tasks if they have chemcloud-server installed and import this
+module, e.g., `celery -A bigchem.tasks worker -I chemcloud_server.tasks`. Features
+that submit them are disabled by default in config.Settings.
+"""
+
+import os
+from collections import Counter
+from datetime import datetime, timezone
+from traceback import format_exc
+from typing import Any, Callable, Optional
+
+import numpy as np
+from bigchem.app import bigchem
+from bigchem.canvas import Signature, group
+from bigchem.tasks import compute
+from celery import signals, states
+from qcio import (
+    CalcType,
+    DualProgramInput,
+    OptimizationResults,
+    ProgramInput,
+    ProgramOutput,
+    SinglePointResults,
+)
+from qcop.adapters import GeometricAdapter, registry
+from qcop.exceptions import QCOPBaseError
+
+from chemcloud_server.config import keep_results_for_result_ttl
+from chemcloud_server.models import TrajectoryStep, UsageMetric
+from chemcloud_server.usage import output_usage  # Also records usage of tasks
+
+
+@signals.worker_init.connect
+def _keep_results_for_result_ttl(**kwargs) -> None:
+    """Keep results for result_ttl rather than BigChem's result_expires.
+
+    Sent before the worker creates a backend. Not done on import, since the server
+    imports this module after creating its backend.
+    """
+    keep_results_for_result_ttl(bigchem.conf)
+
+
+def trajectory_key(task_id: str) -> str:
+    """Backend key of the list of steps published by an optimization task"""
+    return f"chemcloud-trajectory-{task_id}"
+
+
+def stop_key(task_id: str) -> str:
+    """Backend key set to ask a running optimization task to stop"""
+    return f"chemcloud-stop-{task_id}"
+
+
+def task_meta(
+    task_id: str, state: str, result: Any, traceback: Optional[str] = None
+) -> dict[str, Any]:
+    """Backend meta of a task, as celery stores it for tasks run by workers"""
+    return {
+        "status": state,
+        "result": result,
+        "traceback": traceback,
+        "children": [],
+        "date_done": (
+            datetime.now(timezone.utc).isoformat()
+            if state in states.READY_STATES
+            else None
+        ),
+        "task_id": task_id,
+    }
+
+
+class OptimizationStopped(QCOPBaseError):
+    """Raised to end an optimization a user asked to stop."""
+
+
+class TrajectoryPublisher:
+    """Publish optimization steps to the backend for clients to stream.
+
+    Args:
+        task_id: The id of the task performing the optimization.
+    """
+
+    def __init__(self, task_id: str):
+        self.key = trajectory_key(task_id)
+        self.stop_key = stop_key(task_id)
+        self.n_steps = 0
+
+    def publish(self, output: ProgramOutput) -> bool:
+        """Append a step to the trajectory; return True if the task should stop."""
+        results = output.results
+        step = TrajectoryStep(
+            step=self.n_steps,
+            success=output.success,
+            geometry=output.input_data.structure.geometry.tolist(),
+            energy=getattr(results, "energy", None),
+            gradient=(
+                np.asarray(results.gradient).tolist()
+                if getattr(results, "gradient", None) is not None
+                else None
+            ),
+        )
+        stop = self._push(step.model_dump_json().encode())
+        self.n_steps += 1
+        return stop
+
+    def close(self) -> None:
+        """Mark the trajectory complete. An empty entry ends the list."""
+        self._push(b"")
+
+    def _push(self, entry: bytes) -> bool:
+        """Append entry to the trajectory; return whether a stop was requested"""
+        client = bigchem.backend.client
+        with client.pipeline(transaction=False) as pipe:
+            pipe.rpush(self.key, entry)
+            if bigchem.backend.expires:
+                pipe.expire(self.key, bigchem.backend.expires)
+            pipe.exists(self.stop_key)
+            *_, stop = pipe.execute()
+        return bool(stop)
+
+
+class StreamingGeometricAdapter(GeometricAdapter):
+    """geomeTRIC adapter calling publish with the output of each optimization step.
+
+    publish returns True to stop the optimization after the current step. The
+    ProgramOutput of a stopped optimization is a failure holding all steps so far.
+    """
+
+    def __init__(self, publish: Callable[[ProgramOutput], bool]):
+        super().__init__()
+        self.publish = publish
+
+    def _geometric_engine(self):
+        engine_cls = super()._geometric_engine()
+        publish = self.publish
+
+        class StreamingEngine(engine_cls):  # type: ignore
+            def calc_new(self, coords, *args):
+                n_steps = len(self.qcio_trajectory)
+                try:
+                    energy_and_gradient = super().calc_new(coords, *args)
+                except QCOPBaseError:
+                    # Failed steps are appended to the trajectory before raising
+                    if len(self.qcio_trajectory) > n_steps:
+                        publish(self.qcio_trajectory[-1])
+                    raise
+                if publish(self.qcio_trajectory[-1]):
+                    raise OptimizationStopped(
+                        "Optimization stopped by user.",
+                        results=OptimizationResults(trajectory=self.qcio_trajectory),
+                    )
+                return energy_and_gradient
+
+        return StreamingEngine
+
+
+# Subclassing an adapter registers it with qcop; qcop.compute must keep using the
+# original adapter, which takes no arguments
+registry[GeometricAdapter.program] = GeometricAdapter
+
+
+@bigchem.task(bind=True)
+def compute_optimization(
+    self, program: str, inp_obj: DualProgramInput, **kwargs
+) -> ProgramOutput:
+    """bigchem.tasks.compute for geomeTRIC, publishing each step as it completes.
+
+    Params:
+        program: Must be "geometric".
+        inp_obj: The optimization or transition state input.
+        kwargs: Keyword arguments for qcop.compute.
+    """
+    assert program == GeometricAdapter.program, f"Program '{program}' not supported"
+    publisher = TrajectoryPublisher(self.request.id)
+    try:
+        return StreamingGeometricAdapter(publisher.publish).compute(inp_obj, **kwargs)
+    finally:
+        publisher.close()
+
+
+@bigchem.task
+def assemble_gradient(
+    energies: list[ProgramOutput[ProgramInput, SinglePointResults]], dh: float
+) -> ProgramOutput[ProgramInput, SinglePointResults]:
+    """Assemble a gradient from finite difference energy computations.
+
+    Params:
+        energies: Energy computations alternating between a "forward" and "backward"
+            displacement of each coordinate. NOTE: The last computation on the list is
+            an energy calculation of the original geometry.
+        dh: The displacement used for the finite difference energies.
+    """
+    reference = energies.pop()
+    displaced = np.array([output.results.energy for output in energies])
+    gradient = (displaced[0::2] - displaced[1::2]) / (2 * dh)
+
+    output = reference.model_dump()
+    output["input_data"]["calctype"] = CalcType.gradient
+    output["results"]["gradient"] = gradient.reshape(-1, 3)
+    return ProgramOutput[ProgramInput, SinglePointResults](**output)
+
+
+@bigchem.task(bind=True)
+def seed_displacements(
+    self,
+    reference: ProgramOutput[ProgramInput, SinglePointResults],
+    program: str,
+    displacements: list[ProgramInput],
+    reduction: Signature,
+    compute_kwargs: dict[str, Any],
+    keep_wfn: bool = False,
+):
+    """Seed displacements with the wavefunction of reference, then compute and reduce.
+
+    Replaces itself with a chord computing all displacements in parallel, each starting
+    from the wavefunction of reference, and passing their outputs followed by
+    reference to reduction, as algos._finite_difference does without seeding.
+
+    Params:
+        reference: Output of the calculation on the original geometry, with its
+            wavefunction collected.
+        program: Compute engine to use for the displacements.
+        displacements: Displaced calculations, in the order reduction expects them.
+        reduction: Signature reducing the outputs into the final result.
+        compute_kwargs: Keyword arguments for qcop.compute for each displacement.
+        keep_wfn: Keep the wavefunction files on reference, i.e., the user asked to
+            collect them.
+    """
+    adapter = registry[program]()
+    for displacement in displacements:
+        adapter.propagate_wfn(reference, displacement)
+    if not keep_wfn:
+        as_dict = reference.model_dump()
+        as_dict["results"]["files"] = {}
+        reference = ProgramOutput[ProgramInput, SinglePointResults](**as_dict)
+
+    header = [compute.s(program, inp, **compute_kwargs) for inp in displacements]
+    # celery.accumulate passes reference through as the last item for reduction
+    header.append(self.app.tasks["celery.accumulate"].s(reference, index=0))
+    # Keep the replacement on the queue this task was submitted to
+    queue = (self.request.delivery_info or {}).get("routing_key")
+    if queue:
+        for sig in (*header, reduction):
+            sig.set(queue=queue)
+    raise self.replace(group(header) | reduction)
+
+
+@bigchem.task(bind=True, ignore_result=True)
+def compute_batch(
+    self, program: str, inputs: list[Any], task_ids: list[str], **kwargs
+) -> dict[UsageMetric, float]:
+    """Run bigchem.tasks.compute on each input back to back in this one task.
+
+    The output of each input is stored under its own id in task_ids, exactly as if it
+    had been a compute task with that id, so results are addressed and cancelled per
+    input. Before running an input its state is set to STARTED only if no state exists
+    yet; inputs cancelled while queued (REVOKED) or finished before a redelivery of
+    this task are skipped. Each output is stored in the same backend request that
+    starts the next input.
+
+    Params:
+        program: Compute engine to use for all inputs.
+        inputs: The inputs to compute, in order.
+        task_ids: The id under which to store the output of each input.
+        kwargs: Keyword arguments for qcop.compute.
+
+    Returns:
+        Usage metrics of the inputs run, for usage.record_task_usage; not stored.
+    """
+    backend = self.backend
+    client = backend.client
+    started = {"hostname": self.request.hostname, "pid": os.getpid()}
+    finished: Optional[tuple[str, bytes]] = None  # Key and meta not yet stored
+    usage: Counter[UsageMetric] = Counter()
+
+    for task_id, inp_obj in zip(task_ids, inputs):
+        key = backend.get_key_for_task(task_id)
+        with client.pipeline(transaction=False) as pipe:
+            if finished:
+                pipe.set(*finished, ex=backend.expires)
+                pipe.publish(*finished)  # As backend.set does for result consumers
+            pipe.set(
+                key,
+                backend.encode(task_meta(task_id, states.STARTED, started)),
+                ex=backend.expires,
+                nx=True,
+            )
+            claimed = pipe.execute()[-1]
+        finished = None
+        if not claimed:
+            existing = client.get(key)
+            # STARTED only if a previous delivery of this task was interrupted
+            if existing and backend.decode(existing)["status"] != states.STARTED:
+                continue
+
+        try:
+            output = compute.run(program, inp_obj, **kwargs)
+            meta = task_meta(task_id, states.SUCCESS, output)
+        except Exception as exc:
+            output = getattr(exc, "program_output", None)
+            meta = task_meta(
+                task_id, states.FAILURE, backend.prepare_exception(exc), format_exc()
+            )
+        finished = (key, backend.encode(meta))
+        usage.update(output_usage(output, len(finished[1])))
+
+    if finished:
+        with client.pipeline(transaction=False) as pipe:
+            pipe.set(*finished, ex=backend.expires)
+            pipe.publish(*finished)
+            pipe.execute()
+    return dict(usage)
@@ -0,0 +1,179 @@
+"""Per-user and per-program usage accounting aggregated in the result backend.
+
+/compute records each submission and tags its task messages with the submitting user
+and program (USER_HEADER, PROGRAM_HEADER). Workers that import chemcloud_server.tasks
+record each tagged task they finish. Records are added to counters in one hash per
+user and one per program for each time bucket of settings.usage_bucket_seconds, so
+aggregation costs a single pipelined backend request per record and reports read one
+hash per bucket. Recent records are also kept, one event each, in a capped stream.
+"""
+
+from time import monotonic, time
+from typing import Any, Literal, Optional
+
+from bigchem.app import bigchem as bigchem_app
+from celery import signals, states
+from qcio import ProgramOutput
+
+from chemcloud_server.config import get_settings
+from chemcloud_server.models import UsageBucket, UsageMetric, UsageReport
+
+settings = get_settings()
+
+# Headers of task messages naming the user and program a task was submitted for;
+# workers read them as attributes of task.request
+USER_HEADER = "chemcloud_user"
+PROGRAM_HEADER = "chemcloud_program"
+EVENTS_KEY = "chemcloud-usage-events"
+# Group of a program's usage over all queues and workers
+ALL = "all"
+
+UsageKind = Literal["user", "program"]
+
+
+def usage_key(kind: UsageKind, name: str, bucket: int) -> str:
+    """Backend key of the usage of a user or program in the bucket starting at bucket"""
+    return f"chemcloud-usage-{kind}-{name}-{bucket}"
+
+
+def bucket_start(timestamp: float) -> int:
+    """Start of the usage bucket containing timestamp"""
+    return int(
+        timestamp // settings.usage_bucket_seconds * settings.usage_bucket_seconds
+    )
+
+
+def usage_headers(user: str, program: str) -> dict[str, str]:
+    """Headers of the task messages of a submission, for workers to record usage"""
+    return {USER_HEADER: user, PROGRAM_HEADER: program}
+
+
+def record_usage(
+    client: Any,
+    user: str,
+    program: str,
+    metrics: dict[UsageMetric, float],
+    queue: Optional[str] = None,
+    worker: Optional[str] = None,
+) -> None:
+    """Add metrics to the usage of user and program in the current bucket.
+
+    The user's usage is recorded by program. The program's usage is recorded in total
+    and by queue and worker, if given.
+    """
+    if not settings.usage_retention:
+        return
+    now = time()
+    bucket = bucket_start(now)
+    user_key = usage_key("user", user, bucket)
+    program_key = usage_key("program", program, bucket)
+    groups = [ALL]
+    if queue:
+        groups.append(f"queue:{queue}")
+    if worker:
+        groups.append(f"worker:{worker}")
+
+    with client.pipeline(transaction=False) as pipe:
+        for metric, value in metrics.items():
+            pipe.hincrbyfloat(user_key, f"{program}:{metric.value}", value)
+            for group in groups:
+                pipe.hincrbyfloat(program_key, f"{group}:{metric.value}", value)
+        for key in (user_key, program_key):
+            pipe.expire(key, settings.usage_retention)
+        if settings.usage_events_max:
+            event = {"time": now, "user": user, "program": program}
+            event.update(queue=queue or "", worker=worker or "")
+            event.update((metric.value, value) for metric, value in metrics.items())
+            pipe.xadd(
+                EVENTS_KEY, event, maxlen=settings.usage_events_max, approximate=True
+            )
+        pipe.execute()
+
+
+def get_usage(kind: UsageKind, name: str, start: float, end: float) -> UsageReport:
+    """Usage of a user or program in the buckets from the one containing start to end.
+
+    Reads one hash per bucket in a single pipelined backend request.
+    """
+    buckets = range(bucket_start(start), int(end), settings.usage_bucket_seconds)
+    with bigchem_app.backend.client.pipeline(transaction=False) as pipe:
+        for bucket in buckets:
+            pipe.hgetall(usage_key(kind, name, bucket))
+        records = pipe.execute()
+
+    report = UsageReport(bucket_seconds=settings.usage_bucket_seconds, buckets=[])
+    for bucket, record in zip(buckets, records):
+        if not record:
+            continue
+        usage: dict[str, dict[UsageMetric, float]] = {}
+        for field, value in record.items():
+            group, _, metric = field.decode().rpartition(":")
+            usage.setdefault(group, {})[UsageMetric(metric)] = float(value)
+        report.buckets.append(UsageBucket(start=bucket, usage=usage))
+    return report
+
+
+def output_usage(
+    output: Optional[ProgramOutput], size: int
+) -> dict[UsageMetric, float]:
+    """Usage metrics of one finished calculation; output is None if it has none.
+
+    Args:
+        output: The calculation's output.
+        size: Bytes of the output as stored in the backend.
+    """
+    return {
+        UsageMetric.COMPLETED: 1,
+        UsageMetric.FAILED: float(output is None or not output.success),
+        UsageMetric.OUTPUT_BYTES: size,
+    }
+
+
+# Start of each tagged task running in this worker process, by task id
+_started: dict[str, float] = {}
+
+
+@signals.task_prerun.connect
+def _task_started(task_id: str, task: Any, **kwargs) -> None:
+    if getattr(task.request, USER_HEADER, None) is not None:
+        _started[task_id] = monotonic()
+
+
+def _stored_size(task: Any, task_id: str) -> int:
+    """Bytes of the result of task_id stored in the backend, without fetching it"""
+    return task.backend.client.strlen(task.backend.get_key_for_task(task_id))
+
+
+@signals.task_postrun.connect
+def record_task_usage(
+    task_id: str, task: Any, retval: Any = None, state: Optional[str] = None, **kwargs
+) -> None:
+    """Record the usage of a task finished by this worker for a ChemCloud user.
+
+    Every task counts its wall time. Tasks returning a ProgramOutput, or failing,
+    count as one calculation. Tasks running many calculations, e.g., compute_batch,
+    return the metrics of their calculations as a dict.
+
+    The backend stores the result before this signal is sent, so the size of the
+    output is read from the backend (STRLEN) rather than by encoding it again.
+    """
+    started = _started.pop(task_id, None)
+    user = getattr(task.request, USER_HEADER, None)
+    if started is None or user is None:
+        return
+    metrics = {UsageMetric.WALL_TIME: monotonic() - started}
+    if isinstance(retval, dict):
+        metrics.update(retval)
+    elif isinstance(retval, ProgramOutput):
+        metrics.update(output_usage(retval, _stored_size(task, task_id)))
+    elif state == states.FAILURE:
+        output = getattr(retval, "program_output", None)
+        metrics.update(output_usage(output, _stored_size(task, task_id)))
+    record_usage(
+        task.backend.client,
+        user,
+        getattr(task.request, PROGRAM_HEADER, None) or task.name,
+        metrics,
+        queue=(task.request.delivery_info or {}).get("routing_key"),
+        worker=task.request.hostname,
+    )
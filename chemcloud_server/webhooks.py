@@ -0,0 +1,381 @@
+"""Notifications POSTed to callback URLs registered with /compute when results finish."""
+
+import asyncio
+import hashlib
+import hmac
+import logging
+from queue import SimpleQueue
+from threading import Lock
+from time import monotonic, time
+from typing import Any, Optional
+
+import httpx
+from bigchem.app import bigchem as bigchem_app
+from celery import states
+from celery.result import AsyncResult, GroupResult
+from fastapi import HTTPException
+from fastapi import status as status_codes
+from fastapi.concurrency import run_in_threadpool
+from pydantic_core import to_json
+
+from chemcloud_server.config import get_settings
+from chemcloud_server.exceptions import ResultNotFoundError
+from chemcloud_server.models import Progress, TaskStatus, Webhook
+from chemcloud_server.routes.helpers import (
+    _result_ttl,
+    encode_output_response,
+    get_group_progress,
+    get_outputs,
+    restore_result,
+    webhook_key,
+)
+from chemcloud_server.sweeper import DAG_KEY_PATTERN, SCAN_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+SIGNATURE_HEADER = "X-ChemCloud-Signature"
+TIMESTAMP_HEADER = "X-ChemCloud-Timestamp"
+RECHECK_LOCK_KEY = "chemcloud-recheck-webhooks-lock"
+# Seconds the dispatcher waits for a published result before checking for new
+# registrations again
+POLL_TIMEOUT = 1.0
+# Responses worth retrying besides 5xx
+RETRY_STATUS_CODES = {408, 425, 429}
+
+
+def callback_allowed(url: str, allowed: list[str]) -> bool:
+    """Whether url is under one of the allowed URL prefixes.
+
+    Scheme, host and port must match exactly, so https://example.com does not allow
+    https://example.com.evil.org, and the path must start with the prefix's path.
+    """
+    try:
+        target = httpx.URL(url)
+    except httpx.InvalidURL:
+        return False
+    for prefix in map(httpx.URL, allowed):
+        if (target.scheme, target.host, target.port) == (
+            prefix.scheme,
+            prefix.host,
+            prefix.port,
+        ) and target.path.startswith(prefix.path):
+            return True
+    return False
+
+
+def check_callback_url(url: str, token: dict[str, Any]) -> None:
+    """Check that the user of token may register url as a callback URL.
+
+    Raises:
+        HTTPException(400) if webhooks are not enabled on this server.
+        HTTPException(403) if url is not in the user's allow-list.
+    """
+    if not settings.webhook_secret:
+        raise HTTPException(
+            status_code=status_codes.HTTP_400_BAD_REQUEST,
+            detail="Webhooks are not enabled on this server.",
+        )
+    if not callback_allowed(url, settings.webhook_allowed_urls.get(token["sub"], [])):
+        raise HTTPException(
+            status_code=status_codes.HTTP_403_FORBIDDEN,
+            detail=f"Callback URL '{url}' is not allowed for your account.",
+        )
+
+
+def sign(body: bytes, secret: str, timestamp: int) -> str:
+    """Hex HMAC-SHA256 of f"{timestamp}." + body, sent in the SIGNATURE_HEADER.
+
+    Receivers recompute it to check a notification came from this server, and reject
+    old timestamps to prevent replays.
+    """
+    message = str(timestamp).encode() + b"." + body
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def encode_webhook_payload(
+    task_id: str,
+    status: TaskStatus,
+    outputs: Optional[list[Any]],
+    progress: Optional[Progress],
+) -> bytes:
+    """Encode a models.WebhookPayload without validating the outputs.
+
+    As for /compute/output/{task_id}, a single output is sent on its own rather than
+    in a list.
+    """
+    if outputs is not None and len(outputs) == 1:
+        outputs = outputs[0]
+    # Splice task_id into the encoded ProgramOutputWrapper
+    return b'{"task_id":%s,%s' % (
+        to_json(task_id),
+        encode_output_response(status, outputs, progress)[1:],
+    )
+
+
+class WebhookDispatcher:
+    """Deliver the webhooks of results as soon as they finish.
+
+    register() saves a Webhook next to the DAG of a result in the backend. The server
+    process that registered it subscribes to the backend channels on which workers
+    publish the results of the tasks (or group members) it waits for, and checks the
+    result whenever one is published rather than polling. recheck() checks every
+    registered webhook, delivering those whose server process restarted or missed a
+    message.
+
+    A finished result's webhook is claimed by deleting it from the backend, so it is
+    delivered once across server processes, and its notification is queued. The queue
+    holds at most queue_size notifications and, since notifications may include
+    outputs, stops accepting them once they total queue_max_bytes; while it is full,
+    finished results stay registered until a later check.
+
+    Args:
+        secret: Key signing notifications.
+        queue_size: Maximum notifications waiting for delivery.
+        queue_max_bytes: Bytes of notification bodies waiting for delivery (claimed,
+            queued or being delivered) above which no more are claimed.
+        max_attempts: Attempts to deliver a notification before giving up.
+        retry_backoff: Seconds before the first retry; doubled for each later one.
+    """
+
+    def __init__(
+        self,
+        secret: str,
+        queue_size: int,
+        queue_max_bytes: int,
+        max_attempts: int,
+        retry_backoff: float,
+    ):
+        self.secret = secret
+        self.queue_max_bytes = queue_max_bytes
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.queue: asyncio.Queue[tuple[str, bytes]] = asyncio.Queue(queue_size)
+        # Claimed notifications not yet moved to queue by run_webhook_dispatcher
+        self.claimed: list[tuple[str, bytes]] = []
+        # Bytes of the bodies claimed and not yet delivered; updated from the thread
+        # running check() and by the senders
+        self.queued_bytes = 0
+        self._bytes_lock = Lock()
+        # Results registered or cancelled by this process, with the channels to
+        # subscribe to; handed to the thread running poll()
+        self._new: SimpleQueue[tuple[str, list[bytes]]] = SimpleQueue()
+        self._results: dict[bytes, str] = {}  # Channel -> result id
+        self._channels: dict[str, list[bytes]] = {}  # Result id -> channels
+        self._pubsub: Any = None
+
+    def register(
+        self,
+        result: AsyncResult | GroupResult,
+        webhook: Webhook,
+        max_age: Optional[int] = None,
+    ) -> None:
+        """Save webhook of result in the backend and watch result.
+
+        The webhook expires with the result's DAG unless the DAG's expiry is refreshed.
+        """
+        backend = bigchem_app.backend
+        expires_at = time() + max_age if max_age else None
+        backend.client.set(
+            webhook_key(result.id),
+            webhook.model_dump_json(),
+            ex=_result_ttl(expires_at),
+        )
+        tasks = result.results if isinstance(result, GroupResult) else [result]
+        self._new.put((result.id, [backend.get_key_for_task(t.id) for t in tasks]))
+
+    def request_check(self, result_id: str) -> None:
+        """Check result soon, e.g., after its tasks were cancelled without publishing"""
+        self._new.put((result_id, []))
+
+    def _unsubscribe(self, result_id: str) -> None:
+        channels = self._channels.pop(result_id, [])
+        for channel in channels:
+            self._results.pop(channel, None)
+        if channels:
+            self._pubsub.unsubscribe(*channels)
+
+    def check(self, result_id: str) -> None:
+        """Claim the webhook of result if result has finished and the queue has room."""
+        client = bigchem_app.backend.client
+        key = webhook_key(result_id)
+        value = client.get(key)
+        if value is None:  # Delivered by another process, deleted or expired
+            self._unsubscribe(result_id)
+            return
+        webhook = Webhook.model_validate_json(value)
+        try:
+            result = restore_result(result_id)
+        except ResultNotFoundError:
+            self._unsubscribe(result_id)
+            return
+
+        outputs = None
+        if isinstance(result, GroupResult) and not webhook.include_output:
+            # Skips fetching the outputs of the whole group
+            task_status, progress = get_group_progress(result)
+        else:
+            task_status, progress, outputs = get_outputs(result)
+        if task_status not in states.READY_STATES:
+            return
+        if (
+            self.queue.qsize() + len(self.claimed) >= self.queue.maxsize
+            or self.queued_bytes >= self.queue_max_bytes
+        ):
+            return  # Stays registered until a later check
+
+        with client.pipeline() as pipe:  # MULTI/EXEC so only one process claims it
+            pipe.get(key)
+            pipe.delete(key)
+            _, claimed = pipe.execute()
+        self._unsubscribe(result_id)
+        if claimed:
+            body = encode_webhook_payload(
+                result_id,
+                task_status,
+                outputs if webhook.include_output else None,
+                progress,
+            )
+            with self._bytes_lock:
+                self.queued_bytes += len(body)
+            self.claimed.append((webhook.url, body))
+
+    def poll(self, timeout: float) -> None:
+        """Watch newly registered results, then check the results of published tasks.
+
+        Waits up to timeout seconds for a task to be published. Results are checked
+        right after they are watched in case their tasks finished before.
+        """
+        if self._pubsub is None:
+            self._pubsub = bigchem_app.backend.client.pubsub(
+                ignore_subscribe_messages=True
+            )
+        to_check = []
+        while not self._new.empty():
+            result_id, channels = self._new.get()
+            if channels:
+                self._channels[result_id] = channels
+                self._results.update(dict.fromkeys(channels, result_id))
+                self._pubsub.subscribe(*channels)
+            to_check.append(result_id)
+        # Results are checked whatever state was published; STARTED costs one lookup
+        message = self._pubsub.get_message(timeout=timeout)
+        while message is not None:
+            if message["channel"] in self._results:
+                to_check.append(self._results[message["channel"]])
+            message = self._pubsub.get_message(timeout=0)
+        for result_id in dict.fromkeys(to_check):
+            self.check(result_id)
+
+    def recheck(self) -> None:
+        """Check the webhooks registered by all server processes."""
+        client = bigchem_app.backend.client
+        prefix = webhook_key("")
+        keys = client.scan_iter(
+            match=webhook_key(DAG_KEY_PATTERN), count=SCAN_BATCH_SIZE
+        )
+        for key in keys:
+            self.check(key.decode().removeprefix(prefix))
+
+    async def deliver(self, client: httpx.AsyncClient, url: str, body: bytes) -> bool:
+        """POST a signed notification to url, retrying failures with backoff.
+
+        Connection errors, timeouts, 5xx and RETRY_STATUS_CODES responses are retried;
+        other responses, including redirects, are final.
+
+        Returns:
+            Whether url accepted the notification with a 2xx response.
+        """
+        for attempt in range(self.max_attempts):
+            if attempt:
+                await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            timestamp = int(time())
+            headers = {
+                "content-type": "application/json",
+                TIMESTAMP_HEADER: str(timestamp),
+                SIGNATURE_HEADER: f"sha256={sign(body, self.secret, timestamp)}",
+            }
+            try:
+                response = await client.post(url, content=body, headers=headers)
+            except httpx.HTTPError as e:
+                logger.info("Webhook delivery to %s failed: %r", url, e)
+                continue
+            if response.is_success:
+                return True
+            if (
+                response.status_code < 500
+                and response.status_code not in RETRY_STATUS_CODES
+            ):
+                break
+        logger.warning(
+            "Gave up delivering webhook to %s after %d attempts", url, attempt + 1
+        )
+        return False
+
+    async def send(self, client: httpx.AsyncClient) -> None:
+        """Deliver queued notifications, one at a time, forever."""
+        while True:
+            url, body = await self.queue.get()
+            try:
+                await self.deliver(client, url, body)
+            except Exception:
+                logger.exception("Delivering webhook to %s failed", url)
+            finally:
+                with self._bytes_lock:
+                    self.queued_bytes -= len(body)
+                self.queue.task_done()
+
+
+async def run_webhook_dispatcher(
+    dispatcher: WebhookDispatcher,
+    concurrency: int,
+    timeout: float,
+    recheck_interval: float,
+) -> None:
+    """Watch results for dispatcher and deliver their notifications.
+
+    Args:
+        dispatcher: Dispatcher whose webhooks to deliver.
+        concurrency: Notifications delivered at once.
+        timeout: Seconds to wait for a callback URL to respond.
+        recheck_interval: Seconds between rechecks of all registered webhooks, done by
+            one server process at a time.
+    """
+    # Queues are bound to the event loop that first uses them
+    dispatcher.queue = asyncio.Queue(dispatcher.queue.maxsize)
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        senders = [
+            asyncio.create_task(dispatcher.send(client)) for _ in range(concurrency)
+        ]
+        last_recheck = -recheck_interval
+        try:
+            while True:
+                try:
+                    await run_in_threadpool(dispatcher.poll, POLL_TIMEOUT)
+                    if monotonic() - last_recheck >= recheck_interval:
+                        last_recheck = monotonic()
+                        if bigchem_app.backend.client.set(
+                            RECHECK_LOCK_KEY,
+                            1,
+                            nx=True,
+                            px=max(1, int(recheck_interval * 1000)),
+                        ):
+                            await run_in_threadpool(dispatcher.recheck)
+                except Exception:  # Keep going if the backend is temporarily down
+                    logger.exception("Checking results for webhooks failed")
+                    await asyncio.sleep(POLL_TIMEOUT)
+                while dispatcher.claimed:
+                    dispatcher.queue.put_nowait(dispatcher.claimed.pop(0))
+        finally:
+            for sender in senders:
+                sender.cancel()
+
+
+webhook_dispatcher = WebhookDispatcher(
+    settings.webhook_secret,
+    settings.webhook_queue_size,
+    settings.webhook_queue_max_bytes,
+    settings.webhook_max_attempts,
+    settings.webhook_retry_backoff,
+)
@@ -0,0 +1,106 @@
+"""Benchmark the compact encoding of /compute/output/{task_id} for a scan.
+
+Encodes the outputs of a group that ran one 30-atom structure with one model and
+different keywords, as a parameter scan does, with encode_output_response and
+encode_compact_output_response. Reports the size of each body and the time to encode
+it from pickled results, as stored by the BigChem workers, and to decode it on the
+client (json.loads, plus expand_shared_refs for the compact body). Outputs are
+measured with and without stdout; large stdout is not shared and dominates the body.
+
+Usage:
+    python -m scripts.benchmarks.bench_compact_outputs
+"""
+
+import json
+import pickle
+from statistics import median
+from time import perf_counter
+
+import numpy as np
+from qcio import (
+    ProgramInput,
+    ProgramOutput,
+    Provenance,
+    SinglePointResults,
+    Structure,
+)
+
+from chemcloud_server.models import TaskStatus
+from chemcloud_server.routes.helpers import (
+    encode_compact_output_response,
+    encode_output_response,
+    expand_shared_refs,
+)
+
+GROUP_SIZE = 100
+REPEATS = 20
+
+
+def _pickled_outputs(stdout: str | None) -> list[bytes]:
+    rng = np.random.default_rng(0)
+    structure = Structure(
+        symbols=["C", "H"] * 15,
+        geometry=rng.random((30, 3)) * 5,
+        connectivity=[(i, i + 1, 1.0) for i in range(29)],
+    )
+    return [
+        pickle.dumps(
+            ProgramOutput[ProgramInput, SinglePointResults](
+                input_data=ProgramInput(
+                    structure=structure,
+                    calctype="gradient",
+                    model={"method": "b3lyp", "basis": "6-31g"},
+                    keywords={"scf_damping": i / GROUP_SIZE},
+                ),
+                success=True,
+                results=SinglePointResults(
+                    energy=-76.38 - i, gradient=rng.random((30, 3))
+                ),
+                stdout=stdout,
+                provenance=Provenance(
+                    program="psi4", scratch_dir="/tmp", wall_time=3.1
+                ),
+            )
+        )
+        for i in range(GROUP_SIZE)
+    ]
+
+
+def _time(func, *args) -> float:
+    timings = []
+    for _ in range(REPEATS):
+        start = perf_counter()
+        func(*args)
+        timings.append(perf_counter() - start)
+    return median(timings)
+
+
+def _encode(encode, pickled: list[bytes]) -> bytes:
+    return encode(TaskStatus.SUCCESS, [pickle.loads(p) for p in pickled])
+
+
+if __name__ == "__main__":
+    print(
+        f"{'stdout':>7} {'encoding':>8} {'body kB':>8} {'encode ms':>10} "
+        f"{'decode ms':>10}"
+    )
+    for stdout in (None, "SCF iteration output\n" * 2000):
+        pickled = _pickled_outputs(stdout)
+        full = _encode(encode_output_response, pickled)
+        compact = _encode(encode_compact_output_response, pickled)
+        assert expand_shared_refs(json.loads(compact)) == json.loads(full)
+        for name, encode, body, decode in (
+            ("full", encode_output_response, full, json.loads),
+            (
+                "compact",
+                encode_compact_output_response,
+                compact,
+                lambda body: expand_shared_refs(json.loads(body)),
+            ),
+        ):
+            encode_ms = _time(_encode, encode, pickled) * 1e3
+            decode_ms = _time(decode, body) * 1e3
+            print(
+                f"{'yes' if stdout else 'no':>7} {name:>8} {len(body) / 1e3:>8.0f} "
+                f"{encode_ms:>10.2f} {decode_ms:>10.2f}"
+            )
@@ -0,0 +1,116 @@
+"""Benchmark decoding and validating /compute request bodies.
+
+Compares FastAPI's previous handling of the body (json.loads then validation against
+the ProgramInputsOrList union) with parse_program_inputs (pydantic-core decoding and
+cached, discriminated TypeAdapters) across batch sizes and structure sizes. Also
+times rejecting a batch one input over the limit, which previously required
+validating every input first, and compares a list of inputs with the same inputs as a
+CompactBatch that sends their structure and model once.
+
+Usage:
+    python -m scripts.benchmarks.bench_compute_ingest
+"""
+
+import json
+from statistics import median
+from time import perf_counter
+
+from fastapi import HTTPException
+from pydantic import TypeAdapter
+from qcio import ProgramInput, Structure
+
+from chemcloud_server.models import ProgramInputsOrList
+from chemcloud_server.routes.helpers import parse_program_inputs
+
+BATCH_SIZES = (1, 10, 100)
+N_ATOMS = (3, 30, 300)
+MAX_INPUTS = 100
+REPEATS = 10
+
+union_adapter = TypeAdapter(ProgramInputsOrList)
+
+
+def _prog_input(n_atoms: int) -> ProgramInput:
+    structure = Structure(
+        symbols=["C"] * n_atoms,
+        geometry=[[1.5 * i, 0.0, 0.0] for i in range(n_atoms)],
+    )
+    return ProgramInput(
+        structure=structure,
+        calctype="energy",
+        model={"method": "b3lyp", "basis": "6-31g"},
+        keywords={"maxiter": 100},
+    )
+
+
+def _body(n_inputs: int, n_atoms: int) -> bytes:
+    prog_input = _prog_input(n_atoms)
+    return json.dumps([prog_input.model_dump(mode="json")] * n_inputs).encode()
+
+
+def _compact_body(n_inputs: int, n_atoms: int) -> bytes:
+    data = _prog_input(n_atoms).model_dump(mode="json")
+    shared = [data.pop("structure"), data.pop("model")]
+    data.update(structure={"$ref": 0}, model={"$ref": 1})
+    return json.dumps({"shared": shared, "inputs": [data] * n_inputs}).encode()
+
+
+def previous_path(body: bytes):
+    return union_adapter.validate_python(json.loads(body))
+
+
+def fast_path(body: bytes):
+    return parse_program_inputs(body, MAX_INPUTS)
+
+
+def _time(func, *args) -> float:
+    timings = []
+    for _ in range(REPEATS):
+        start = perf_counter()
+        try:
+            func(*args)
+        except HTTPException:
+            pass
+        timings.append(perf_counter() - start)
+    return median(timings)
+
+
+if __name__ == "__main__":
+    print(
+        f"{'inputs':>7} {'atoms':>6} {'body kB':>8} {'previous ms':>12} {'fast ms':>8} "
+        f"{'x':>5}"
+    )
+    for n_inputs in BATCH_SIZES:
+        for n_atoms in N_ATOMS:
+            body = _body(n_inputs, n_atoms)
+            assert previous_path(body) == fast_path(body)
+            previous = _time(previous_path, body) * 1e3
+            fast = _time(fast_path, body) * 1e3
+            print(
+                f"{n_inputs:>7} {n_atoms:>6} {len(body) / 1e3:>8.1f} {previous:>12.2f} "
+                f"{fast:>8.2f} {previous / fast:>5.1f}"
+            )
+
+    body = _body(MAX_INPUTS + 1, 30)
+    previous = _time(previous_path, body) * 1e3
+    fast = _time(fast_path, body) * 1e3
+    print(
+        f"\nRejecting {MAX_INPUTS + 1} inputs ({len(body) / 1e3:.1f} kB): "
+        f"previous {previous:.2f} ms, fast {fast:.2f} ms"
+    )
+
+    print(
+        f"\n{'inputs':>7} {'atoms':>6} {'list kB':>8} {'compact kB':>11} "
+        f"{'list ms':>8} {'compact ms':>11} {'x':>5}"
+    )
+    for n_atoms in N_ATOMS:
+        body = _body(MAX_INPUTS, n_atoms)
+        compact_body = _compact_body(MAX_INPUTS, n_atoms)
+        assert fast_path(body) == fast_path(compact_body)
+        full = _time(fast_path, body) * 1e3
+        compact = _time(fast_path, compact_body) * 1e3
+        print(
+            f"{MAX_INPUTS:>7} {n_atoms:>6} {len(body) / 1e3:>8.1f} "
+            f"{len(compact_body) / 1e3:>11.1f} {full:>8.2f} {compact:>11.2f} "
+            f"{full / compact:>5.1f}"
+        )
@@ -0,0 +1,89 @@
+"""Benchmark throughput of tiny calculations with and without micro-batching.
+
+Submits the same rdkit UFF energies as one compute task per input, as /compute does
+by default, and as compute_batch tasks of increasing size, as it does for programs in
+micro_batch_programs, then waits until every input has a result. Unlike the other
+benchmarks this needs a running broker, backend and worker that imports
+chemcloud_server.tasks and has rdkit installed, e.g.:
+
+    celery -A bigchem.tasks worker -I chemcloud_server.tasks
+
+Usage:
+    python -m scripts.benchmarks.bench_micro_batching
+"""
+
+from time import perf_counter, sleep
+
+from bigchem.canvas import group
+from bigchem.tasks import compute
+from celery.result import GroupResult
+from celery.states import READY_STATES
+from qcio import ProgramInput, Structure
+
+from chemcloud_server.config import get_settings
+from chemcloud_server.models import SupportedPrograms
+from chemcloud_server.routes.helpers import get_task_metas, submit_micro_batches
+
+settings = get_settings()
+
+N_INPUTS = 500
+BATCH_SIZES = (8, 32, 128)
+COMPUTE_KWARGS = {"collect_stdout": False, "rm_scratch_dir": True}
+
+
+def _inputs() -> list[ProgramInput]:
+    structure = Structure(
+        symbols=["O", "H", "H"],
+        geometry=[[0.0, 0.0, -0.13], [0.0, -1.49, 1.03], [0.0, 1.49, 1.03]],
+        connectivity=[[0, 1, 1.0], [0, 2, 1.0]],
+    )
+    inp = ProgramInput(structure=structure, calctype="energy", model={"method": "UFF"})
+    return [inp] * N_INPUTS
+
+
+def _wait(result: GroupResult) -> None:
+    outstanding = list(result.results)
+    while outstanding:
+        metas = get_task_metas(outstanding)
+        outstanding = [
+            res
+            for res, meta in zip(outstanding, metas)
+            if meta["status"] not in READY_STATES
+        ]
+        sleep(0.05)
+
+
+def one_task_per_input(inputs: list[ProgramInput]) -> GroupResult:
+    return group(
+        compute.s(SupportedPrograms.RDKIT.value, inp, **COMPUTE_KWARGS)
+        for inp in inputs
+    ).apply_async()
+
+
+def micro_batches(inputs: list[ProgramInput]) -> GroupResult:
+    return submit_micro_batches(SupportedPrograms.RDKIT, inputs, COMPUTE_KWARGS)
+
+
+def _throughput(submit, inputs: list[ProgramInput]) -> float:
+    start = perf_counter()
+    _wait(submit(inputs))
+    return len(inputs) / (perf_counter() - start)
+
+
+def main():
+    inputs = _inputs()
+    # Warm up the worker (imports, rdkit initialization)
+    _wait(one_task_per_input(inputs[:10]))
+
+    print(f"{N_INPUTS} rdkit UFF energies")
+    print(f"{'mode':>24} {'inputs/s':>10}")
+    baseline = _throughput(one_task_per_input, inputs)
+    print(f"{'one task per input':>24} {baseline:>10.1f}")
+    for size in BATCH_SIZES:
+        settings.micro_batch_size = size
+        rate = _throughput(micro_batches, inputs)
+        print(f"{f'batches of {size}':>24} {rate:>10.1f} ({rate / baseline:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Benchmark encoding /compute/output/{task_id} responses for groups of outputs.
+
+Compares the previous path (build a validated ProgramOutputWrapper, then let FastAPI
+serialize it to a dict and json.dumps it) against encode_output_response, which
+splices each worker-produced ProgramOutput's JSON into the wrapper. Both paths start
+from pickled results, as stored by the BigChem workers, so unpickling is included.
+The previous path also made one backend request per child, which is not measured
+here; results are now fetched with a single MGET.
+
+Usage:
+    python -m scripts.benchmarks.bench_result_encoding
+"""
+
+import json
+import pickle
+from statistics import median
+from time import perf_counter
+
+from qcio import (
+    ProgramInput,
+    ProgramOutput,
+    Provenance,
+    SinglePointResults,
+    Structure,
+)
+
+from chemcloud_server.models import ProgramOutputWrapper, TaskStatus
+from chemcloud_server.routes.helpers import encode_output_response
+
+GROUP_SIZES = (1, 10, 100)
+REPEATS = 20
+
+
+def _pickled_output() -> bytes:
+    structure = Structure(
+        symbols=["O", "H", "H"],
+        geometry=[[0.0, 0.0, -0.13], [0.0, -1.49, 1.03], [0.0, 1.49, 1.03]],
+    )
+    output = ProgramOutput[ProgramInput, SinglePointResults](
+        input_data=ProgramInput(
+            structure=structure,
+            calctype="gradient",
+            model={"method": "b3lyp", "basis": "6-31g"},
+        ),
+        success=True,
+        results=SinglePointResults(
+            energy=-76.38, gradient=[[0.0, 0.0, 0.01], [0.0, 0.01, 0.0], [0.01, 0, 0]]
+        ),
+        stdout="SCF iteration output\n" * 2000,  # ~40 kB, typical of psi4/TeraChem
+        provenance=Provenance(program="psi4", scratch_dir="/tmp", wall_time=3.1),
+    )
+    return pickle.dumps(output)
+
+
+def previous_path(pickled: list[bytes]) -> bytes:
+    outputs = [pickle.loads(p) for p in pickled]
+    wrapper = ProgramOutputWrapper(
+        status=TaskStatus.SUCCESS,
+        program_output=outputs[0] if len(outputs) == 1 else outputs,
+    )
+    # FastAPI: validate against response_model, serialize to python, json.dumps
+    validated = ProgramOutputWrapper.model_validate(wrapper)
+    content = validated.model_dump(mode="json", by_alias=True)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def fast_path(pickled: list[bytes]) -> bytes:
+    outputs = [pickle.loads(p) for p in pickled]
+    return encode_output_response(
+        TaskStatus.SUCCESS, outputs[0] if len(outputs) == 1 else outputs
+    )
+
+
+def _time(func, *args) -> float:
+    timings = []
+    for _ in range(REPEATS):
+        start = perf_counter()
+        func(*args)
+        timings.append(perf_counter() - start)
+    return median(timings)
+
+
+if __name__ == "__main__":
+    pickled_output = _pickled_output()
+    print(f"{'outputs':>8} {'body MB':>8} {'previous ms':>12} {'fast ms':>8} {'x':>6}")
+    for n in GROUP_SIZES:
+        pickled = [pickled_output] * n
+        assert json.loads(previous_path(pickled)) == json.loads(fast_path(pickled))
+        size = len(fast_path(pickled)) / 1e6
+        previous = _time(previous_path, pickled) * 1e3
+        fast = _time(fast_path, pickled) * 1e3
+        print(
+            f"{n:>8} {size:>8.2f} {previous:>12.2f} {fast:>8.2f} {previous / fast:>6.1f}"
+        )
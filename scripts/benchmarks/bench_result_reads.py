@@ -0,0 +1,99 @@
+"""Benchmark many clients polling the same unfinished group in one server process.
+
+CLIENTS clients poll /compute/output/{task_id} of a group of GROUP_SIZE queued tasks
+every POLL_INTERVAL seconds, as several processes of one workflow watching the same
+job do. Reports the backend commands and the mean latency of a poll when every poll
+reads the backend (as before), when concurrent polls share a read, and when unfinished
+statuses are also reused for result_fresh_seconds.
+
+Runs against the embedded Redis server of tests/harness.py.
+
+Usage:
+    python -m scripts.benchmarks.bench_result_reads
+"""
+
+import asyncio
+import tempfile
+from statistics import fmean
+from time import perf_counter
+from uuid import uuid4
+
+import httpx
+from bigchem.app import bigchem as bigchem_app
+from celery.result import AsyncResult, GroupResult
+
+from chemcloud_server.auth import bearer_auth
+from chemcloud_server.cache import SingleFlight
+from chemcloud_server.config import get_settings
+from chemcloud_server.main import app
+from chemcloud_server.routes import compute
+from chemcloud_server.routes.helpers import delete_result, save_dag
+from tests.harness import hermetic_bigchem
+
+CLIENTS = 50
+GROUP_SIZE = 100
+POLLS = 20
+POLL_INTERVAL = 0.1
+
+
+class NoSharing:
+    """Every poll reads the backend on the event loop, as before SingleFlight"""
+
+    async def do(self, key, func, *args):
+        return func(*args)
+
+    def forget(self, key, future=None):
+        pass
+
+
+CONFIGS = {
+    "no sharing": NoSharing(),
+    "in-flight only": SingleFlight(0, reuse=lambda read: not read[1]),
+    "fresh 1 s": SingleFlight(1.0, reuse=lambda read: not read[1]),
+}
+
+
+async def _poll(client: httpx.AsyncClient, url: str) -> list[float]:
+    timings = []
+    for _ in range(POLLS):
+        start = perf_counter()
+        response = await client.get(url)
+        timings.append(perf_counter() - start)
+        response.raise_for_status()
+        await asyncio.sleep(POLL_INTERVAL)
+    return timings
+
+
+async def _run(url: str) -> float:
+    """Mean seconds per poll"""
+    transport = httpx.ASGITransport(app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+        timings = await asyncio.gather(*(_poll(client, url) for _ in range(CLIENTS)))
+    return fmean(t for client_timings in timings for t in client_timings)
+
+
+def _n_commands(backend) -> int:
+    return backend.info("stats")["total_commands_processed"]
+
+
+if __name__ == "__main__":
+    settings = get_settings()
+    app.dependency_overrides[bearer_auth] = lambda: {"sub": "bench", "scope": ""}
+    with tempfile.TemporaryDirectory() as tmp_dir, hermetic_bigchem(tmp_dir) as server:
+        # Never submitted, so its tasks stay PENDING
+        result = GroupResult(
+            str(uuid4()),
+            [AsyncResult(str(uuid4()), app=bigchem_app) for _ in range(GROUP_SIZE)],
+            app=bigchem_app,
+        )
+        save_dag(result)
+        url = f"{settings.api_v2_str}/compute/output/{result.id}"
+        print(f"{CLIENTS} clients x {POLLS} polls of a group of {GROUP_SIZE} tasks")
+        print(f"{'configuration':>15} {'commands':>9} {'ms/poll':>8}")
+        for name, reads in CONFIGS.items():
+            compute.result_reads = reads
+            n_before = _n_commands(server)
+            seconds = asyncio.run(_run(url))
+            n_commands = _n_commands(server) - n_before
+            print(f"{name:>15} {n_commands:>9} {seconds * 1e3:>8.1f}")
+        delete_result(result)
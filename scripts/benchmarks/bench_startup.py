@@ -0,0 +1,80 @@
+"""Benchmark how long a fresh server process takes to answer its first request.
+
+Each run starts a new interpreter that imports chemcloud_server.main, starts the app
+(running its lifespan) and requests /hello-world. The JSON Web Key fetch from Auth0 is
+simulated with a fixed latency. Previously get_settings() fetched the keys when the
+app was imported, so that run fetches them before importing the app; they are now
+fetched in the background after startup.
+
+Usage:
+    python -m scripts.benchmarks.bench_startup
+"""
+
+import os
+import subprocess
+import sys
+from statistics import median
+from time import time
+
+REPEATS = 5
+JWKS_LATENCY = 0.5  # Seconds; DNS, TLS handshake and request to Auth0
+
+CHILD = """
+import time
+
+import httpx
+
+def get(url, *args, **kwargs):
+    time.sleep({latency})
+    return httpx.Response(200, json={{"keys": []}}, request=httpx.Request("GET", url))
+
+httpx.get = get
+
+if {eager_jwks}:
+    from chemcloud_server.config import get_jwks
+
+    get_jwks()
+
+from fastapi.testclient import TestClient
+
+from chemcloud_server.main import app
+
+with TestClient(app) as client:
+    assert client.get("/hello-world").status_code == 200
+    print(time.time())
+"""
+
+
+def _time(eager_jwks: bool) -> float:
+    env = {
+        **os.environ,
+        "AUTH0_DOMAIN": "example.com",
+        "LOGFIRE_SEND_TO_LOGFIRE": "false",
+        "LOGFIRE_CONSOLE": "false",
+    }
+    code = CHILD.format(latency=JWKS_LATENCY, eager_jwks=eager_jwks)
+    timings = []
+    for _ in range(REPEATS):
+        # Measured up to the response; exiting waits for a background fetch
+        start = time()
+        child = subprocess.run(
+            [sys.executable, "-c", code],
+            env=env,
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        timings.append(float(child.stdout.split()[-1]) - start)
+    return median(timings)
+
+
+def main():
+    print(f"Time to first /hello-world response, JWKS latency {JWKS_LATENCY} s")
+    previous = _time(eager_jwks=True)
+    current = _time(eager_jwks=False)
+    print(f"{'keys fetched at import':>28} {previous:>8.2f} s")
+    print(f"{'keys fetched after startup':>28} {current:>8.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Benchmark the per-request overhead of tracing with logfire.
+
+Times requests to a minimal app whose route opens three child spans, as
+/compute/output/{task_id} does, without instrumentation and with instrumentation under
+the sampling configurations of config.trace_sampling. Spans are processed but not
+exported, so the network cost of sending them is not included.
+
+Usage:
+    python -m scripts.benchmarks.bench_tracing
+"""
+
+import asyncio
+from statistics import fmean
+from time import perf_counter
+
+import httpx
+import logfire
+from fastapi import FastAPI
+
+from chemcloud_server.config import Settings, trace_sampling
+
+REQUESTS = 5000
+WARMUP = 500
+
+CONFIGS = {
+    "all traces": {},
+    "head 10%": {"trace_sample_rate": 0.1},
+    "tail, 10% of fast": {"trace_background_rate": 0.1},
+    "no headers": {"trace_capture_headers": False},
+    "excluded URL": {"trace_excluded_urls": ["/output"]},
+}
+
+
+def _app(settings: Settings | None) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/output")
+    async def output() -> str:
+        for stage in ("restore result", "read outputs", "encode outputs"):
+            with logfire.span(stage):
+                pass
+        return "ok"
+
+    if settings is not None:
+        logfire.configure(
+            send_to_logfire=False,
+            console=False,
+            sampling=trace_sampling(settings),
+        )
+        logfire.instrument_fastapi(
+            app,
+            capture_headers=settings.trace_capture_headers,
+            excluded_urls=settings.trace_excluded_urls,
+        )
+    return app
+
+
+async def _time_requests(app: FastAPI) -> float:
+    transport = httpx.ASGITransport(app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+        for _ in range(WARMUP):
+            await client.get("/output")
+        timings = []
+        for _ in range(REQUESTS):
+            start = perf_counter()
+            await client.get("/output")
+            timings.append(perf_counter() - start)
+    return fmean(timings)
+
+
+def _time(app: FastAPI) -> float:
+    """Mean seconds per request"""
+    return asyncio.run(_time_requests(app))
+
+
+if __name__ == "__main__":
+    logfire.configure(send_to_logfire=False, console=False)
+    baseline = _time(_app(None))
+    print(f"{'configuration':>18} {'us/request':>11} {'overhead us':>12}")
+    print(f"{'not instrumented':>18} {baseline * 1e6:>11.0f} {0:>12.0f}")
+    for name, values in CONFIGS.items():
+        seconds = _time(_app(Settings(**values)))
+        print(f"{name:>18} {seconds * 1e6:>11.0f} {(seconds - baseline) * 1e6:>12.0f}")
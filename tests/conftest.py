@@ -2,11 +2,20 @@ from pathlib import Path
 
 import pytest
 from fastapi.testclient import TestClient
-from qcio import ProgramInput, Structure
-
+from qcio import (
+    Files,
+    ProgramInput,
+    ProgramOutput,
+    Provenance,
+    SinglePointResults,
+    Structure,
+)
+
+from chemcloud_server import breakers
 from chemcloud_server.auth import bearer_auth
 from chemcloud_server.config import get_settings
 from chemcloud_server.main import app
+from tests.harness import hermetic_bigchem
 
 
 @pytest.fixture(scope="session")
@@ -15,6 +24,23 @@ def client():
     return TestClient(app)
 
 
+@pytest.fixture(scope="module")
+def hermetic(tmp_path_factory):
+    """BigChem app using an in-memory broker, embedded Redis and a fake worker"""
+    with hermetic_bigchem(str(tmp_path_factory.mktemp("hermetic"))) as backend:
+        yield backend
+
+
+@pytest.fixture(autouse=True)
+def closed_breakers():
+    """Close the circuit breakers so an outage seen by one test fails no other"""
+    breakers.broker_breaker.reset()
+    breakers.backend_breaker.reset()
+    yield
+    breakers.broker_breaker.reset()
+    breakers.backend_breaker.reset()
+
+
 @pytest.fixture(scope="function")
 def fake_auth():
     """Fake authentication for webserver"""
@@ -84,6 +110,32 @@ def program_input(water):
     )
 
 
+@pytest.fixture
+def program_output(program_input):
+    """Successful ProgramOutput as returned by a BigChem worker"""
+    return ProgramOutput[ProgramInput, SinglePointResults](
+        input_data=program_input,
+        success=True,
+        results=SinglePointResults(
+            energy=-74.96, gradient=[[0.0, 0.0, 0.1], [0.0, 0.1, 0.0], [0.1, 0.0, 0.0]]
+        ),
+        stdout="Some stdout",
+        provenance=Provenance(program="psi4", scratch_dir="/tmp", wall_time=1.2),
+    )
+
+
+@pytest.fixture
+def failed_program_output(program_input):
+    """Failed ProgramOutput (with binary files) as returned by a BigChem worker"""
+    return ProgramOutput[ProgramInput, Files](
+        input_data=program_input,
+        success=False,
+        results=Files(files={"binary_output": b"\xc0\xbf\x00"}),
+        traceback="Traceback: something went wrong",
+        provenance=Provenance(program="psi4"),
+    )
+
+
 @pytest.fixture(scope="session")
 def settings():
     """ChemCloud application settings"""
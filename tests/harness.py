@@ -0,0 +1,134 @@
+"""Hermetic stand-ins for the broker, the result backend and BigChem workers.
+
+hermetic_bigchem() points the BigChem app at kombu's in-memory broker and an
+embedded Redis server (redislite, listening on a Unix socket in a temporary
+directory) and runs a worker in a thread of the test process. The worker runs the
+real compute tasks; only the quantum chemistry program is replaced by FakeAdapter,
+which returns deterministic outputs after a configurable latency. Tests using it need
+no broker, Redis server, worker containers or installed programs.
+"""
+
+import gc
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from bigchem.app import bigchem as bigchem_app
+from celery.contrib.testing.worker import start_worker
+from qcio import CalcType, ProgramInput, SinglePointResults
+from qcop.adapters import registry
+from qcop.adapters.base import ProgramAdapter
+from redislite import Redis
+
+import chemcloud_server.tasks  # noqa: F401 Registers the server's worker tasks
+from chemcloud_server import breakers
+
+# Seconds between the worker's checks of the in-memory broker for tasks
+POLLING_INTERVAL = 0.01
+
+# Program the fake adapter stands in for; accepted by /compute
+FAKE_PROGRAM = "psi4"
+
+# None if qcop runs the program through its QCEngine fallback
+_real_adapter = registry.get(FAKE_PROGRAM)
+
+
+class FakeAdapter(ProgramAdapter[ProgramInput, SinglePointResults]):
+    """Deterministic stand-in for a quantum chemistry program.
+
+    The energy is a function of the structure only and the gradient is all zeros, so
+    outputs are reproducible. Change latency and stdout_size to model slow or large
+    calculations.
+    """
+
+    program = FAKE_PROGRAM
+    supported_calctypes = [CalcType.energy, CalcType.gradient]
+    latency: float = 0.0  # Seconds per calculation
+    stdout_size: int = 0  # Characters of stdout per calculation
+
+    def program_version(self, stdout: Optional[str] = None) -> str:
+        return "fake"
+
+    def compute_results(
+        self, inp_obj: ProgramInput, update_func=None, update_interval=None, **kwargs
+    ) -> tuple[SinglePointResults, str]:
+        if self.latency:
+            threading.Event().wait(self.latency)
+        structure = inp_obj.structure
+        energy = -float(sum(structure.atomic_numbers)) - float(
+            abs(structure.geometry).sum()
+        )
+        gradient = (
+            [[0.0, 0.0, 0.0]] * len(structure.symbols)
+            if inp_obj.calctype == CalcType.gradient
+            else None
+        )
+        return (
+            SinglePointResults(energy=energy, gradient=gradient),
+            "x" * self.stdout_size,
+        )
+
+
+def _restore_real_adapter() -> None:
+    if _real_adapter is None:
+        registry.pop(FAKE_PROGRAM, None)
+    else:
+        registry[FAKE_PROGRAM] = _real_adapter
+
+
+# Defining FakeAdapter registered it; it is only used within hermetic_bigchem()
+_restore_real_adapter()
+
+
+@contextmanager
+def hermetic_bigchem(tmp_dir: str) -> Iterator[Redis]:
+    """Run the BigChem app against an in-memory broker, embedded Redis and a worker.
+
+    Restores the app's broker, backend and the real program adapter on exit. The
+    circuit breakers are closed on entry and exit.
+
+    Args:
+        tmp_dir: Directory for the embedded Redis server's socket and database.
+
+    Yields:
+        Client of the embedded Redis server used as the result backend.
+    """
+    conf = bigchem_app.conf
+    previous = {
+        "broker_url": conf.broker_url,
+        "broker_transport_options": conf.broker_transport_options,
+        "result_backend": conf.result_backend,
+        # Set by the worker's worker_init handler in chemcloud_server.tasks
+        "result_expires": conf.result_expires,
+    }
+    server = Redis(f"{tmp_dir}/backend.db")
+
+    def reset_connections():
+        # Connections and the backend are created on first use and cached per thread
+        bigchem_app._pool = None
+        bigchem_app.amqp._producer_pool = None
+        bigchem_app._local = threading.local()
+        # Failures of the previous broker and backend say nothing about the new ones
+        breakers.broker_breaker.reset()
+        breakers.backend_breaker.reset()
+
+    conf.update(
+        broker_url="memory://",
+        # The worker polls the in-memory queues; kombu's default waits 1 s between
+        broker_transport_options={"polling_interval": POLLING_INTERVAL},
+        result_backend=f"redis+socket://{server.socket_file}",
+    )
+    reset_connections()
+    registry[FAKE_PROGRAM] = FakeAdapter
+    try:
+        with start_worker(
+            bigchem_app, pool="solo", perform_ping_check=False, loglevel="WARNING"
+        ):
+            yield server
+    finally:
+        _restore_real_adapter()
+        conf.update(previous)
+        reset_connections()
+        # Results unsubscribe from the backend when collected
+        gc.collect()
+        server.shutdown()
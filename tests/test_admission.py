@@ -0,0 +1,75 @@
+from time import monotonic, time
+from uuid import uuid4
+
+import pytest
+from bigchem.app import bigchem as bigchem_app
+from bigchem.tasks import add
+from fastapi import HTTPException
+
+from chemcloud_server import admission
+from chemcloud_server.admission import QueueMonitor, get_queue_depths
+from chemcloud_server.models import QueueStats
+
+
+@pytest.mark.parametrize(
+    "depth,n_consumers,status_code,retry_after",
+    [
+        (10, 2, None, None),  # At the limit
+        (14, 2, 429, "20"),  # 4 excess tasks, 2 workers, 10 s per task
+        (11, 3, 429, "4"),
+        (11, 0, 503, "10"),
+    ],
+)
+def test_queue_monitor_admit(depth, n_consumers, status_code, retry_after):
+    monitor = QueueMonitor(max_depth=10, task_seconds=10.0, default_queue="celery")
+    monitor.stats["celery"] = QueueStats(
+        depth=depth, n_consumers=n_consumers, updated_at=time()
+    )
+
+    if status_code is None:
+        monitor.admit()
+        return
+    with pytest.raises(HTTPException) as exc_info:
+        monitor.admit()
+    assert exc_info.value.status_code == status_code
+    assert exc_info.value.headers["Retry-After"] == retry_after
+
+
+def test_queue_monitor_watches_accepted_queues(monkeypatch):
+    monkeypatch.setattr(
+        admission, "get_queue_depths", lambda queues: dict.fromkeys(queues, 0)
+    )
+    monkeypatch.setattr(admission, "get_queue_consumers", dict)
+    monitor = QueueMonitor(
+        max_depth=1,
+        task_seconds=10.0,
+        default_queue="celery",
+        max_watched=2,
+        watch_seconds=60,
+    )
+    monitor.admit("private")  # Unknown queues are admitted but not watched
+    monitor.refresh()
+    assert set(monitor.stats) == {"celery"}
+
+    now = monotonic()
+    monkeypatch.setattr(admission, "monotonic", lambda: now)
+    for queue in ("a", "b", "a", "c"):
+        monitor.watch(queue)
+    monitor.refresh()
+    assert set(monitor.stats) == {"celery", "a", "c"}  # b least recently used
+
+    now += 61
+    monitor.watch("c")
+    monitor.refresh()
+    assert set(monitor.stats) == {"celery", "c"}  # a expired
+
+
+def test_get_queue_depths():
+    queue, missing = f"test-{uuid4()}", f"missing-{uuid4()}"
+    for _ in range(3):
+        add.s(1, 2).apply_async(queue=queue)
+    try:
+        assert get_queue_depths([queue, missing]) == {queue: 3, missing: 0}
+    finally:
+        with bigchem_app.connection_for_write() as conn:
+            conn.default_channel.queue_purge(queue)
@@ -0,0 +1,97 @@
+import pytest
+from qcio import (
+    CalcType,
+    DualProgramInput,
+    ProgramInput,
+    ProgramOutput,
+    Provenance,
+    SinglePointResults,
+)
+
+from chemcloud_server.algos import REDUCED_ONLY_KWARGS, parallel_hessian
+from chemcloud_server.routes.helpers import compute_bigchem
+from chemcloud_server.tasks import seed_displacements
+
+COMPUTE_KWARGS = {
+    "collect_stdout": True,
+    "collect_files": True,
+    "collect_wfn": False,
+    "rm_scratch_dir": False,
+    "propagate_wfn": True,
+}
+
+
+@pytest.fixture
+def hessian_input(program_input):
+    return ProgramInput(**{**program_input.model_dump(), "calctype": CalcType.hessian})
+
+
+@pytest.mark.parametrize("reduced_only", (False, True))
+def test_compute_bigchem_passes_compute_kwargs(
+    settings, monkeypatch, hessian_input, reduced_only
+):
+    monkeypatch.setattr(settings, "chemcloud_worker_tasks", False)
+    inp_obj = DualProgramInput(
+        structure=hessian_input.structure,
+        calctype=CalcType.hessian,
+        subprogram="psi4",
+        subprogram_args={"model": hessian_input.model},
+    )
+    # frequency_analysis is chained onto the body of the chord
+    *displacements, reference = compute_bigchem(
+        inp_obj, COMPUTE_KWARGS, reduced_only
+    ).tasks
+
+    expected = {k: v for k, v in COMPUTE_KWARGS.items() if k != "propagate_wfn"}
+    assert reference.kwargs == expected
+    assert reference.args[1].calctype == CalcType.energy
+    if reduced_only:
+        expected = {**expected, **REDUCED_ONLY_KWARGS}
+    assert all(task.kwargs == expected for task in displacements)
+
+
+def test_parallel_hessian_propagate_wfn_seeds_displacements(hessian_input):
+    signature = parallel_hessian("terachem", hessian_input, 1e-3, COMPUTE_KWARGS)
+    reference, seed = signature.tasks
+
+    assert reference.args[1].calctype == CalcType.energy
+    assert reference.kwargs["collect_wfn"] is True
+    assert seed.task == seed_displacements.name
+    assert len(seed.args[1]) == 2 * hessian_input.structure.geometry.size
+    assert "propagate_wfn" not in seed.args[3]
+
+    # Programs that cannot propagate wavefunctions compute everything in parallel
+    chord = parallel_hessian("psi4", hessian_input, 1e-3, COMPUTE_KWARGS)
+    assert len(chord.tasks) == 2 * hessian_input.structure.geometry.size + 1
+
+
+def test_seed_displacements(monkeypatch, hessian_input):
+    energy_input = ProgramInput(
+        **{**hessian_input.model_dump(), "calctype": CalcType.energy}
+    )
+    reference = ProgramOutput[ProgramInput, SinglePointResults](
+        input_data=energy_input,
+        success=True,
+        results=SinglePointResults(energy=-1.0, files={"scr.geometry/c0": b"wfn"}),
+        provenance=Provenance(program="terachem"),
+    )
+    displacements = [energy_input.model_copy(deep=True) for _ in range(2)]
+
+    class Replaced(Exception):
+        pass
+
+    def replace(sig):
+        raise Replaced(sig)
+
+    monkeypatch.setattr(seed_displacements, "replace", replace)
+    with pytest.raises(Replaced) as exc_info:
+        seed_displacements.run(
+            reference, "terachem", displacements, seed_displacements.s(), {}
+        )
+
+    *header, passthrough = exc_info.value.args[0].tasks
+    for task in header:
+        assert task.args[1].files == {"c0": b"wfn"}
+        assert task.args[1].keywords["guess"] == "c0"
+    # Wavefunction not kept on the reference unless requested
+    assert passthrough.args[0].results.files == {}
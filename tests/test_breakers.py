@@ -0,0 +1,112 @@
+import socket
+from time import perf_counter
+from uuid import uuid4
+
+import pytest
+import redis
+from bigchem.app import bigchem as bigchem_app
+from fastapi import HTTPException
+
+from chemcloud_server import breakers
+from chemcloud_server.breakers import CircuitBreaker
+
+from .utils import json_dumps
+
+
+class Unavailable(Exception):
+    pass
+
+
+def test_circuit_breaker_opens_and_recovers(monkeypatch):
+    now = 100.0
+    monkeypatch.setattr(breakers, "monotonic", lambda: now)
+    breaker = CircuitBreaker("backend", (Unavailable,), 2, reset_timeout=30)
+
+    for _ in range(2):
+        with pytest.raises(HTTPException) as exc_info:
+            with breaker.guard():
+                raise Unavailable
+        assert exc_info.value.status_code == 503
+    assert breaker.is_open
+
+    # Fails fast without running the block
+    with pytest.raises(HTTPException) as exc_info:
+        with breaker.guard():
+            pytest.fail("Block ran while the breaker was open")
+    assert exc_info.value.headers["Retry-After"] == "30"
+
+    # One trial after reset_timeout; other exceptions mean the dependency responded
+    now += 30
+    with pytest.raises(KeyError):
+        with breaker.guard():
+            raise KeyError
+    assert not breaker.is_open
+
+
+def test_failed_trial_reopens_breaker(monkeypatch):
+    now = 100.0
+    monkeypatch.setattr(breakers, "monotonic", lambda: now)
+    breaker = CircuitBreaker("backend", (Unavailable,), 1, reset_timeout=30)
+    with pytest.raises(HTTPException):
+        with breaker.guard():
+            raise Unavailable
+
+    now += 30
+    with pytest.raises(HTTPException):
+        with breaker.guard():
+            raise Unavailable
+    now += 29
+    with pytest.raises(HTTPException):
+        breaker.before_call()
+
+
+@pytest.fixture
+def unavailable_backend(monkeypatch):
+    """Backend client connected to a server that accepts connections but never
+    replies, as a hung Redis would"""
+    with socket.socket() as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        client = redis.Redis(
+            *server.getsockname(), socket_timeout=0.2, socket_connect_timeout=0.2
+        )
+        # The app creates a backend per thread
+        monkeypatch.setattr(type(bigchem_app.backend), "client", client)
+        breaker = CircuitBreaker(
+            "result backend", bigchem_app.backend.connection_errors, 2, 30
+        )
+        monkeypatch.setattr(breakers, "backend_breaker", breaker)
+        yield breaker
+
+
+def test_backend_outage_fails_fast(settings, client, fake_auth, unavailable_backend):
+    url = f"{settings.api_v2_str}/compute/output/{uuid4()}"
+    for _ in range(2):  # Each waits for the deadline
+        assert client.get(url).status_code == 503
+    assert unavailable_backend.is_open
+
+    start = perf_counter()
+    response = client.get(url)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"]
+    assert perf_counter() - start < 0.1
+
+    # Routes that do not need the backend keep working
+    assert client.get("/hello-world").status_code == 200
+
+
+def test_invalid_submissions_rejected_while_open(
+    settings, client, fake_auth, program_input
+):
+    for breaker in (breakers.broker_breaker, breakers.backend_breaker):
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+    url = f"{settings.api_v2_str}/compute"
+    params = {"program": "psi4"}
+
+    assert client.post(url, content=b"not json", params=params).status_code == 422
+    too_large = b" " * (settings.max_compute_body_bytes + 1)
+    assert client.post(url, content=too_large, params=params).status_code == 413
+    # Valid inputs would reach the broker
+    response = client.post(url, content=json_dumps(program_input), params=params)
+    assert response.status_code == 503
@@ -0,0 +1,104 @@
+import asyncio
+import threading
+
+import pytest
+
+from chemcloud_server.cache import ResponseCache, SingleFlight
+
+
+def test_response_cache_get_set_pop():
+    cache = ResponseCache(max_bytes=100)
+    assert cache.get("a") is None
+
+    cache.set("a", b"12345")
+    assert cache.get("a") == b"12345"
+    assert cache.size == 5
+
+    # Overwriting a key replaces its size
+    cache.set("a", b"123")
+    assert cache.size == 3
+    assert len(cache) == 1
+
+    assert cache.pop("a") == b"123"
+    assert cache.pop("a") is None
+    assert cache.size == 0
+
+
+def test_response_cache_evicts_least_recently_used():
+    cache = ResponseCache(max_bytes=10)
+    cache.set("a", b"1234")
+    cache.set("b", b"1234")
+    # Touch "a" so "b" is the least recently used entry
+    cache.get("a")
+    cache.set("c", b"1234")
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+    assert cache.size == 8
+
+
+def test_response_cache_skips_bodies_larger_than_cache():
+    cache = ResponseCache(max_bytes=4)
+    cache.set("a", b"12345")
+    assert "a" not in cache
+    assert cache.size == 0
+
+
+def test_response_cache_disabled():
+    cache = ResponseCache(max_bytes=0)
+    cache.set("a", b"1")
+    assert cache.get("a") is None
+
+
+def test_single_flight_shares_concurrent_calls():
+    calls = []
+    release = threading.Event()
+
+    def read(value):
+        calls.append(value)
+        release.wait(5)
+        return value
+
+    async def main():
+        flight = SingleFlight(max_age=0, reuse=lambda _: True)
+        waiters = [asyncio.create_task(flight.do("a", read, i)) for i in range(5)]
+        other = asyncio.create_task(flight.do("b", read, "b"))
+        await asyncio.sleep(0.05)
+        waiters[0].cancel()  # A disconnected caller does not cancel the call
+        release.set()
+        results = await asyncio.gather(*waiters[1:], other)
+        assert "a" not in flight  # Not reused with max_age=0
+        return results
+
+    assert asyncio.run(main()) == [0, 0, 0, 0, "b"]
+    assert sorted(calls, key=str) == [0, "b"]
+
+
+def test_single_flight_reuses_fresh_results():
+    calls = []
+
+    def read(value):
+        calls.append(value)
+        if value == "error":
+            raise ValueError(value)
+        return value
+
+    async def main():
+        flight = SingleFlight(max_age=0.1, reuse=lambda value: value == "pending")
+        assert await flight.do("a", read, "pending") == "pending"
+        assert await flight.do("a", read, "done") == "pending"  # Still fresh
+        await asyncio.sleep(0.2)
+        assert await flight.do("a", read, "done") == "done"
+        assert await flight.do("a", read, "done") == "done"  # Not reusable
+
+        await flight.do("b", read, "pending")
+        flight.forget("b")
+        assert await flight.do("b", read, "done") == "done"
+
+        for _ in range(2):  # Errors are not reused
+            with pytest.raises(ValueError):
+                await flight.do("c", read, "error")
+
+    asyncio.run(main())
+    assert calls == ["pending", "done", "done", "pending", "done", "error", "error"]
@@ -1,13 +1,14 @@
 import json
 from time import sleep
+from uuid import uuid4
 
 import pytest
 from celery.states import READY_STATES
 from fastapi import status as status_codes
 from httpx import HTTPStatusError
-from qcio import DualProgramInput, ProgramInput
+from qcio import DualProgramInput, FileInput, ProgramInput
 
-from chemcloud_server.models import TaskStatus
+from chemcloud_server.models import DeleteStatus, TaskStatus
 from tests.utils import _get_result, _make_job_completion_assertions
 
 from .utils import json_dumps
@@ -218,6 +219,92 @@ def test_compute_group_limits(settings, client, fake_auth, hydrogen, program_inp
     assert job_submission.status_code == status_codes.HTTP_413_REQUEST_ENTITY_TOO_LARGE
 
 
+def test_compute_body_size_limit(
+    settings, client, fake_auth, program_input, monkeypatch
+):
+    body = json_dumps(program_input)
+    monkeypatch.setattr(settings, "max_compute_body_bytes", len(body) - 1)
+
+    job_submission = client.post(
+        f"{settings.api_v2_str}/compute",
+        content=body,
+        params={"program": "psi4"},
+    )
+    assert job_submission.status_code == status_codes.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+
+def test_compute_invalid_body(settings, client, fake_auth, hydrogen):
+    job_submission = client.post(
+        f"{settings.api_v2_str}/compute",
+        content=json.dumps({"structure": hydrogen.model_dump(mode="json")}),
+        params={"program": "psi4"},
+    )
+    assert job_submission.status_code == status_codes.HTTP_422_UNPROCESSABLE_ENTITY
+    assert job_submission.json()["detail"][0]["loc"][0] == "body"
+
+
+def test_compute_bigchem_gradient_requires_worker_tasks(
+    settings, client, fake_auth, water, monkeypatch
+):
+    monkeypatch.setattr(settings, "chemcloud_worker_tasks", False)
+    prog_input = DualProgramInput(
+        structure=water,
+        calctype="gradient",
+        subprogram="rdkit",
+        subprogram_args={"model": {"method": "UFF"}},
+    )
+    job_submission = client.post(
+        f"{settings.api_v2_str}/compute",
+        content=json_dumps(prog_input),
+        params={"program": "bigchem"},
+    )
+    assert job_submission.status_code == status_codes.HTTP_422_UNPROCESSABLE_ENTITY
+    assert "chemcloud_worker_tasks" in job_submission.json()["detail"]
+
+
+@pytest.mark.parametrize(
+    "case,detail",
+    (
+        ("file_input", "DualProgramInput"),
+        ("program_input", "DualProgramInput"),
+        ("gradient_keywords", "temperature"),
+        ("invalid_dh", "dh"),
+    ),
+)
+def test_compute_bigchem_invalid_inputs(
+    settings, client, fake_auth, water, monkeypatch, case, detail
+):
+    monkeypatch.setattr(settings, "chemcloud_worker_tasks", True)
+    subprogram_args = {"model": {"method": "UFF"}}
+    prog_input = {
+        "file_input": FileInput(files={"in.txt": "x"}, cmdline_args=["in.txt"]),
+        "program_input": ProgramInput(
+            structure=water, calctype="gradient", **subprogram_args
+        ),
+        "gradient_keywords": DualProgramInput(
+            structure=water,
+            calctype="gradient",
+            keywords={"temperature": 300},
+            subprogram="rdkit",
+            subprogram_args=subprogram_args,
+        ),
+        "invalid_dh": DualProgramInput(
+            structure=water,
+            calctype="hessian",
+            keywords={"dh": "small"},
+            subprogram="rdkit",
+            subprogram_args=subprogram_args,
+        ),
+    }[case]
+    job_submission = client.post(
+        f"{settings.api_v2_str}/compute",
+        content=json_dumps(prog_input),
+        params={"program": "bigchem"},
+    )
+    assert job_submission.status_code == status_codes.HTTP_422_UNPROCESSABLE_ENTITY
+    assert detail in job_submission.json()["detail"]
+
+
 @pytest.mark.parametrize(
     "calctype,keywords,subprogram,model,group",
     (
@@ -337,3 +424,54 @@ def test_propagate_wfn_exception_handling(settings, client, fake_auth, hydrogen)
     as_dict = job_submission.json()
 
     _make_job_completion_assertions(as_dict, client, settings, failure=True)
+
+
+def test_bulk_delete(settings, client, fake_auth, program_input):
+    """Test deleting a single task, a group, and an unknown task id in one request."""
+    task_ids = [
+        client.post(
+            f"{settings.api_v2_str}/compute",
+            content=json_dumps(inp),
+            params={"program": "psi4"},
+        ).json()
+        for inp in (program_input, [program_input, program_input])
+    ]
+    unknown_id = str(uuid4())
+
+    response = client.post(
+        f"{settings.api_v2_str}/compute/output/bulk-delete",
+        json=[*task_ids, unknown_id],
+    )
+    response.raise_for_status()
+    assert response.json() == {
+        task_ids[0]: DeleteStatus.DELETED,
+        task_ids[1]: DeleteStatus.DELETED,
+        unknown_id: DeleteStatus.GONE,
+    }
+
+    for task_id in task_ids:
+        with pytest.raises(HTTPStatusError):
+            _get_result(client, settings, task_id)
+
+
+def test_cancel(settings, client, fake_auth, program_input):
+    """Test cancelling a group before any worker picks it up."""
+    task_id = client.post(
+        f"{settings.api_v2_str}/compute",
+        content=json_dumps([program_input, program_input]),
+        # No workers consume this queue so the tasks stay queued
+        params={"program": "psi4", "queue": f"test-cancel-{uuid4()}"},
+    ).json()
+
+    response = client.post(f"{settings.api_v2_str}/compute/output/{task_id}/cancel")
+    response.raise_for_status()
+    assert response.json() == {"n_cancelled": 2, "n_running": 0, "n_finished": 0}
+
+    output = _get_result(client, settings, task_id)
+    assert output.status == TaskStatus.REVOKED
+    assert output.program_output == [None, None]
+    assert output.progress.n_completed == output.progress.n_total == 2
+
+    client.delete(f"{settings.api_v2_str}/compute/output/{task_id}")
+    response = client.post(f"{settings.api_v2_str}/compute/output/{task_id}/cancel")
+    assert response.status_code == status_codes.HTTP_410_GONE
@@ -0,0 +1,54 @@
+import httpx
+import pytest
+
+from chemcloud_server import config
+from chemcloud_server.config import get_jwks
+
+
+@pytest.fixture
+def auth0_domain(monkeypatch):
+    """Settings for an Auth0 domain, with requests to it recorded"""
+    requests = []
+
+    def get(url, *args, **kwargs):
+        requests.append(url)
+        return httpx.Response(
+            200, json={"keys": [{"kid": "key"}]}, request=httpx.Request("GET", url)
+        )
+
+    monkeypatch.setenv("AUTH0_DOMAIN", "example.com")
+    monkeypatch.setattr(httpx, "get", get)
+    # Uncached settings so the app's own settings are untouched
+    settings = config.get_settings.__wrapped__()
+    monkeypatch.setattr(config, "get_settings", lambda: settings)
+    get_jwks.cache_clear()
+    yield requests
+    get_jwks.cache_clear()
+
+
+def test_settings_are_resolved_without_requests(auth0_domain):
+    assert config.get_settings().jwt_issuer == "https://example.com/"
+    assert auth0_domain == []
+
+
+def test_jwks_are_fetched_once(auth0_domain):
+    assert get_jwks() == [{"kid": "key"}]
+    assert get_jwks() == [{"kid": "key"}]
+    assert auth0_domain == ["https://example.com/.well-known/jwks.json"]
+
+
+def test_trace_sampling():
+    settings = config.Settings(trace_sample_rate=0.5)
+    sampling = config.trace_sampling(settings)
+    assert sampling.head == 0.5
+    assert sampling.tail is None  # Spans are not buffered
+
+    settings = config.Settings(trace_sample_rate=0.5, trace_background_rate=0.1)
+    sampling = config.trace_sampling(settings)
+    assert sampling.head == 0.5
+    assert sampling.tail is not None
+
+    with pytest.raises(ValueError):
+        config.trace_sampling(
+            config.Settings(trace_sample_rate=0.1, trace_background_rate=0.5)
+        )
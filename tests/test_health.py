@@ -0,0 +1,70 @@
+import httpx
+import pytest
+
+from chemcloud_server import config, health
+from chemcloud_server.health import HealthMonitor
+
+
+def _unavailable():
+    raise ConnectionError("Connection refused")
+
+
+def test_health_monitor_readiness(monkeypatch):
+    monitor = HealthMonitor({"ok": lambda: None, "down": _unavailable}, max_age=30)
+    assert not monitor.readiness().ready  # Not probed yet
+
+    monitor.run_probes()
+    readiness = monitor.readiness()
+    assert not readiness.ready
+    assert readiness.dependencies["ok"].healthy
+    assert readiness.dependencies["down"].error == "ConnectionError: Connection refused"
+
+    monitor.probes["down"] = lambda: None
+    monitor.run_probes()
+    assert monitor.readiness().ready
+
+    # Probes that stopped running no longer count
+    monkeypatch.setattr(health, "time", lambda: monitor.statuses["ok"].checked_at + 31)
+    assert not monitor.readiness().ready
+
+
+def test_live(client):
+    response = client.get("/health/live")
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("backend_up", (True, False))
+def test_ready(monkeypatch, client, backend_up):
+    monitor = health.health_monitor
+    if not backend_up:
+        monkeypatch.setitem(monitor.probes, "backend", _unavailable)
+    monkeypatch.setattr(monitor, "statuses", {})
+    monitor.run_probes()
+
+    response = client.get("/health/ready")
+    assert response.status_code == (200 if backend_up else 503)
+    body = response.json()
+    assert body["ready"] is backend_up
+    assert set(body["dependencies"]) == {"broker", "backend", "jwks"}
+    assert body["dependencies"]["broker"]["latency"] >= 0
+
+
+def test_jwks_probe_contacts_auth0_every_time(settings, monkeypatch):
+    requests = []
+
+    def get(url, timeout):
+        requests.append((url, timeout))
+        return httpx.Response(200, json={"keys": []}, request=httpx.Request("GET", url))
+
+    monkeypatch.setattr(settings, "auth0_domain", "auth.example.com")
+    monkeypatch.setattr(config.httpx, "get", get)
+    config.get_jwks.cache_clear()
+    try:
+        health.probe_jwks()  # Fills the cache used to validate tokens
+        assert config.get_jwks.cache_info().currsize == 1
+        health.probe_jwks()
+        config.get_jwks()
+    finally:
+        config.get_jwks.cache_clear()
+    url = "https://auth.example.com/.well-known/jwks.json"
+    assert requests == [(url, settings.dependency_timeout)] * 2
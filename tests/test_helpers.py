@@ -0,0 +1,355 @@
+import asyncio
+import json
+from time import time
+from uuid import uuid4
+
+import numpy as np
+import pytest
+from bigchem.app import bigchem as bigchem_app
+from bigchem.config import settings as bigchem_settings
+from celery.result import AsyncResult, GroupResult
+from fastapi import HTTPException
+from fastapi import status as status_codes
+from fastapi.exceptions import RequestValidationError
+from qcio import DualProgramInput, FileInput, ProgramInput
+
+from chemcloud_server.exceptions import ResultNotFoundError
+from chemcloud_server.models import (
+    ArrayQuantity,
+    ProgramOutputWrapper,
+    Progress,
+    TaskStatus,
+)
+from chemcloud_server.routes.helpers import (
+    _group_status,
+    _result_ttl,
+    delete_result,
+    encode_compact_output_response,
+    encode_output_response,
+    expand_shared_refs,
+    extract_arrays,
+    get_group_progress,
+    get_task_metas,
+    iter_lines,
+    jobs_key,
+    list_jobs,
+    parse_program_inputs,
+    result_max_age,
+    save_dag,
+    stack_arrays,
+    touch_result,
+)
+
+from .utils import json_dumps
+
+
+@pytest.mark.parametrize("group", (False, True))
+def test_encode_output_response_matches_wrapper(
+    program_output, failed_program_output, group
+):
+    """The fast path must produce exactly the body FastAPI would for the wrapper"""
+    if group:
+        prog_output = [program_output, failed_program_output, program_output]
+        status = TaskStatus.FAILURE
+        progress = Progress(n_completed=3, n_total=3)
+    else:
+        prog_output = program_output
+        status = TaskStatus.SUCCESS
+        progress = None
+
+    expected = ProgramOutputWrapper(
+        status=status, program_output=prog_output, progress=progress
+    )
+    encoded = encode_output_response(status, prog_output, progress)
+
+    assert encoded == expected.model_dump_json().encode()
+    assert ProgramOutputWrapper(**json.loads(encoded)) == expected
+
+
+@pytest.mark.parametrize("group", (False, True))
+def test_compact_output_response_expands_to_full(
+    program_output, failed_program_output, group
+):
+    if group:
+        prog_output = [program_output, None, failed_program_output, program_output]
+        progress = Progress(n_completed=4, n_total=4)
+    else:
+        prog_output = program_output
+        progress = None
+
+    full = encode_output_response(TaskStatus.REVOKED, prog_output, progress)
+    compact = json.loads(
+        encode_compact_output_response(TaskStatus.REVOKED, prog_output, progress)
+    )
+
+    if group:
+        # Same structure in every output, sent once
+        structures = [
+            compact["program_output"][i]["input_data"]["structure"] for i in (0, 2, 3)
+        ]
+        assert structures == [{"$ref": 0}] * 3
+    else:
+        assert compact["shared"] == []
+    assert expand_shared_refs(compact) == json.loads(full)
+
+
+def test_parse_program_inputs(program_input, water):
+    dual_input = DualProgramInput(
+        structure=water,
+        calctype="optimization",
+        subprogram="psi4",
+        subprogram_args={"model": {"method": "HF", "basis": "sto-3g"}},
+    )
+    file_input = FileInput(files={"input.dat": "some input"}, cmdline_args=["-n", "2"])
+
+    parsed = parse_program_inputs(program_input.model_dump_json().encode(), 10)
+    assert parsed == program_input
+
+    inputs = [file_input, program_input, dual_input]
+    parsed = parse_program_inputs(json_dumps(inputs).encode(), 10)
+    assert parsed == inputs
+    assert [type(inp) for inp in parsed] == [FileInput, ProgramInput, DualProgramInput]
+
+
+def test_parse_program_inputs_rejects_too_many_inputs_before_validation():
+    # Invalid inputs; the count must be checked before they are validated
+    with pytest.raises(HTTPException) as exc_info:
+        parse_program_inputs(json.dumps([{"not": "valid"}] * 3).encode(), 2)
+    assert exc_info.value.status_code == status_codes.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+
+def test_parse_compact_batch(program_input, water):
+    files = {"input.dat": b"\x00binary"}
+    encoded_files = {"input.dat": "base64:AGJpbmFyeQ=="}
+    batch = {
+        "shared": [json.loads(water.model_dump_json()), {"method": "HF"}],
+        "defaults": {"calctype": "energy", "structure": {"$ref": 0}},
+        "inputs": [
+            {"model": {"$ref": 1}, "keywords": {"maxiter": 10 * i}} for i in range(3)
+        ]
+        + [
+            {"calctype": "gradient", "model": {"method": "MP2"}, "files": encoded_files}
+        ],
+    }
+    expected = [
+        ProgramInput(
+            structure=water,
+            calctype="energy",
+            model={"method": "HF"},
+            keywords={"maxiter": 10 * i},
+        )
+        for i in range(3)
+    ] + [
+        ProgramInput(
+            structure=water, calctype="gradient", model={"method": "MP2"}, files=files
+        )
+    ]
+
+    parsed = parse_program_inputs(json.dumps(batch).encode(), 10)
+
+    assert parsed == expected
+    # Shared values are validated once and reused
+    assert len({id(inp.structure) for inp in parsed}) == 1
+    assert parsed[0].model is parsed[2].model
+
+    with pytest.raises(HTTPException) as exc_info:
+        parse_program_inputs(json.dumps(batch).encode(), 3)
+    assert exc_info.value.status_code == status_codes.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+
+@pytest.mark.parametrize(
+    "batch,loc",
+    (
+        ({"shared": [], "inputs": [{"structure": {"$ref": 0}}]}, ("inputs", 0)),
+        ({"inputs": [{"files": {}}, {"bad": 1}]}, ("inputs", 1)),
+        ({"inputs": {"files": {}}}, ("inputs",)),
+    ),
+)
+def test_parse_compact_batch_invalid(batch, loc):
+    with pytest.raises(RequestValidationError) as exc_info:
+        parse_program_inputs(json.dumps(batch).encode(), 10)
+    assert exc_info.value.errors()[0]["loc"][: len(loc) + 1] == ("body", *loc)
+
+
+def test_iter_lines():
+    async def lines(chunks, max_line_bytes):
+        async def stream():
+            for chunk in chunks:
+                yield chunk
+
+        return [line async for line in iter_lines(stream(), max_line_bytes)]
+
+    chunks = [b'{"a":', b" 1}\n\n", b'{"b": 2}\r\n{"c"', b": 3}", b" "]
+    assert asyncio.run(lines(chunks, 10)) == [b'{"a": 1}', b'{"b": 2}\r', b'{"c": 3} ']
+
+    for chunks in ([b"123", b"456", b"789"], [b"1\n123456789\n"]):
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(lines(chunks, 8))
+        assert (
+            exc_info.value.status_code == status_codes.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+
+
+@pytest.mark.parametrize(
+    "body,error_type",
+    (
+        (b"", "json_invalid"),
+        (b'{"structure": ', "json_invalid"),
+        (b'{"structure": {"symbols": ["H"]}}', "missing"),
+        (b'[{"cmdline_args": ["-n"], "extra_field": 1}]', "extra_forbidden"),
+    ),
+)
+def test_parse_program_inputs_invalid_body(body, error_type):
+    with pytest.raises(RequestValidationError) as exc_info:
+        parse_program_inputs(body, 10)
+    errors = exc_info.value.errors()
+    assert errors[0]["loc"][0] == "body"
+    assert errors[0]["type"] == error_type
+
+
+def test_result_max_age_uses_longest_matching_scope(settings, monkeypatch):
+    monkeypatch.setattr(
+        settings, "result_max_age_by_scope", {"compute:public": 10, "compute:lab": 100}
+    )
+    assert result_max_age(["compute:public", "compute:lab"]) == 100
+    assert result_max_age(["compute:public", "openid"]) == 10
+    assert result_max_age(["openid"]) is None
+
+
+def test_result_ttl(settings, monkeypatch):
+    monkeypatch.setattr(settings, "chemcloud_worker_tasks", True)
+    monkeypatch.setattr(settings, "result_ttl", 60)
+    assert _result_ttl(None) == 60
+    assert _result_ttl(time() + 30) == 30
+    assert _result_ttl(time() + 3600) == 60
+
+    monkeypatch.setattr(settings, "result_ttl", 0)
+    assert _result_ttl(None) is None
+    assert _result_ttl(time() + 3600) == 3600
+
+    # Workers without chemcloud_server.tasks expire task results after BigChem's
+    # result_expires; DAGs must not outlive them
+    monkeypatch.setattr(settings, "chemcloud_worker_tasks", False)
+    monkeypatch.setattr(bigchem_settings, "bigchem_result_expires", 600)
+    assert _result_ttl(None) == 600
+    assert _result_ttl(time() + 30) == 30
+
+
+def test_list_jobs_pages_through_equal_submission_times():
+    user = f"test-{uuid4()}"
+    results = [AsyncResult(str(uuid4()), app=bigchem_app) for _ in range(5)]
+    for result in results:
+        save_dag(result, owner=user)
+    client = bigchem_app.backend.client
+    # Three submitted at the same time, straddling a page boundary
+    client.zadd(jobs_key(user), {results[i].id: 100.0 for i in range(3)})
+
+    listed, cursor = [], None
+    while True:
+        page = list_jobs(user, 2, cursor)
+        listed.extend(job.task_id for job in page.jobs)
+        if (cursor := page.next_cursor) is None:
+            break
+    assert sorted(listed) == sorted(result.id for result in results)
+    assert listed[-3:] == sorted((result.id for result in results[:3]), reverse=True)
+
+    for invalid in ("not-a-cursor", "nan:x", "inf:x", "-inf:x"):
+        with pytest.raises(HTTPException) as exc_info:
+            list_jobs(user, 2, invalid)
+        assert exc_info.value.status_code == status_codes.HTTP_422_UNPROCESSABLE_ENTITY
+    for result in results:
+        delete_result(result, user)
+
+
+def test_touch_result_refreshes_expiry_once_per_interval(
+    settings, program_output, monkeypatch
+):
+    monkeypatch.setattr(settings, "result_refresh_interval", 60)
+    client = bigchem_app.backend.client
+    child = AsyncResult(str(uuid4()), app=bigchem_app)
+    result = GroupResult(str(uuid4()), [child], app=bigchem_app)
+    save_dag(result)
+    bigchem_app.backend.store_result(child.id, program_output, "SUCCESS")
+    child_key = bigchem_app.backend.get_key_for_task(child.id)
+
+    client.expire(child_key, 10)
+    touch_result(result.id)
+    assert client.ttl(child_key) > 10  # Refreshed
+
+    client.expire(child_key, 10)
+    touch_result(result.id)
+    assert client.ttl(child_key) <= 10  # Refreshed too recently
+
+    delete_result(result)
+    with pytest.raises(ResultNotFoundError):
+        touch_result(result.id)
+
+
+@pytest.mark.parametrize(
+    "task_states,expected",
+    (
+        (["PENDING", "PENDING"], TaskStatus.PENDING),
+        (["PENDING", "RETRY"], TaskStatus.RETRY),
+        (["RETRY", "STARTED"], TaskStatus.STARTED),
+        (["PENDING", "SUCCESS"], TaskStatus.STARTED),
+        (["SUCCESS", "SUCCESS"], TaskStatus.SUCCESS),
+        (["SUCCESS", "FAILURE"], TaskStatus.FAILURE),
+        (["SUCCESS", "FAILURE", "REVOKED"], TaskStatus.REVOKED),
+    ),
+)
+def test_group_status(task_states, expected):
+    assert _group_status(task_states) == expected
+
+
+def test_get_group_progress_only_fetches_outstanding_tasks(program_output, monkeypatch):
+    backend = bigchem_app.backend
+    children = [AsyncResult(str(uuid4()), app=bigchem_app) for _ in range(3)]
+    result = GroupResult(str(uuid4()), children, app=bigchem_app)
+    save_dag(result)
+    backend.store_result(children[0].id, program_output, "SUCCESS")
+    backend.store_result(children[1].id, None, "STARTED")
+
+    status, progress = get_group_progress(result)
+    assert status == TaskStatus.STARTED
+    assert progress == Progress(n_completed=1, n_total=3)
+
+    backend.store_result(children[1].id, program_output, "SUCCESS")
+    backend.store_result(children[2].id, program_output, "SUCCESS")
+    # Finished tasks are no longer fetched
+    fetched = []
+    monkeypatch.setattr(
+        "chemcloud_server.routes.helpers.get_task_metas",
+        lambda results: fetched.extend(results) or get_task_metas(results),
+    )
+    status, progress = get_group_progress(result)
+    assert status == TaskStatus.SUCCESS
+    assert progress == Progress(n_completed=3, n_total=3)
+    assert fetched == children[1:]
+
+    delete_result(result)
+    assert not backend.client.exists(f"chemcloud-progress-{result.id}")
+
+
+def test_extract_arrays(program_output, failed_program_output):
+    outputs = [program_output, failed_program_output, None]
+    arrays = extract_arrays(outputs, [ArrayQuantity.ENERGY, ArrayQuantity.GRADIENT])
+    assert arrays == {
+        "success": [True, False, None],
+        "energy": [program_output.results.energy, None, None],
+        "gradient": [program_output.results.gradient.tolist(), None, None],
+    }
+
+    stacked = stack_arrays(arrays)
+    assert stacked["success"].tolist() == [True, False, False]
+    assert stacked["gradient"].shape == (3, 3, 3)
+    np.testing.assert_array_equal(
+        stacked["gradient"][0], program_output.results.gradient
+    )
+    assert np.isnan(stacked["energy"][1:]).all()
+
+
+def test_stack_arrays_different_shapes():
+    with pytest.raises(ValueError):
+        stack_arrays(
+            {"success": [True, True], "gradient": [[[0.0] * 3], [[0.0] * 3] * 2]}
+        )
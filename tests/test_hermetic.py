@@ -0,0 +1,269 @@
+"""Full submit/poll/delete cycles and performance budgets against the hermetic harness.
+
+No broker, Redis server or worker needs to be running; see tests/harness.py.
+"""
+
+import asyncio
+import tracemalloc
+from statistics import median
+from time import perf_counter, sleep
+
+import pytest
+from celery.states import READY_STATES
+from fastapi import status as status_codes
+from qcio import ProgramInput
+
+from chemcloud_server.models import SupportedPrograms
+from chemcloud_server.routes.compute import NDJSON_MEDIA_TYPE, result_cache
+from chemcloud_server.routes.helpers import (
+    delete_result,
+    expand_shared_refs,
+    iter_lines,
+    jobs_key,
+    submit_stream,
+)
+from tests.harness import FAKE_PROGRAM, FakeAdapter
+from tests.utils import _make_job_completion_assertions, json_dumps
+
+# Performance budgets. Generous so that slow CI machines pass; regressions that
+# rebuild or re-fetch results per request exceed them by far.
+SUBMIT_SECONDS = 1.0  # POST /compute of max_batch_inputs inputs
+POLL_SECONDS = 0.1  # Median GET /compute/output of a pending group
+OUTPUT_SECONDS = 0.5  # GET /compute/output of a finished 5 MB group, not cached
+CACHED_OUTPUT_SECONDS = 0.1  # Median GET /compute/output of the group, cached
+OUTPUT_MEMORY_FACTOR = 5  # Peak memory of GET /compute/output / response size
+
+USER = "auth0|5fb8828f1bda000075e14b0a"  # Subject of fake_auth's token
+
+
+def _submit(client, settings, inputs: ProgramInput | list[ProgramInput]) -> str:
+    response = client.post(
+        f"{settings.api_v2_str}/compute",
+        content=json_dumps(inputs),
+        params={"program": FAKE_PROGRAM},
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def _get_output(client, settings, task_id: str, encoding: str = "full"):
+    response = client.get(
+        f"{settings.api_v2_str}/compute/output/{task_id}",
+        params={"encoding": encoding},
+    )
+    response.raise_for_status()
+    return response
+
+
+def _wait(client, settings, task_id: str, timeout: float = 30) -> None:
+    deadline = perf_counter() + timeout
+    while _get_output(client, settings, task_id).json()["status"] not in READY_STATES:
+        assert perf_counter() < deadline, f"{task_id} did not finish"
+        sleep(0.01)
+
+
+def _timed(func, repeats: int = 1) -> float:
+    """Median seconds a call of func takes"""
+    timings = []
+    for _ in range(repeats):
+        start = perf_counter()
+        func()
+        timings.append(perf_counter() - start)
+    return median(timings)
+
+
+@pytest.fixture
+def fake_program(monkeypatch):
+    """FakeAdapter with its default latency and size restored after the test"""
+    monkeypatch.setattr(FakeAdapter, "latency", FakeAdapter.latency)
+    monkeypatch.setattr(FakeAdapter, "stdout_size", FakeAdapter.stdout_size)
+    return FakeAdapter
+
+
+def test_compute_cycle(client, settings, fake_auth, hermetic, program_input):
+    task_id = _submit(client, settings, program_input)
+    _make_job_completion_assertions(task_id, client, settings)
+
+    output = FakeAdapter().compute(program_input)
+    task_id = _submit(client, settings, [program_input] * 3)
+    _wait(client, settings, task_id)
+    response = _get_output(client, settings, task_id).json()
+    assert [out["results"] for out in response["program_output"]] == [
+        output.results.model_dump(mode="json")
+    ] * 3
+    compact = _get_output(client, settings, task_id, "compact")
+    assert len(compact.content) < len(_get_output(client, settings, task_id).content)
+    assert expand_shared_refs(compact.json()) == response
+    _make_job_completion_assertions(task_id, client, settings)
+
+
+def test_cancel_pending_group(
+    client, settings, fake_auth, hermetic, fake_program, program_input
+):
+    fake_program.latency = 0.05
+    task_id = _submit(client, settings, [program_input] * 20)
+
+    response = client.post(f"{settings.api_v2_str}/compute/output/{task_id}/cancel")
+    response.raise_for_status()
+    assert response.json()["n_cancelled"] > 0
+
+    _wait(client, settings, task_id)
+    assert _get_output(client, settings, task_id).json()["status"] == "REVOKED"
+    client.delete(f"{settings.api_v2_str}/compute/output/{task_id}").raise_for_status()
+
+
+def test_stream_submission(
+    client, settings, fake_auth, hermetic, program_input, monkeypatch
+):
+    body = b"\n".join(
+        program_input.model_copy(update={"keywords": {"i": i}})
+        .model_dump_json()
+        .encode()
+        for i in range(3)
+    )
+    response = client.post(
+        f"{settings.api_v2_str}/compute",
+        content=body + b"\n\n",
+        params={"program": FAKE_PROGRAM},
+        headers={"content-type": NDJSON_MEDIA_TYPE},
+    )
+    response.raise_for_status()
+    task_id = response.json()
+    _wait(client, settings, task_id)
+    outputs = _get_output(client, settings, task_id).json()["program_output"]
+    assert [out["input_data"]["keywords"] for out in outputs] == [
+        {"i": i} for i in range(3)
+    ]
+    _make_job_completion_assertions(task_id, client, settings)
+
+    response = client.post(
+        f"{settings.api_v2_str}/compute",
+        content=body + b'\n{"bad": 1}',
+        params={"program": FAKE_PROGRAM},
+        headers={"content-type": NDJSON_MEDIA_TYPE},
+    )
+    assert response.status_code == status_codes.HTTP_422_UNPROCESSABLE_ENTITY
+    assert response.json()["detail"][0]["loc"][:2] == ["body", 3]
+
+    # Limited to max_batch_inputs unless max_stream_inputs allows more
+    monkeypatch.setattr(settings, "max_batch_inputs", 2)
+    response = client.post(
+        f"{settings.api_v2_str}/compute",
+        content=body,
+        params={"program": FAKE_PROGRAM},
+        headers={"content-type": NDJSON_MEDIA_TYPE},
+    )
+    assert response.status_code == status_codes.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    monkeypatch.setattr(settings, "max_stream_inputs", 3)
+    response = client.post(
+        f"{settings.api_v2_str}/compute",
+        content=body,
+        params={"program": FAKE_PROGRAM},
+        headers={"content-type": NDJSON_MEDIA_TYPE},
+    )
+    response.raise_for_status()
+    _wait(client, settings, response.json())
+    client.delete(f"{settings.api_v2_str}/compute/output/{response.json()}")
+
+
+def test_submit_stream_runs_inputs_during_upload(hermetic, program_input):
+    line = program_input.model_dump_json().encode() + b"\n"
+
+    async def upload():
+        yield line
+        # The first input finishes before the second one is sent
+        while not hermetic.keys("celery-task-meta-*"):
+            await asyncio.sleep(0.01)
+        yield line
+
+    async def submit():
+        lines = iter_lines(upload(), 1000)
+        return await submit_stream(lines, SupportedPrograms(FAKE_PROGRAM), {})
+
+    result = asyncio.run(submit())
+    assert len(result.results) == 2
+    for task in result.results:
+        assert task.get(timeout=10).success
+    delete_result(result)
+
+
+def test_list_jobs(client, settings, fake_auth, hermetic, program_input):
+    task_ids = [
+        _submit(client, settings, program_input),
+        _submit(client, settings, [program_input] * 2),
+        _submit(client, settings, program_input),
+    ]
+    for task_id in task_ids:
+        _wait(client, settings, task_id)
+    hermetic.zadd(jobs_key(USER), {"expired-task": 0})
+
+    jobs, cursor = [], None
+    while True:
+        params = {"limit": 2} if cursor is None else {"limit": 2, "cursor": cursor}
+        response = client.get(f"{settings.api_v2_str}/compute/jobs", params=params)
+        response.raise_for_status()
+        page = response.json()
+        jobs.extend(page["jobs"])
+        if (cursor := page["next_cursor"]) is None:
+            break
+    assert [job["task_id"] for job in jobs] == task_ids[::-1]
+    assert [job["progress"] for job in jobs] == [
+        None,
+        {"n_completed": 2, "n_total": 2},
+        None,
+    ]
+    assert {job["status"] for job in jobs} == {"SUCCESS"}
+    # Entries of deleted or expired results are removed when listed
+    assert hermetic.zscore(jobs_key(USER), "expired-task") is None
+
+    client.delete(f"{settings.api_v2_str}/compute/output/{task_ids[0]}")
+    client.post(
+        f"{settings.api_v2_str}/compute/output/bulk-delete", json=task_ids[1:]
+    ).raise_for_status()
+    assert hermetic.zcard(jobs_key(USER)) == 0
+
+
+@pytest.mark.performance
+def test_submit_and_poll_latency(
+    client, settings, fake_auth, hermetic, fake_program, program_input
+):
+    fake_program.latency = 0.05
+    inputs = [program_input] * settings.max_batch_inputs
+
+    submit_seconds = _timed(lambda: _submit(client, settings, inputs))
+    assert submit_seconds < SUBMIT_SECONDS
+
+    task_id = _submit(client, settings, inputs)
+    poll_seconds = _timed(lambda: _get_output(client, settings, task_id), repeats=20)
+    assert _get_output(client, settings, task_id).json()["status"] not in READY_STATES
+    assert poll_seconds < POLL_SECONDS
+
+    client.post(f"{settings.api_v2_str}/compute/output/{task_id}/cancel")
+    _wait(client, settings, task_id)
+
+
+@pytest.mark.performance
+def test_output_latency_and_memory(
+    client, settings, fake_auth, hermetic, fake_program, program_input
+):
+    fake_program.stdout_size = 100_000
+    task_id = _submit(client, settings, [program_input] * 50)
+    _wait(client, settings, task_id)
+    result_cache.pop(task_id)
+
+    tracemalloc.start()
+    try:
+        _get_output(client, settings, task_id)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    size = len(_get_output(client, settings, task_id).content)
+    assert size > 50 * 100_000
+    assert peak < OUTPUT_MEMORY_FACTOR * size
+
+    result_cache.pop(task_id)
+    assert _timed(lambda: _get_output(client, settings, task_id)) < OUTPUT_SECONDS
+    cached_seconds = _timed(lambda: _get_output(client, settings, task_id), 20)
+    assert cached_seconds < CACHED_OUTPUT_SECONDS
+
+    client.delete(f"{settings.api_v2_str}/compute/output/{task_id}").raise_for_status()
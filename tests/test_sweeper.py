@@ -0,0 +1,53 @@
+from uuid import uuid4
+
+from bigchem.app import bigchem as bigchem_app
+from celery.result import AsyncResult, GroupResult
+
+from chemcloud_server.routes.helpers import jobs_key, save_dag
+from chemcloud_server.sweeper import sweep_results
+
+
+def _store(program_output, persist=True) -> AsyncResult:
+    result = AsyncResult(str(uuid4()), app=bigchem_app)
+    bigchem_app.backend.store_result(result.id, program_output, "SUCCESS")
+    if persist:
+        bigchem_app.backend.client.persist(
+            bigchem_app.backend.get_key_for_task(result.id)
+        )
+    return result
+
+
+def test_sweep_results_deletes_only_unreferenced_results_without_expiry(
+    program_output,
+):
+    backend = bigchem_app.backend
+    referenced = GroupResult(
+        str(uuid4()), [_store(program_output) for _ in range(2)], app=bigchem_app
+    )
+    referenced.save()
+    save_dag(referenced)
+    orphaned = _store(program_output)
+    expiring = _store(program_output, persist=False)
+
+    report = sweep_results()
+
+    assert report.n_deleted >= 1
+    assert not backend.client.exists(backend.get_key_for_task(orphaned.id))
+    assert backend.client.exists(backend.get_key_for_task(expiring.id))
+    assert backend.client.exists(backend.get_key_for_group(referenced.id))
+    for child in referenced.results:
+        assert backend.client.exists(backend.get_key_for_task(child.id))
+
+
+def test_sweep_results_removes_jobs_without_dag(program_output):
+    client = bigchem_app.backend.client
+    user = f"sweeper-{uuid4()}"
+    kept = AsyncResult(str(uuid4()), app=bigchem_app)
+    save_dag(kept, owner=user)
+    client.zadd(jobs_key(user), {str(uuid4()): 0})
+
+    report = sweep_results()
+
+    assert report.n_jobs_removed >= 1
+    assert client.zrange(jobs_key(user), 0, -1) == [kept.id.encode()]
+    client.delete(kept.id, jobs_key(user))
@@ -0,0 +1,156 @@
+import json
+from threading import Thread
+from types import SimpleNamespace
+from uuid import uuid4
+
+import numpy as np
+from bigchem.app import bigchem as bigchem_app
+from bigchem.config import settings as bigchem_settings
+from celery import signals, states
+from qcio import CalcType, ProgramInput, ProgramOutput, Provenance, SinglePointResults
+from qcop.adapters import GeometricAdapter, registry
+from qcop.exceptions import QCOPBaseError
+from qcop.utils import get_adapter
+
+from chemcloud_server import tasks
+from chemcloud_server.algos import parallel_gradient
+from chemcloud_server.models import TrajectoryStep, UsageMetric
+from chemcloud_server.routes.helpers import get_task_metas, read_trajectory
+from chemcloud_server.tasks import (
+    TrajectoryPublisher,
+    assemble_gradient,
+    compute_batch,
+    stop_key,
+    trajectory_key,
+)
+
+
+def test_trajectory_publisher(program_output, failed_program_output):
+    task_id = str(uuid4())
+    publisher = TrajectoryPublisher(task_id)
+
+    assert publisher.publish(program_output) is False
+    steps, ended = read_trajectory(task_id, 0)
+    assert not ended
+    assert [TrajectoryStep(**json.loads(step)) for step in steps] == [
+        TrajectoryStep(
+            step=0,
+            success=True,
+            geometry=program_output.input_data.structure.geometry.tolist(),
+            energy=program_output.results.energy,
+            gradient=program_output.results.gradient.tolist(),
+        )
+    ]
+
+    # Stop requested by user
+    bigchem_app.backend.client.set(stop_key(task_id), 1)
+    assert publisher.publish(failed_program_output) is True
+    publisher.close()
+
+    steps, ended = read_trajectory(task_id, 1)
+    assert ended
+    step = TrajectoryStep(**json.loads(steps[0]))
+    assert (step.step, step.success, step.energy) == (1, False, None)
+    assert bigchem_app.backend.client.ttl(trajectory_key(task_id)) > 0
+
+
+def test_results_kept_for_result_ttl(settings, monkeypatch):
+    """Workers importing the module keep results as long as their DAGs"""
+    # Not changed by importing the module; the server's backend already exists
+    assert bigchem_app.backend.expires == bigchem_settings.bigchem_result_expires
+    monkeypatch.setitem(
+        bigchem_app.conf, "result_expires", bigchem_app.conf.result_expires
+    )
+
+    signals.worker_init.send(sender=None)
+    expires = []  # Of a backend created afterwards, as worker threads create theirs
+    thread = Thread(target=lambda: expires.append(bigchem_app.backend.expires))
+    thread.start()
+    thread.join()
+    assert expires == [settings.result_ttl]
+
+
+def test_streaming_adapter_not_registered():
+    """qcop.compute keeps using qcop's own geomeTRIC adapter on workers"""
+    assert registry[GeometricAdapter.program] is GeometricAdapter
+    # The adapter qcop.compute("geometric", ...) runs
+    assert type(get_adapter(GeometricAdapter.program)) is GeometricAdapter
+
+
+def test_read_trajectory_ends_with_task():
+    """Tasks that publish no steps end their trajectory when they finish"""
+    task_id = str(uuid4())
+    bigchem_app.backend.store_result(task_id, None, "STARTED")
+    assert read_trajectory(task_id, 0) == ([], False)
+    bigchem_app.backend.store_result(task_id, None, "SUCCESS")
+    assert read_trajectory(task_id, 0) == ([], True)
+
+
+def test_parallel_gradient_assembles_central_differences(program_input):
+    """Numerical gradient of a quadratic energy surface is exact"""
+    prog_input = ProgramInput(
+        **{**program_input.model_dump(), "calctype": CalcType.gradient}
+    )
+    dh = 1e-3
+    signature = parallel_gradient("psi4", prog_input, dh)
+    energy_inputs = [task.args[1] for task in signature.tasks]
+    n_coords = prog_input.structure.geometry.size
+    assert len(energy_inputs) == 2 * n_coords + 1
+    assert {inp.calctype for inp in energy_inputs} == {CalcType.energy}
+
+    def energy(geometry):
+        return float(np.sum(np.arange(geometry.size) * geometry.flatten() ** 2))
+
+    energies = [
+        ProgramOutput[ProgramInput, SinglePointResults](
+            input_data=inp,
+            success=True,
+            results=SinglePointResults(energy=energy(inp.structure.geometry)),
+            provenance=Provenance(program="psi4"),
+        )
+        for inp in energy_inputs
+    ]
+    output = assemble_gradient(energies, dh)
+
+    geometry = prog_input.structure.geometry
+    expected = 2 * np.arange(geometry.size).reshape(geometry.shape) * geometry
+    assert output.input_data.calctype == CalcType.gradient
+    assert output.results.energy == energy(geometry)
+    assert np.allclose(output.results.gradient, expected)
+
+
+def test_compute_batch_stores_each_output(monkeypatch, program_input, program_output):
+    def compute(program, inp_obj, **kwargs):
+        if inp_obj.model.method == "fail":
+            raise QCOPBaseError("Calculation failed")
+        return program_output
+
+    monkeypatch.setattr(tasks, "compute", SimpleNamespace(run=compute))
+    backend = bigchem_app.backend
+    task_ids = [str(uuid4()) for _ in range(4)]
+    failing = ProgramInput(
+        **{**program_input.model_dump(), "model": {"method": "fail"}}
+    )
+    # Cancelled while queued
+    backend.store_result(task_ids[1], None, states.REVOKED)
+    # Interrupted during a previous delivery of the batch
+    backend.store_result(task_ids[3], None, states.STARTED)
+
+    usage = compute_batch.run(
+        "psi4", [program_input, program_input, failing, program_input], task_ids
+    )
+
+    metas = get_task_metas([bigchem_app.AsyncResult(task_id) for task_id in task_ids])
+    assert [meta["status"] for meta in metas] == [
+        states.SUCCESS,
+        states.REVOKED,
+        states.FAILURE,
+        states.SUCCESS,
+    ]
+    assert metas[0]["result"] == program_output
+    assert isinstance(metas[2]["result"], QCOPBaseError)
+    assert all(backend.client.ttl(backend.get_key_for_task(t)) > 0 for t in task_ids)
+    # Skips the cancelled input
+    assert usage[UsageMetric.COMPLETED] == 3
+    assert usage[UsageMetric.FAILED] == 1
+    assert usage[UsageMetric.OUTPUT_BYTES] > 0
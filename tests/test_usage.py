@@ -0,0 +1,106 @@
+from time import perf_counter, sleep, time
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+from bigchem.app import bigchem as bigchem_app
+from celery import states
+from fastapi import status as status_codes
+
+from chemcloud_server.models import UsageMetric
+from chemcloud_server.usage import (
+    _task_started,
+    bucket_start,
+    get_usage,
+    record_task_usage,
+    record_usage,
+)
+from tests.harness import FAKE_PROGRAM
+from tests.utils import json_dumps
+
+USER = "auth0|5fb8828f1bda000075e14b0a"  # Subject of fake_auth's token
+
+
+def test_record_usage(hermetic):
+    metrics = {UsageMetric.SUBMITTED: 2, UsageMetric.INPUT_BYTES: 100.5}
+    record_usage(hermetic, "alice", "rdkit", metrics, queue="q1")
+    record_usage(hermetic, "alice", "rdkit", metrics, queue="q2", worker="w1")
+    record_usage(hermetic, "alice", "xtb", {UsageMetric.SUBMITTED: 1})
+
+    report = get_usage("user", "alice", time() - 1, time())
+    assert report.buckets[0].start == bucket_start(time())
+    assert report.buckets[0].usage == {
+        "rdkit": {UsageMetric.SUBMITTED: 4, UsageMetric.INPUT_BYTES: 201},
+        "xtb": {UsageMetric.SUBMITTED: 1},
+    }
+    usage = get_usage("program", "rdkit", time() - 1, time()).buckets[0].usage
+    assert usage["all"] == report.buckets[0].usage["rdkit"]
+    assert usage["queue:q1"] == usage["queue:q2"] == metrics
+    assert usage["worker:w1"] == metrics
+    assert hermetic.xlen("chemcloud-usage-events") == 3
+
+    assert get_usage("user", "bob", time() - 1, time()).buckets == []
+
+
+def test_task_usage_counts_stored_output_bytes(hermetic, program_output):
+    backend = bigchem_app.backend
+    task_id = str(uuid4())
+    backend.store_result(task_id, program_output, states.SUCCESS)
+    request = SimpleNamespace(
+        chemcloud_user="carol",
+        chemcloud_program="rdkit",
+        delivery_info={"routing_key": "celery"},
+        hostname="w1",
+    )
+    task = SimpleNamespace(request=request, backend=backend, name="compute")
+
+    _task_started(task_id, task)
+    record_task_usage(task_id, task, program_output, states.SUCCESS)
+    recorded = get_usage("user", "carol", time() - 1, time()).buckets[0].usage
+    stored = hermetic.strlen(backend.get_key_for_task(task_id))
+    assert recorded["rdkit"][UsageMetric.OUTPUT_BYTES] == stored
+    assert recorded["rdkit"][UsageMetric.COMPLETED] == 1
+    backend.forget(task_id)
+
+
+def test_usage_of_computations(client, settings, fake_auth, hermetic, program_input):
+    body = json_dumps([program_input] * 3)
+    client.post(
+        f"{settings.api_v2_str}/compute",
+        content=body,
+        params={"program": FAKE_PROGRAM},
+    ).raise_for_status()
+
+    # Workers record a task's usage after storing its result
+    deadline = perf_counter() + 30
+    while True:
+        response = client.get(f"{settings.api_v2_str}/usage")
+        response.raise_for_status()
+        usage = response.json()["buckets"][-1]["usage"][FAKE_PROGRAM]
+        if usage.get("completed", 0) >= 3:
+            break
+        assert perf_counter() < deadline, "Usage of finished tasks not recorded"
+        sleep(0.01)
+
+    assert usage["submitted"] >= 3
+    assert usage["input_bytes"] >= len(body)
+    assert usage["failed"] == 0
+    assert usage["wall_time"] > 0
+    assert usage["output_bytes"] > 0
+
+    response = client.get(f"{settings.api_v2_str}/usage/programs/{FAKE_PROGRAM}")
+    response.raise_for_status()
+    groups = response.json()["buckets"][-1]["usage"]
+    workers = [group for group in groups if group.startswith("worker:")]
+    assert len(workers) == 1
+    assert groups[workers[0]]["completed"] == groups["all"]["completed"]
+    assert groups["queue:celery"]["submitted"] == groups["all"]["submitted"]
+
+    response = client.get(f"{settings.api_v2_str}/usage/users/{USER}")
+    assert response.json()["buckets"][-1]["usage"][FAKE_PROGRAM]["submitted"] >= 3
+
+
+@pytest.mark.parametrize("params", ({"start": 10, "end": 5}, {"start": 0}))
+def test_usage_rejects_invalid_ranges(client, settings, fake_auth, params):
+    response = client.get(f"{settings.api_v2_str}/usage", params=params)
+    assert response.status_code == status_codes.HTTP_422_UNPROCESSABLE_ENTITY
@@ -0,0 +1,233 @@
+import asyncio
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from time import perf_counter, sleep
+
+import httpx
+import pytest
+
+from chemcloud_server.routes.helpers import webhook_key
+from chemcloud_server.webhooks import (
+    RECHECK_LOCK_KEY,
+    SIGNATURE_HEADER,
+    TIMESTAMP_HEADER,
+    callback_allowed,
+    run_webhook_dispatcher,
+    sign,
+    webhook_dispatcher,
+)
+from tests.harness import FAKE_PROGRAM, FakeAdapter
+from tests.utils import _get_result, json_dumps
+
+SECRET = "webhook-secret"  # pragma: allowlist secret
+USER = "auth0|5fb8828f1bda000075e14b0a"  # Subject of fake_auth's token
+
+
+class Receiver(ThreadingHTTPServer):
+    """Local HTTP server recording the notifications POSTed to it.
+
+    Responds with the next of status_codes, then 200.
+    """
+
+    def __init__(self, status_codes: list[int]):
+        self.status_codes = status_codes
+        self.requests: list[tuple[dict[str, str], bytes]] = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(handler):
+                body = handler.rfile.read(int(handler.headers["content-length"]))
+                self.requests.append((dict(handler.headers), body))
+                handler.send_response(
+                    self.status_codes.pop(0) if self.status_codes else 200
+                )
+                handler.end_headers()
+
+            def log_message(handler, *args):
+                pass
+
+        super().__init__(("127.0.0.1", 0), Handler)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}/hooks/"
+
+
+@pytest.fixture
+def receiver():
+    server = Receiver([])
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def webhooks_enabled(monkeypatch, settings, receiver):
+    monkeypatch.setattr(settings, "webhook_secret", SECRET)
+    monkeypatch.setattr(settings, "webhook_allowed_urls", {USER: [receiver.url]})
+    monkeypatch.setattr(webhook_dispatcher, "secret", SECRET)
+    monkeypatch.setattr(webhook_dispatcher, "retry_backoff", 0.01)
+    # Subscriptions are bound to the backend of the test
+    monkeypatch.setattr(webhook_dispatcher, "_pubsub", None)
+
+
+def _run_dispatcher(receiver: Receiver, n: int, timeout: float = 10) -> None:
+    """Run the webhook dispatcher until receiver got n notifications"""
+
+    async def run():
+        dispatcher = asyncio.create_task(
+            run_webhook_dispatcher(
+                webhook_dispatcher, concurrency=2, timeout=1, recheck_interval=60
+            )
+        )
+        deadline = perf_counter() + timeout
+        while len(receiver.requests) < n:
+            assert perf_counter() < deadline, "Notifications were not delivered"
+            await asyncio.sleep(0.01)
+        dispatcher.cancel()
+
+    asyncio.run(run())
+
+
+def test_callback_allowed():
+    allowed = ["https://example.com/hooks/"]
+    assert callback_allowed("https://example.com/hooks/abc?x=1", allowed)
+    assert not callback_allowed("https://example.com/other", allowed)
+    assert not callback_allowed("http://example.com/hooks/", allowed)
+    assert not callback_allowed("https://example.com:8443/hooks/", allowed)
+    assert not callback_allowed("https://example.com.evil.org/hooks/", allowed)
+    assert not callback_allowed("not a url", allowed)
+
+
+def test_compute_rejects_callback_url(
+    monkeypatch, client, settings, fake_auth, program_input
+):
+    url = f"{settings.api_v2_str}/compute"
+    params = {"program": FAKE_PROGRAM, "callback_url": "https://example.com/hooks/"}
+
+    # Webhooks not enabled
+    response = client.post(url, params=params, content=json_dumps(program_input))
+    assert response.status_code == 400
+
+    # Not in the user's allow-list
+    monkeypatch.setattr(settings, "webhook_secret", SECRET)
+    response = client.post(url, params=params, content=json_dumps(program_input))
+    assert response.status_code == 403
+
+
+@pytest.mark.parametrize("n_inputs,include_output", ((1, True), (3, False)))
+def test_webhook_delivered_on_completion(
+    client,
+    settings,
+    fake_auth,
+    hermetic,
+    receiver,
+    webhooks_enabled,
+    program_input,
+    n_inputs,
+    include_output,
+):
+    inputs = program_input if n_inputs == 1 else [program_input] * n_inputs
+    response = client.post(
+        f"{settings.api_v2_str}/compute",
+        params={
+            "program": FAKE_PROGRAM,
+            "callback_url": f"{receiver.url}job",
+            "callback_output": include_output,
+        },
+        content=json_dumps(inputs),
+    )
+    response.raise_for_status()
+    task_id = response.json()
+
+    _run_dispatcher(receiver, 1)
+    [(headers, body)] = receiver.requests
+    timestamp = int(headers[TIMESTAMP_HEADER])
+    assert headers[SIGNATURE_HEADER] == f"sha256={sign(body, SECRET, timestamp)}"
+
+    payload = json.loads(body)
+    assert payload["task_id"] == task_id
+    assert payload["status"] == "SUCCESS"
+    if include_output:
+        output = FakeAdapter().compute(program_input)
+        assert payload["program_output"]["results"]["energy"] == output.results.energy
+        assert payload["progress"] is None
+    else:
+        assert payload["program_output"] is None
+        assert payload["progress"] == {"n_completed": 3, "n_total": 3}
+
+    # Claimed, so not delivered again
+    assert hermetic.get(webhook_key(task_id)) is None
+    webhook_dispatcher.recheck()
+    assert not webhook_dispatcher.claimed
+    assert len(receiver.requests) == 1
+
+
+def test_webhook_delivery_retries(webhooks_enabled, receiver):
+    receiver.status_codes = [503, 500]
+
+    async def deliver():
+        async with httpx.AsyncClient() as client:
+            return await webhook_dispatcher.deliver(client, receiver.url, b"{}")
+
+    assert asyncio.run(deliver())
+    assert len(receiver.requests) == 3
+
+    # Client errors are final
+    receiver.status_codes = [404]
+    receiver.requests.clear()
+    assert not asyncio.run(deliver())
+    assert len(receiver.requests) == 1
+
+
+def test_webhook_queue_bounded_by_bytes(
+    client, settings, fake_auth, hermetic, receiver, webhooks_enabled, program_input
+):
+    response = client.post(
+        f"{settings.api_v2_str}/compute",
+        params={
+            "program": FAKE_PROGRAM,
+            "callback_url": receiver.url,
+            "callback_output": True,
+        },
+        content=json_dumps(program_input),
+    )
+    task_id = response.json()
+    deadline = perf_counter() + 10
+    while _get_result(client, settings, task_id).status != "SUCCESS":
+        assert perf_counter() < deadline, "Task did not finish"
+        sleep(0.01)
+
+    # Queued notifications already hold queue_max_bytes
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(
+            webhook_dispatcher, "queued_bytes", webhook_dispatcher.queue_max_bytes
+        )
+        webhook_dispatcher.check(task_id)
+        assert not webhook_dispatcher.claimed
+        assert hermetic.get(webhook_key(task_id)) is not None  # Left for a later check
+
+    webhook_dispatcher.check(task_id)
+    [(_, body)] = webhook_dispatcher.claimed
+    assert webhook_dispatcher.queued_bytes == len(body)
+    _run_dispatcher(receiver, 1)
+    assert webhook_dispatcher.queued_bytes == 0
+
+
+def test_recheck_lock_shorter_than_a_second(hermetic, webhooks_enabled):
+    async def run() -> int:
+        dispatcher = asyncio.create_task(
+            run_webhook_dispatcher(
+                webhook_dispatcher, concurrency=1, timeout=1, recheck_interval=0.5
+            )
+        )
+        deadline = perf_counter() + 5
+        while (pttl := hermetic.pttl(RECHECK_LOCK_KEY)) < 0:
+            assert perf_counter() < deadline, "Recheck lock was not taken"
+            await asyncio.sleep(0.01)
+        dispatcher.cancel()
+        return pttl
+
+    hermetic.delete(RECHECK_LOCK_KEY)  # Taken by earlier tests
+    assert 0 < asyncio.run(run()) <= 500